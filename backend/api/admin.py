@@ -273,7 +273,10 @@ class ChatbotConversationAdmin(admin.ModelAdmin):
     list_filter = ('status', 'is_qualified', 'chatbot', 'started_at')
     search_fields = ('conversation_id', 'visitor_name', 'visitor_email', 'visitor_phone')
     raw_id_fields = ('chatbot', 'lead', 'assigned_agent')
-    readonly_fields = ('started_at', 'ended_at', 'last_message_at', 'created_at', 'updated_at')
+    readonly_fields = (
+        'started_at', 'ended_at', 'last_message_at', 'archive_segment', 'archive_offset', 'archive_length',
+        'archived_message_count', 'archived_at', 'created_at', 'updated_at'
+    )
 
 
 @admin.register(ChatbotMessage)
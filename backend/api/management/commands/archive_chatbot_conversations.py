@@ -0,0 +1,24 @@
+"""
+Job that moves messages of long-ended chatbot conversations to cold storage
+"""
+from django.core.management.base import BaseCommand
+
+from api.services.chat_archive_service import ARCHIVE_BATCH_SIZE, archive_conversations
+
+
+class Command(BaseCommand):
+    help = 'Archive messages of chatbot conversations ended more than N days ago to compressed segments on media storage'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Defaults to settings.CHATBOT_ARCHIVE_AFTER_DAYS')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='Conversations per segment')
+    
+    def handle(self, *args, **options):
+        totals = {'conversations': 0, 'messages': 0}
+        while True:
+            stats = archive_conversations(days=options['days'], batch_size=options['batch_size'])
+            for name, count in stats.items():
+                totals[name] += count
+            if stats['conversations'] < options['batch_size']:
+                break
+        self.stdout.write(f"Archived {totals['messages']} messages of {totals['conversations']} conversations")
@@ -0,0 +1,30 @@
+"""
+Batch commission computation for closed deals
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.services.commission_service import compute_commissions
+
+
+class Command(BaseCommand):
+    help = 'Compute commissions and splits for closed deals using the commission rules'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', help='First closing date (YYYY-MM-DD)')
+        parser.add_argument('--end-date', help='Last closing date (YYYY-MM-DD)')
+        parser.add_argument('--recalculate', action='store_true', help='Replace existing pending commissions')
+    
+    def handle(self, *args, **options):
+        try:
+            start_date = datetime.strptime(options['start_date'], '%Y-%m-%d').date() if options['start_date'] else None
+            end_date = datetime.strptime(options['end_date'], '%Y-%m-%d').date() if options['end_date'] else None
+        except ValueError:
+            raise CommandError('Dates must be in YYYY-MM-DD format')
+        
+        stats = compute_commissions(start_date=start_date, end_date=end_date, recalculate=options['recalculate'])
+        self.stdout.write(
+            f"Deals: {stats['deals']}, created: {stats['created']}, "
+            f"replaced: {stats['replaced']}, skipped: {stats['skipped']}"
+        )
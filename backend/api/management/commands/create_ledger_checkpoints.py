@@ -0,0 +1,31 @@
+"""
+Snapshot ledger account balances so statements start from a nearby checkpoint
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.services.ledger_service import create_checkpoints
+
+
+class Command(BaseCommand):
+    help = 'Create balance checkpoints for every ledger account'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--as-of',
+            help='Checkpoint date (YYYY-MM-DD), balances include entries before it. Defaults to today.'
+        )
+    
+    def handle(self, *args, **options):
+        if options['as_of']:
+            try:
+                day = datetime.strptime(options['as_of'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('--as-of must be in YYYY-MM-DD format')
+        else:
+            day = datetime.combine(timezone.localdate(), datetime.min.time())
+        
+        created = create_checkpoints(timezone.make_aware(day))
+        self.stdout.write(f"Created {created} ledger checkpoints as of {day.date()}")
@@ -0,0 +1,29 @@
+"""
+Worker that drains the payment gateway event inbox
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.services.payment_service import process_gateway_events, GATEWAY_EVENT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Verify, deduplicate and post pending payment gateway webhook events'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=GATEWAY_EVENT_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new events')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when the inbox is empty')
+    
+    def handle(self, *args, **options):
+        while True:
+            stats = process_gateway_events(batch_size=options['batch_size'])
+            handled = sum(stats.values())
+            if handled:
+                self.stdout.write(', '.join(f"{name}: {count}" for name, count in stats.items() if count))
+            
+            if not options['loop']:
+                break
+            if handled < options['batch_size']:
+                time.sleep(options['interval'])
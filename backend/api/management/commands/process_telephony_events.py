@@ -0,0 +1,29 @@
+"""
+Worker that drains the telephony webhook event inbox
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.services.telephony_service import process_telephony_events, TELEPHONY_EVENT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Apply pending telephony webhook events to call logs'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=TELEPHONY_EVENT_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new events')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when the inbox is empty')
+    
+    def handle(self, *args, **options):
+        while True:
+            stats = process_telephony_events(batch_size=options['batch_size'])
+            handled = sum(stats.values())
+            if handled:
+                self.stdout.write(', '.join(f"{name}: {count}" for name, count in stats.items() if count))
+            
+            if not options['loop']:
+                break
+            if handled < options['batch_size']:
+                time.sleep(options['interval'])
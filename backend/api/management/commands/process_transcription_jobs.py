@@ -0,0 +1,30 @@
+"""
+Worker that transcribes queued call recordings
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.services.transcription_service import process_transcription_jobs, TRANSCRIPTION_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Transcribe queued call recordings and extract keywords, sentiment and summaries'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=TRANSCRIPTION_BATCH_SIZE)
+        parser.add_argument('--concurrency', type=int, default=None, help='Recordings transcribed at once')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new jobs')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep when the queue is empty')
+    
+    def handle(self, *args, **options):
+        while True:
+            stats = process_transcription_jobs(batch_size=options['batch_size'], concurrency=options['concurrency'])
+            handled = sum(stats.values())
+            if handled:
+                self.stdout.write(', '.join(f"{name}: {count}" for name, count in stats.items() if count))
+            
+            if not options['loop']:
+                break
+            if handled < options['batch_size']:
+                time.sleep(options['interval'])
@@ -0,0 +1,16 @@
+"""
+Recompute daily call stats from the call logs table
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.services.call_stats_service import rebuild_call_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild CallDailyStat rows (e.g. after bulk updates that bypass model signals)'
+    
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            written = rebuild_call_stats()
+        self.stdout.write(f"Wrote {written} call stat rows")
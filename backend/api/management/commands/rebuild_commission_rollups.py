@@ -0,0 +1,16 @@
+"""
+Recompute commission monthly rollups from the commissions table
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.services.commission_service import rebuild_commission_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild CommissionMonthlyRollup rows (e.g. after bulk updates that bypass model signals)'
+    
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            written = rebuild_commission_rollups()
+        self.stdout.write(f"Wrote {written} commission rollup rows")
@@ -0,0 +1,26 @@
+"""
+Worker that reconciles the agent load index with the database
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.services.assignment_service import LOAD_INDEX_TIMEOUT, rebuild_load_index
+
+
+class Command(BaseCommand):
+    help = 'Recount open calls, open chats and today\'s leads per agent into the assignment load index'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep reconciling')
+        parser.add_argument('--interval', type=float, default=LOAD_INDEX_TIMEOUT / 5,
+                            help='Seconds between reconciliations')
+    
+    def handle(self, *args, **options):
+        while True:
+            loads = rebuild_load_index()
+            self.stdout.write(f"Reconciled load counters of {len(loads)} agents")
+            
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
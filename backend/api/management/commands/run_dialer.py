@@ -0,0 +1,29 @@
+"""
+Worker that paces running power-dialer campaigns
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.services.dialer_service import run_dialer
+
+
+class Command(BaseCommand):
+    help = 'Place the next calls of running dialer campaigns and record finished calls'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--campaign', type=int, action='append', help='Only run these campaign ids')
+        parser.add_argument('--loop', action='store_true', help='Keep pacing campaigns')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds between pacing steps')
+    
+    def handle(self, *args, **options):
+        while True:
+            for campaign_id, stats in run_dialer(options['campaign']).items():
+                if any(stats.values()):
+                    self.stdout.write(f"Campaign {campaign_id}: " + ', '.join(
+                        f"{name}: {count}" for name, count in stats.items() if count
+                    ))
+            
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_project_invoice_invoice_type_invoice_qr_code_url_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='telephonyconfig',
+            name='provider',
+            field=models.CharField(choices=[('Twilio', 'Twilio'), ('Exotel', 'Exotel'), ('Knowlarity', 'Knowlarity'), ('MyOperator', 'MyOperator'), ('Plivo', 'Plivo'), ('Nexmo', 'Nexmo'), ('Custom', 'Custom')], max_length=50),
+        ),
+        migrations.CreateModel(
+            name='PaymentGatewayEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(choices=[('Razorpay', 'Razorpay'), ('Stripe', 'Stripe')], max_length=50)),
+                ('event_id', models.CharField(max_length=255)),
+                ('event_type', models.CharField(blank=True, max_length=100, null=True)),
+                ('raw_body', models.TextField()),
+                ('signature', models.CharField(blank=True, max_length=500, null=True)),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Processed', 'Processed'), ('Duplicate', 'Duplicate'), ('Ignored', 'Ignored'), ('Failed', 'Failed')], default='Pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('occurred_at', models.DateTimeField(blank=True, null=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='gateway_events', to='api.payment')),
+            ],
+            options={
+                'verbose_name': 'Payment Gateway Event',
+                'verbose_name_plural': 'Payment Gateway Events',
+                'db_table': 'payment_gateway_events',
+                'ordering': ['received_at'],
+                'indexes': [models.Index(fields=['status', 'received_at'], name='payment_gat_status_e9649a_idx')],
+                'unique_together': {('provider', 'event_id')},
+            },
+        ),
+    ]
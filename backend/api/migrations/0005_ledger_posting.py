@@ -0,0 +1,72 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_paymentgatewayevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerAccount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ledger_type', models.CharField(choices=[('Customer', 'Customer Ledger'), ('Unit', 'Unit Ledger'), ('Project', 'Project Ledger')], max_length=50)),
+                ('account_key', models.CharField(max_length=100, unique=True)),
+                ('balance', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Ledger Account',
+                'verbose_name_plural': 'Ledger Accounts',
+                'db_table': 'ledger_accounts',
+            },
+        ),
+        migrations.AddField(
+            model_name='ledger',
+            name='source_id',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ledger',
+            name='source_type',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='ledgeraccount',
+            name='customer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_accounts', to='api.client'),
+        ),
+        migrations.AddField(
+            model_name='ledgeraccount',
+            name='project',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_accounts', to='api.project'),
+        ),
+        migrations.AddField(
+            model_name='ledgeraccount',
+            name='unit',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ledger_accounts', to='api.unit'),
+        ),
+        migrations.AddField(
+            model_name='ledger',
+            name='account',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='entries', to='api.ledgeraccount'),
+        ),
+        migrations.AddIndex(
+            model_name='ledger',
+            index=models.Index(fields=['account', 'transaction_date'], name='ledgers_account_95b461_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ledger',
+            index=models.Index(fields=['source_type', 'source_id'], name='ledgers_source__d6aa08_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='ledger',
+            unique_together={('account', 'source_type', 'source_id', 'transaction_type')},
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import TruncMonth
+
+
+def backfill_rollups(apps, schema_editor):
+    Commission = apps.get_model('api', 'Commission')
+    CommissionMonthlyRollup = apps.get_model('api', 'CommissionMonthlyRollup')
+    rows = Commission.objects.order_by().annotate(
+        month=TruncMonth('created_at', output_field=DateField())
+    ).values('agent_id', 'month', 'status').annotate(
+        commission_count=Count('id'), total_amount=Sum('calculated_amount')
+    )
+    CommissionMonthlyRollup.objects.bulk_create([CommissionMonthlyRollup(**row) for row in rows])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_bankreconciliation_line_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommissionMonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Approved', 'Approved'), ('Paid', 'Paid'), ('Cancelled', 'Cancelled')], max_length=50)),
+                ('commission_count', models.IntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='commission_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Commission Monthly Rollup',
+                'verbose_name_plural': 'Commission Monthly Rollups',
+                'db_table': 'commission_monthly_rollups',
+                'indexes': [models.Index(fields=['month'], name='commission__month_97199d_idx')],
+                'unique_together': {('agent', 'month', 'status')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
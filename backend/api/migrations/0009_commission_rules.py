@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_commission_monthly_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommissionRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('agent_role', models.CharField(blank=True, choices=[('Admin', 'Admin'), ('Sales Manager', 'Sales Manager'), ('Agent', 'Agent'), ('Telecaller', 'Telecaller'), ('Customer Support', 'Customer Support')], max_length=50, null=True)),
+                ('min_deal_value', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('max_deal_value', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('commission_type', models.CharField(choices=[('Fixed', 'Fixed'), ('Percentage', 'Percentage')], default='Percentage', max_length=50)),
+                ('commission_percentage', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('fixed_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('manager_split_percentage', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('priority', models.IntegerField(default=0)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='commission_rules', to='api.project')),
+            ],
+            options={
+                'verbose_name': 'Commission Rule',
+                'verbose_name_plural': 'Commission Rules',
+                'db_table': 'commission_rules',
+                'ordering': ['-priority', 'min_deal_value'],
+            },
+        ),
+    ]
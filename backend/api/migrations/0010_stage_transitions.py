@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:23
+
+from django.conf import settings
+from django.db import migrations, models
+from itertools import islice
+import django.db.models.deletion
+import django.utils.timezone
+
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def backfill_initial_stages(apps, schema_editor):
+    # Earlier history was overwritten; record each record's current stage as of its creation
+    StageTransition = apps.get_model('api', 'StageTransition')
+    for model_name, entity_type, field in (('Deal', 'Deal', 'stage'), ('Lead', 'Lead', 'status')):
+        rows = apps.get_model('api', model_name).objects.order_by().values_list('id', field, 'created_at').iterator(
+            chunk_size=BACKFILL_BATCH_SIZE
+        )
+        # Fixed-size batches keep memory flat however many deals and leads there are
+        while True:
+            batch = list(islice(rows, BACKFILL_BATCH_SIZE))
+            if not batch:
+                break
+            StageTransition.objects.bulk_create([
+                StageTransition(entity_type=entity_type, entity_id=row_id, to_stage=stage, transitioned_at=created_at)
+                for row_id, stage, created_at in batch
+            ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_commission_rules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StageTransition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity_type', models.CharField(choices=[('Deal', 'Deal'), ('Lead', 'Lead')], max_length=20)),
+                ('entity_id', models.BigIntegerField()),
+                ('from_stage', models.CharField(blank=True, max_length=50, null=True)),
+                ('to_stage', models.CharField(max_length=50)),
+                ('transitioned_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('changed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stage_transitions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Stage Transition',
+                'verbose_name_plural': 'Stage Transitions',
+                'db_table': 'stage_transitions',
+                'ordering': ['transitioned_at', 'id'],
+                'indexes': [models.Index(fields=['entity_type', 'entity_id', 'transitioned_at'], name='stage_trans_entity__991beb_idx'), models.Index(fields=['entity_type', 'to_stage', 'transitioned_at'], name='stage_trans_entity__b9e8bd_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_initial_stages, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_roots(apps, schema_editor):
+    Quote = apps.get_model('api', 'Quote')
+    parents = dict(Quote.objects.filter(parent_quote__isnull=False).values_list('id', 'parent_quote_id'))
+    roots = {}
+    for quote_id in parents:
+        chain = []
+        current = quote_id
+        # The visited check guards against a cycle in bad data
+        while current in parents and current not in roots and current not in chain:
+            chain.append(current)
+            current = parents[current]
+        root = roots.get(current, current)
+        for member in chain:
+            roots[member] = root
+    for root, members in _group(roots).items():
+        Quote.objects.filter(pk__in=members).update(root_quote_id=root)
+
+
+def _group(roots):
+    grouped = {}
+    for quote_id, root in roots.items():
+        grouped.setdefault(root, []).append(quote_id)
+    return grouped
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_stage_transitions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quote',
+            name='root_quote',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='family', to='api.quote'),
+        ),
+        migrations.RunPython(backfill_roots, migrations.RunPython.noop),
+    ]
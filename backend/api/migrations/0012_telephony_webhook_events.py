@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_quote_root'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelephonyWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(choices=[('Twilio', 'Twilio'), ('Exotel', 'Exotel'), ('Knowlarity', 'Knowlarity'), ('MyOperator', 'MyOperator'), ('Plivo', 'Plivo'), ('Nexmo', 'Nexmo'), ('Custom', 'Custom')], default='Twilio', max_length=50)),
+                ('event_type', models.CharField(choices=[('Status', 'Status'), ('Recording', 'Recording')], max_length=20)),
+                ('event_key', models.CharField(max_length=255, unique=True)),
+                ('call_sid', models.CharField(blank=True, max_length=255, null=True)),
+                ('payload', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Processed', 'Processed'), ('Ignored', 'Ignored'), ('Failed', 'Failed')], default='Pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Telephony Webhook Event',
+                'verbose_name_plural': 'Telephony Webhook Events',
+                'db_table': 'telephony_webhook_events',
+                'ordering': ['received_at'],
+                'indexes': [models.Index(fields=['status', 'received_at'], name='telephony_w_status_a0d08e_idx')],
+            },
+        ),
+    ]
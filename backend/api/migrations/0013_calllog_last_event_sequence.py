@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_telephony_webhook_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calllog',
+            name='last_event_sequence',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+FINISHED = ('Completed', 'Busy', 'No Answer', 'Failed', 'Cancelled')
+
+
+def backfill_stats(apps, schema_editor):
+    CallLog = apps.get_model('api', 'CallLog')
+    Lead = apps.get_model('api', 'Lead')
+    CallDailyStat = apps.get_model('api', 'CallDailyStat')
+    sources = dict(Lead.objects.values_list('id', 'source'))
+    rows = {}
+    calls = CallLog.objects.filter(status__in=FINISHED).exclude(initiated_at=None).order_by().values_list(
+        'status', 'initiated_at', 'agent_id', 'lead_id', 'direction', 'answered_at', 'duration', 'ring_duration'
+    )
+    for status, initiated_at, agent_id, lead_id, direction, answered_at, duration, ring in calls.iterator(chunk_size=2000):
+        connected = answered_at is not None or (status == 'Completed' and bool(duration))
+        key = (timezone.localtime(initiated_at).date(), agent_id, sources.get(lead_id, ''))
+        row = rows.setdefault(key, [0] * 6)
+        for index, value in enumerate([
+            1, direction == 'Outbound', connected, (duration or 0) if connected else 0, ring or 0, ring is not None,
+        ]):
+            row[index] += value
+    CallDailyStat.objects.bulk_create([
+        CallDailyStat(
+            date=day, agent_id=agent_id, lead_source=lead_source, total_calls=values[0], outbound_calls=values[1],
+            connected_calls=values[2], talk_seconds=values[3], ring_seconds=values[4], ring_samples=values[5],
+        )
+        for (day, agent_id, lead_source), values in rows.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_calllog_last_event_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CallDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('lead_source', models.CharField(blank=True, default='', max_length=100)),
+                ('total_calls', models.IntegerField(default=0)),
+                ('outbound_calls', models.IntegerField(default=0)),
+                ('connected_calls', models.IntegerField(default=0)),
+                ('talk_seconds', models.BigIntegerField(default=0)),
+                ('ring_seconds', models.BigIntegerField(default=0)),
+                ('ring_samples', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('agent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='call_daily_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Call Daily Stat',
+                'verbose_name_plural': 'Call Daily Stats',
+                'db_table': 'call_daily_stats',
+                'indexes': [models.Index(fields=['date'], name='call_daily__date_7ecc4e_idx')],
+                'unique_together': {('date', 'agent', 'lead_source')},
+            },
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_call_daily_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CallTranscriptionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recording_url', models.URLField(max_length=500)),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Running', 'Running'), ('Completed', 'Completed'), ('Failed', 'Failed')], default='Pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('call_log', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='transcription_job', to='api.calllog')),
+            ],
+            options={
+                'verbose_name': 'Call Transcription Job',
+                'verbose_name_plural': 'Call Transcription Jobs',
+                'db_table': 'call_transcription_jobs',
+                'indexes': [models.Index(fields=['status', 'created_at'], name='call_transc_status_af2d9c_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_call_transcription_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DialerCampaign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('Draft', 'Draft'), ('Running', 'Running'), ('Paused', 'Paused'), ('Completed', 'Completed')], default='Draft', max_length=20)),
+                ('lead_filter', models.JSONField(blank=True, default=dict)),
+                ('calls_per_agent', models.PositiveSmallIntegerField(default=1)),
+                ('max_dial_ratio', models.DecimalField(decimal_places=2, default=2, max_digits=4)),
+                ('recontact_hours', models.PositiveIntegerField(default=24)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('agents', models.ManyToManyField(blank=True, related_name='dialer_campaigns', to=settings.AUTH_USER_MODEL)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='created_dialer_campaigns', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Dialer Campaign',
+                'verbose_name_plural': 'Dialer Campaigns',
+                'db_table': 'dialer_campaigns',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DialerCampaignEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Dialing', 'Dialing'), ('Completed', 'Completed'), ('Skipped', 'Skipped'), ('Failed', 'Failed')], default='Pending', max_length=20)),
+                ('outcome', models.CharField(blank=True, choices=[('Initiated', 'Initiated'), ('Ringing', 'Ringing'), ('Answered', 'Answered'), ('Completed', 'Completed'), ('Failed', 'Failed'), ('Busy', 'Busy'), ('No Answer', 'No Answer'), ('Cancelled', 'Cancelled')], max_length=20, null=True)),
+                ('answered', models.BooleanField(default=False)),
+                ('note', models.CharField(blank=True, max_length=255, null=True)),
+                ('dialed_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('agent', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='dialer_entries', to=settings.AUTH_USER_MODEL)),
+                ('call_log', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='dialer_entry', to='api.calllog')),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='api.dialercampaign')),
+                ('lead', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dialer_entries', to='api.lead')),
+            ],
+            options={
+                'verbose_name': 'Dialer Campaign Entry',
+                'verbose_name_plural': 'Dialer Campaign Entries',
+                'db_table': 'dialer_campaign_entries',
+                'indexes': [models.Index(fields=['campaign', 'status'], name='dialer_camp_campaig_f48a5c_idx')],
+                'unique_together': {('campaign', 'lead')},
+            },
+        ),
+    ]
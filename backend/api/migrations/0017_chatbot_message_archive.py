@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_dialer_campaigns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatbotconversation',
+            name='archive_length',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatbotconversation',
+            name='archive_offset',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatbotconversation',
+            name='archive_segment',
+            field=models.CharField(blank=True, max_length=500, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatbotconversation',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatbotconversation',
+            name='archived_message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='chatbotconversation',
+            index=models.Index(fields=['archived_at', 'last_message_at'], name='chatbot_con_archive_2a31cf_idx'),
+        ),
+    ]
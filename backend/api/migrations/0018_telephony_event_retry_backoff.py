@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_chatbot_message_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='telephonywebhookevent',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:25
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+COUNTERS = ('total_calls', 'outbound_calls', 'connected_calls', 'talk_seconds', 'ring_seconds', 'ring_samples')
+
+
+def merge_duplicate_rows(apps, schema_editor):
+    """Fold rows for calls without an agent that concurrent rollups created twice into one"""
+    CallDailyStat = apps.get_model('api', 'CallDailyStat')
+    without_agent = CallDailyStat.objects.filter(agent__isnull=True).order_by()
+    duplicates = without_agent.values('date', 'lead_source').annotate(rows=Count('id')).filter(rows__gt=1)
+    for group in duplicates.iterator():
+        rows = without_agent.filter(date=group['date'], lead_source=group['lead_source'])
+        totals = rows.aggregate(**{counter: Sum(counter) for counter in COUNTERS})
+        keep = rows.order_by('id').first()
+        rows.exclude(pk=keep.pk).delete()
+        CallDailyStat.objects.filter(pk=keep.pk).update(**totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_unique_payment_transaction_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='calldailystat',
+            constraint=models.UniqueConstraint(condition=models.Q(('agent__isnull', True)), fields=('date', 'lead_source'), name='unique_call_daily_stat_without_agent'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.db.models import Sum
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 
 
 class Agent(AbstractUser):
@@ -417,6 +418,34 @@ class Deal(models.Model):
         ordering = ['-created_at']
 
 
+class StageTransition(models.Model):
+    """Stage Transition - append-only history of deal stage and lead status changes"""
+    
+    class EntityType(models.TextChoices):
+        DEAL = 'Deal', 'Deal'
+        LEAD = 'Lead', 'Lead'
+    
+    entity_type = models.CharField(max_length=20, choices=EntityType.choices)
+    entity_id = models.BigIntegerField()  # Deal or Lead id, kept after the record is deleted
+    from_stage = models.CharField(max_length=50, blank=True, null=True)  # Empty for the initial stage
+    to_stage = models.CharField(max_length=50)
+    changed_by = models.ForeignKey(Agent, on_delete=models.SET_NULL, null=True, blank=True, related_name='stage_transitions')
+    transitioned_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.entity_type} #{self.entity_id}: {self.from_stage} -> {self.to_stage}"
+    
+    class Meta:
+        db_table = 'stage_transitions'
+        verbose_name = 'Stage Transition'
+        verbose_name_plural = 'Stage Transitions'
+        ordering = ['transitioned_at', 'id']
+        indexes = [
+            models.Index(fields=['entity_type', 'entity_id', 'transitioned_at']),
+            models.Index(fields=['entity_type', 'to_stage', 'transitioned_at']),
+        ]
+
+
 # ==================== INVOICE MANAGEMENT ====================
 
 class PaymentPlan(models.Model):
@@ -548,6 +577,14 @@ class Payment(models.Model):
         verbose_name = 'Payment'
         verbose_name_plural = 'Payments'
         ordering = ['-payment_date']
+        constraints = [
+            # A gateway capture is posted once, however many events report it
+            models.UniqueConstraint(
+                fields=['transaction_id'],
+                condition=models.Q(transaction_id__isnull=False) & ~models.Q(transaction_id=''),
+                name='unique_payment_transaction_id',
+            ),
+        ]
 
 
 class Installment(models.Model):
@@ -629,6 +666,7 @@ class Quote(models.Model):
     notes = models.TextField(blank=True, null=True)
     version = models.PositiveIntegerField(default=1)
     parent_quote = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='versions')
+    root_quote = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='family')  # First quote of the version chain, empty for the root itself
     created_by = models.ForeignKey(Agent, on_delete=models.SET_NULL, null=True, blank=True, related_name='created_quotes')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -682,6 +720,32 @@ class Commission(models.Model):
         ordering = ['-created_at']
 
 
+class CommissionRule(models.Model):
+    """Commission Rule - rate for an agent role, project and deal value slab"""
+    name = models.CharField(max_length=255)
+    agent_role = models.CharField(max_length=50, choices=Agent.Role.choices, blank=True, null=True)  # Empty = any role
+    project = models.ForeignKey('Project', on_delete=models.CASCADE, null=True, blank=True, related_name='commission_rules')  # Empty = any project
+    min_deal_value = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    max_deal_value = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)  # Exclusive, empty = no upper bound
+    commission_type = models.CharField(max_length=50, choices=Commission.Type.choices, default=Commission.Type.PERCENTAGE)
+    commission_percentage = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    fixed_amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    manager_split_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=0)  # Share allocated to the agent's manager
+    priority = models.IntegerField(default=0)  # Higher wins when several rules match
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return self.name
+    
+    class Meta:
+        db_table = 'commission_rules'
+        verbose_name = 'Commission Rule'
+        verbose_name_plural = 'Commission Rules'
+        ordering = ['-priority', 'min_deal_value']
+
+
 class CommissionSplit(models.Model):
     """Commission Split Model for multiple agents sharing commission"""
     
@@ -701,6 +765,28 @@ class CommissionSplit(models.Model):
         verbose_name_plural = 'Commission Splits'
 
 
+class CommissionMonthlyRollup(models.Model):
+    """Commission totals per agent, month and status - kept in step with Commission changes"""
+    agent = models.ForeignKey(Agent, on_delete=models.CASCADE, related_name='commission_rollups')
+    month = models.DateField()  # First day of the month the commission was created in
+    status = models.CharField(max_length=50, choices=Commission.Status.choices)
+    commission_count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.agent.name} - {self.month:%Y-%m} - {self.status}"
+    
+    class Meta:
+        db_table = 'commission_monthly_rollups'
+        verbose_name = 'Commission Monthly Rollup'
+        verbose_name_plural = 'Commission Monthly Rollups'
+        unique_together = ['agent', 'month', 'status']
+        indexes = [
+            models.Index(fields=['month']),
+        ]
+
+
 # ==================== CUSTOMER PORTAL ====================
 
 class CustomerPortalUser(models.Model):
@@ -1015,6 +1101,7 @@ class CallLog(models.Model):
     # Telephony provider info
     provider = models.CharField(max_length=50, blank=True, null=True)  # twilio, etc.
     provider_data = models.JSONField(default=dict, blank=True)  # Store provider-specific data
+    last_event_sequence = models.PositiveIntegerField(null=True, blank=True)  # Provider sequence number of the last applied status callback
     
     # Cost tracking
     cost = models.DecimalField(max_digits=10, decimal_places=4, null=True, blank=True)
@@ -1056,6 +1143,39 @@ class CallLog(models.Model):
         ]
 
 
+class CallDailyStat(models.Model):
+    """Finished-call totals per day, agent and lead source - kept in step with CallLog changes"""
+    date = models.DateField()  # Local date the call was initiated
+    agent = models.ForeignKey(Agent, on_delete=models.CASCADE, null=True, blank=True, related_name='call_daily_stats')
+    lead_source = models.CharField(max_length=100, blank=True, default='')  # Empty for calls without a lead
+    total_calls = models.IntegerField(default=0)
+    outbound_calls = models.IntegerField(default=0)
+    connected_calls = models.IntegerField(default=0)
+    talk_seconds = models.BigIntegerField(default=0)
+    ring_seconds = models.BigIntegerField(default=0)
+    ring_samples = models.IntegerField(default=0)  # Calls with a known ring duration
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.date} - {self.agent_id} - {self.lead_source or 'No lead'}"
+    
+    class Meta:
+        db_table = 'call_daily_stats'
+        verbose_name = 'Call Daily Stat'
+        verbose_name_plural = 'Call Daily Stats'
+        unique_together = ['date', 'agent', 'lead_source']
+        constraints = [
+            # NULLs never collide in a unique index, so calls without an agent need their own constraint
+            models.UniqueConstraint(
+                fields=['date', 'lead_source'], condition=models.Q(agent__isnull=True),
+                name='unique_call_daily_stat_without_agent',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+
+
 class TelephonyConfig(models.Model):
     """Telephony Provider Configuration"""
     
@@ -1108,6 +1228,140 @@ class TelephonyConfig(models.Model):
         verbose_name_plural = 'Telephony Configs'
 
 
+class TelephonyWebhookEvent(models.Model):
+    """Telephony Webhook Event Inbox - raw provider callbacks, applied to call logs by a worker"""
+    
+    class EventType(models.TextChoices):
+        STATUS = 'Status', 'Status'
+        RECORDING = 'Recording', 'Recording'
+    
+    class Status(models.TextChoices):
+        PENDING = 'Pending', 'Pending'
+        PROCESSED = 'Processed', 'Processed'
+        IGNORED = 'Ignored', 'Ignored'
+        FAILED = 'Failed', 'Failed'
+    
+    provider = models.CharField(max_length=50, choices=TelephonyConfig.Provider.choices, default=TelephonyConfig.Provider.TWILIO)
+    event_type = models.CharField(max_length=20, choices=EventType.choices)
+    event_key = models.CharField(max_length=255, unique=True)  # Collapses provider retries of the same callback
+    call_sid = models.CharField(max_length=255, blank=True, null=True)
+    payload = models.JSONField(default=dict)  # Callback parameters as received
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)  # Failed events wait until then for a retry
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.provider} {self.event_type} {self.call_sid} - {self.status}"
+    
+    class Meta:
+        db_table = 'telephony_webhook_events'
+        verbose_name = 'Telephony Webhook Event'
+        verbose_name_plural = 'Telephony Webhook Events'
+        ordering = ['received_at']
+        indexes = [
+            models.Index(fields=['status', 'received_at']),
+        ]
+
+
+class CallTranscriptionJob(models.Model):
+    """Call Transcription Job - a recording waiting to be transcribed and analysed by the transcription worker"""
+    
+    class Status(models.TextChoices):
+        PENDING = 'Pending', 'Pending'
+        RUNNING = 'Running', 'Running'
+        COMPLETED = 'Completed', 'Completed'
+        FAILED = 'Failed', 'Failed'
+    
+    call_log = models.OneToOneField(CallLog, on_delete=models.CASCADE, related_name='transcription_job')
+    recording_url = models.URLField(max_length=500)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Transcription of call {self.call_log_id} - {self.status}"
+    
+    class Meta:
+        db_table = 'call_transcription_jobs'
+        verbose_name = 'Call Transcription Job'
+        verbose_name_plural = 'Call Transcription Jobs'
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+
+class DialerCampaign(models.Model):
+    """Power-dialer Campaign - dials a filtered set of leads for a pool of agents"""
+    
+    class Status(models.TextChoices):
+        DRAFT = 'Draft', 'Draft'
+        RUNNING = 'Running', 'Running'
+        PAUSED = 'Paused', 'Paused'
+        COMPLETED = 'Completed', 'Completed'
+    
+    name = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.DRAFT)
+    lead_filter = models.JSONField(default=dict, blank=True)  # e.g. {"status": "New", "source": "Website"}
+    agents = models.ManyToManyField(Agent, blank=True, related_name='dialer_campaigns')  # Empty = each lead's own agent
+    calls_per_agent = models.PositiveSmallIntegerField(default=1)  # Calls in flight per agent at a 1:1 dial ratio
+    max_dial_ratio = models.DecimalField(max_digits=4, decimal_places=2, default=2)  # Upper bound of calls per agent slot when answer rates are low
+    recontact_hours = models.PositiveIntegerField(default=24)  # Skip leads called within this many hours
+    created_by = models.ForeignKey(Agent, on_delete=models.SET_NULL, null=True, blank=True, related_name='created_dialer_campaigns')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.name} - {self.status}"
+    
+    class Meta:
+        db_table = 'dialer_campaigns'
+        verbose_name = 'Dialer Campaign'
+        verbose_name_plural = 'Dialer Campaigns'
+        ordering = ['-created_at']
+
+
+class DialerCampaignEntry(models.Model):
+    """Dialer Campaign Entry - one lead to dial in a campaign and the outcome of its call"""
+    
+    class Status(models.TextChoices):
+        PENDING = 'Pending', 'Pending'
+        DIALING = 'Dialing', 'Dialing'
+        COMPLETED = 'Completed', 'Completed'
+        SKIPPED = 'Skipped', 'Skipped'
+        FAILED = 'Failed', 'Failed'
+    
+    campaign = models.ForeignKey(DialerCampaign, on_delete=models.CASCADE, related_name='entries')
+    lead = models.ForeignKey(Lead, on_delete=models.CASCADE, related_name='dialer_entries')
+    agent = models.ForeignKey(Agent, on_delete=models.SET_NULL, null=True, blank=True, related_name='dialer_entries')
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    call_log = models.OneToOneField(CallLog, on_delete=models.SET_NULL, null=True, blank=True, related_name='dialer_entry')
+    outcome = models.CharField(max_length=20, choices=CallLog.Status.choices, blank=True, null=True)
+    answered = models.BooleanField(default=False)
+    note = models.CharField(max_length=255, blank=True, null=True)  # Skip reason or dialing error
+    dialed_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.campaign_id} - {self.lead_id} - {self.status}"
+    
+    class Meta:
+        db_table = 'dialer_campaign_entries'
+        verbose_name = 'Dialer Campaign Entry'
+        verbose_name_plural = 'Dialer Campaign Entries'
+        unique_together = ['campaign', 'lead']
+        indexes = [
+            models.Index(fields=['campaign', 'status']),
+        ]
+
+
 # ==================== CHATBOT INTEGRATION ====================
 
 class Chatbot(models.Model):
@@ -1205,13 +1459,20 @@ class ChatbotConversation(models.Model):
     # Metadata
     metadata = models.JSONField(default=dict, blank=True)
     
+    # Cold storage: messages moved to a gzip member of a JSON-lines segment on media storage
+    archive_segment = models.CharField(max_length=500, blank=True, null=True)
+    archive_offset = models.BigIntegerField(null=True, blank=True)
+    archive_length = models.PositiveIntegerField(null=True, blank=True)
+    archived_message_count = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(null=True, blank=True)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     @property
     def message_count(self):
-        """Get total message count"""
-        return self.messages.count()
+        """Get total message count, archived messages included"""
+        return self.messages.count() + self.archived_message_count
     
     @property
     def duration(self):
@@ -1233,6 +1494,7 @@ class ChatbotConversation(models.Model):
             models.Index(fields=['chatbot', '-started_at']),
             models.Index(fields=['lead', '-started_at']),
             models.Index(fields=['visitor_email', '-started_at']),
+            models.Index(fields=['archived_at', 'last_message_at']),
         ]
 
 
@@ -1631,6 +1893,9 @@ class Ledger(models.Model):
     debit = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     credit = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     balance = models.DecimalField(max_digits=12, decimal_places=2)
+    account = models.ForeignKey('LedgerAccount', on_delete=models.PROTECT, null=True, blank=True, related_name='entries')
+    source_type = models.CharField(max_length=50, blank=True, null=True)  # Payment, BookingPayment, Refund, CreditNote
+    source_id = models.PositiveBigIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -1638,6 +1903,50 @@ class Ledger(models.Model):
         verbose_name = 'Ledger Entry'
         verbose_name_plural = 'Ledger Entries'
         ordering = ['-transaction_date']
+        unique_together = ['account', 'source_type', 'source_id', 'transaction_type']
+        indexes = [
+            models.Index(fields=['account', 'transaction_date']),
+            models.Index(fields=['source_type', 'source_id']),
+        ]
+
+
+class LedgerAccount(models.Model):
+    """Ledger Account - one per customer, unit and project, holds the running balance"""
+    
+    ledger_type = models.CharField(max_length=50, choices=Ledger.LedgerType.choices)
+    account_key = models.CharField(max_length=100, unique=True)  # e.g. "Customer:12"
+    customer = models.ForeignKey(Client, on_delete=models.CASCADE, null=True, blank=True, related_name='ledger_accounts')
+    unit = models.ForeignKey(Unit, on_delete=models.CASCADE, null=True, blank=True, related_name='ledger_accounts')
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, null=True, blank=True, related_name='ledger_accounts')
+    balance = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # Debit minus credit
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.account_key} - {self.balance}"
+    
+    class Meta:
+        db_table = 'ledger_accounts'
+        verbose_name = 'Ledger Account'
+        verbose_name_plural = 'Ledger Accounts'
+
+
+class LedgerCheckpoint(models.Model):
+    """Ledger Checkpoint - account balance of all entries dated before as_of"""
+    account = models.ForeignKey(LedgerAccount, on_delete=models.CASCADE, related_name='checkpoints')
+    as_of = models.DateTimeField()
+    balance = models.DecimalField(max_digits=14, decimal_places=2)  # Debit minus credit
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.account.account_key} @ {self.as_of} - {self.balance}"
+    
+    class Meta:
+        db_table = 'ledger_checkpoints'
+        verbose_name = 'Ledger Checkpoint'
+        verbose_name_plural = 'Ledger Checkpoints'
+        unique_together = ['account', 'as_of']
+        ordering = ['-as_of']
 
 
 # ==================== REFUNDS & ADJUSTMENTS ====================
@@ -1717,6 +2026,7 @@ class BankReconciliation(models.Model):
     reference_number = models.CharField(max_length=255, blank=True, null=True)
     utr_number = models.CharField(max_length=100, blank=True, null=True)
     description = models.TextField(blank=True, null=True)
+    line_fingerprint = models.CharField(max_length=64, unique=True, blank=True, null=True)  # Set on statement import, used to skip re-imported lines
     status = models.CharField(max_length=50, choices=Status.choices, default=Status.PENDING)
     matched_payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, null=True, blank=True, related_name='bank_reconciliations')
     matched_booking = models.ForeignKey(BookingPayment, on_delete=models.SET_NULL, null=True, blank=True, related_name='bank_reconciliations')
@@ -1728,4 +2038,46 @@ class BankReconciliation(models.Model):
         db_table = 'bank_reconciliations'
         verbose_name = 'Bank Reconciliation'
         verbose_name_plural = 'Bank Reconciliations'
-        ordering = ['-transaction_date']
\ No newline at end of file
+        ordering = ['-transaction_date']
+
+# ==================== PAYMENT GATEWAY WEBHOOKS ====================
+
+class PaymentGatewayEvent(models.Model):
+    """Payment Gateway Event Inbox - raw webhook events, posted to payments by a worker"""
+    
+    class Provider(models.TextChoices):
+        RAZORPAY = 'Razorpay', 'Razorpay'
+        STRIPE = 'Stripe', 'Stripe'
+    
+    class Status(models.TextChoices):
+        PENDING = 'Pending', 'Pending'
+        PROCESSED = 'Processed', 'Processed'
+        DUPLICATE = 'Duplicate', 'Duplicate'
+        IGNORED = 'Ignored', 'Ignored'
+        FAILED = 'Failed', 'Failed'
+    
+    provider = models.CharField(max_length=50, choices=Provider.choices)
+    event_id = models.CharField(max_length=255)  # Provider event ID (or body hash if none supplied)
+    event_type = models.CharField(max_length=100, blank=True, null=True)
+    raw_body = models.TextField()  # Exact request body, needed for signature verification
+    signature = models.CharField(max_length=500, blank=True, null=True)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    occurred_at = models.DateTimeField(null=True, blank=True)  # Event time reported by the provider
+    payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, null=True, blank=True, related_name='gateway_events')
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.provider} event {self.event_id} - {self.status}"
+    
+    class Meta:
+        db_table = 'payment_gateway_events'
+        verbose_name = 'Payment Gateway Event'
+        verbose_name_plural = 'Payment Gateway Events'
+        unique_together = ['provider', 'event_id']
+        ordering = ['received_at']
+        indexes = [
+            models.Index(fields=['status', 'received_at']),
+        ]
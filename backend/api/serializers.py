@@ -3,11 +3,11 @@ from django.contrib.auth.password_validation import validate_password
 from .models import (
     Agent, Property, Lead, Activity, Task, Client,
     AttendanceRecord, WhatsAppTemplate, AutomationRule, Notification,
-    Deal, Invoice, Payment, PaymentPlan, Installment, Quote,
-    Commission, CommissionSplit, CustomerPortalUser, Document, FileAccessLog,
+    Deal, StageTransition, Invoice, Payment, PaymentPlan, Installment, Quote,
+    Commission, CommissionSplit, CommissionRule, CustomerPortalUser, Document, FileAccessLog,
     IntegrationConfig, InvoiceTemplate, QuoteTemplate, EmailTemplate,
     AgreementTemplate, WorkflowRule, WorkflowAction,
-    CallLog, TelephonyConfig, Chatbot, ChatbotConversation, ChatbotMessage, ChatbotQualificationRule,
+    CallLog, TelephonyConfig, DialerCampaign, DialerCampaignEntry, Chatbot, ChatbotConversation, ChatbotMessage, ChatbotQualificationRule,
     Project, Tower, Floor, Unit, BookingPayment, Receipt, GSTConfiguration, TaxBreakdown,
     PaymentSchedule, PaymentMilestone, Ledger, Refund, CreditNote, BankReconciliation
 )
@@ -320,6 +320,19 @@ class DealSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'created_at', 'updated_at')
 
 
+
+class StageTransitionSerializer(serializers.ModelSerializer):
+    """Serializer for StageTransition model"""
+    changed_by_name = serializers.CharField(source='changed_by.name', read_only=True, allow_null=True)
+    
+    class Meta:
+        model = StageTransition
+        fields = (
+            'id', 'entity_type', 'entity_id', 'from_stage', 'to_stage',
+            'changed_by', 'changed_by_name', 'transitioned_at'
+        )
+        read_only_fields = fields
+
 # ==================== INVOICE SERIALIZERS ====================
 
 class PaymentPlanSerializer(serializers.ModelSerializer):
@@ -356,6 +369,14 @@ class PaymentSerializer(serializers.ModelSerializer):
             'created_by', 'created_by_name', 'created_at'
         )
         read_only_fields = ('id', 'created_at')
+    
+    def validate_transaction_id(self, value):
+        payments = Payment.objects.filter(transaction_id=value)
+        if self.instance:
+            payments = payments.exclude(pk=self.instance.pk)
+        if value and payments.exists():
+            raise serializers.ValidationError('A payment with this transaction ID already exists')
+        return value
 
 
 class InvoiceSerializer(serializers.ModelSerializer):
@@ -433,10 +454,10 @@ class QuoteSerializer(serializers.ModelSerializer):
             'payment_schedule', 'client_approval_status', 'client_approval_date',
             'manager_approval_status', 'manager_approval_date', 'manager', 'manager_name',
             'converted_to_deal', 'pdf_url', 'email_sent', 'email_sent_at',
-            'notes', 'version', 'parent_quote', 'created_by', 'created_by_name',
+            'notes', 'version', 'parent_quote', 'root_quote', 'created_by', 'created_by_name',
             'created_at', 'updated_at', 'documents'
         )
-        read_only_fields = ('id', 'created_at', 'updated_at')
+        read_only_fields = ('id', 'root_quote', 'created_at', 'updated_at')
     
     def get_documents(self, obj):
         return [{'id': doc.id, 'name': doc.name, 'type': doc.type, 'file_url': doc.file_url}
@@ -483,6 +504,28 @@ class CommissionSerializer(serializers.ModelSerializer):
         }
 
 
+class CommissionRuleSerializer(serializers.ModelSerializer):
+    """Serializer for CommissionRule model"""
+    project_name = serializers.CharField(source='project.name', read_only=True, allow_null=True)
+    
+    class Meta:
+        model = CommissionRule
+        fields = (
+            'id', 'name', 'agent_role', 'project', 'project_name', 'min_deal_value', 'max_deal_value',
+            'commission_type', 'commission_percentage', 'fixed_amount', 'manager_split_percentage',
+            'priority', 'is_active', 'created_at', 'updated_at'
+        )
+        read_only_fields = ('id', 'created_at', 'updated_at')
+    
+    def validate(self, data):
+        commission_type = data.get('commission_type', getattr(self.instance, 'commission_type', Commission.Type.PERCENTAGE))
+        if commission_type == Commission.Type.PERCENTAGE and data.get('commission_percentage', getattr(self.instance, 'commission_percentage', None)) is None:
+            raise serializers.ValidationError({'commission_percentage': 'Required for percentage rules'})
+        if commission_type == Commission.Type.FIXED and data.get('fixed_amount', getattr(self.instance, 'fixed_amount', None)) is None:
+            raise serializers.ValidationError({'fixed_amount': 'Required for fixed rules'})
+        return data
+
+
 # ==================== CUSTOMER PORTAL SERIALIZERS ====================
 
 class CustomerPortalUserSerializer(serializers.ModelSerializer):
@@ -651,6 +694,49 @@ class TelephonyConfigSerializer(serializers.ModelSerializer):
         }
 
 
+class DialerCampaignSerializer(serializers.ModelSerializer):
+    """Serializer for DialerCampaign model"""
+    created_by_name = serializers.CharField(source='created_by.name', read_only=True, allow_null=True)
+    
+    class Meta:
+        model = DialerCampaign
+        fields = (
+            'id', 'name', 'status', 'lead_filter', 'agents', 'calls_per_agent', 'max_dial_ratio',
+            'recontact_hours', 'created_by', 'created_by_name', 'created_at', 'updated_at',
+            'started_at', 'completed_at'
+        )
+        read_only_fields = ('id', 'status', 'created_by', 'created_at', 'updated_at', 'started_at', 'completed_at')
+    
+    def validate_lead_filter(self, value):
+        from .services.dialer_service import LEAD_FILTERS
+        
+        if not isinstance(value, dict):
+            raise serializers.ValidationError('Must be an object')
+        unknown = set(value) - LEAD_FILTERS.keys()
+        if unknown:
+            raise serializers.ValidationError(f"Unknown filters: {', '.join(sorted(unknown))}")
+        return value
+    
+    def validate_max_dial_ratio(self, value):
+        if value < 1:
+            raise serializers.ValidationError('Must be at least 1')
+        return value
+
+
+class DialerCampaignEntrySerializer(serializers.ModelSerializer):
+    """Serializer for DialerCampaignEntry model"""
+    lead_name = serializers.CharField(source='lead.name', read_only=True)
+    agent_name = serializers.CharField(source='agent.name', read_only=True, allow_null=True)
+    
+    class Meta:
+        model = DialerCampaignEntry
+        fields = (
+            'id', 'campaign', 'lead', 'lead_name', 'agent', 'agent_name', 'status', 'call_log',
+            'outcome', 'answered', 'note', 'dialed_at', 'finished_at'
+        )
+        read_only_fields = fields
+
+
 # ==================== CHATBOT SERIALIZERS ====================
 
 class ChatbotQualificationRuleSerializer(serializers.ModelSerializer):
@@ -683,7 +769,7 @@ class ChatbotConversationSerializer(serializers.ModelSerializer):
     chatbot_name = serializers.CharField(source='chatbot.name', read_only=True)
     lead_name = serializers.CharField(source='lead.name', read_only=True, allow_null=True)
     assigned_agent_name = serializers.CharField(source='assigned_agent.name', read_only=True, allow_null=True)
-    messages = ChatbotMessageSerializer(many=True, read_only=True)
+    messages = serializers.SerializerMethodField()
     message_count = serializers.ReadOnlyField()
     duration = serializers.ReadOnlyField()
     
@@ -695,16 +781,48 @@ class ChatbotConversationSerializer(serializers.ModelSerializer):
             'visitor_ip', 'user_agent', 'status', 'started_at', 'ended_at',
             'last_message_at', 'qualification_data', 'qualification_score',
             'is_qualified', 'assigned_agent', 'assigned_agent_name', 'assigned_at',
-            'metadata', 'messages', 'message_count', 'duration',
+            'metadata', 'messages', 'message_count', 'duration', 'archived_at',
             'created_at', 'updated_at'
         )
-        read_only_fields = ('id', 'created_at', 'updated_at', 'message_count', 'duration')
+        read_only_fields = ('id', 'created_at', 'updated_at', 'message_count', 'duration', 'archived_at')
+    
+    def get_messages(self, obj):
+        """Full transcript, rehydrating archived messages from cold storage"""
+        from .services.chat_archive_service import get_conversation_messages
+        
+        return ChatbotMessageSerializer(get_conversation_messages(obj), many=True).data
+
+
+class ChatbotConversationListSerializer(serializers.ModelSerializer):
+    """Slim serializer for conversation lists: annotated message count and last message preview, no transcript"""
+    chatbot_name = serializers.CharField(source='chatbot.name', read_only=True)
+    lead_name = serializers.CharField(source='lead.name', read_only=True, allow_null=True)
+    assigned_agent_name = serializers.CharField(source='assigned_agent.name', read_only=True, allow_null=True)
+    message_count = serializers.IntegerField(source='messages_total', read_only=True)
+    last_message_preview = serializers.CharField(read_only=True, allow_null=True)
+    last_message_type = serializers.CharField(read_only=True, allow_null=True)
+    duration = serializers.ReadOnlyField()
+    
+    class Meta:
+        model = ChatbotConversation
+        fields = (
+            'id', 'conversation_id', 'chatbot', 'chatbot_name', 'lead', 'lead_name',
+            'visitor_id', 'visitor_name', 'visitor_email', 'visitor_phone',
+            'status', 'started_at', 'ended_at', 'last_message_at', 'qualification_score',
+            'is_qualified', 'assigned_agent', 'assigned_agent_name', 'assigned_at',
+            'message_count', 'last_message_preview', 'last_message_type', 'duration',
+            'archived_at', 'created_at', 'updated_at'
+        )
+        read_only_fields = fields
 
 
 class ChatbotSerializer(serializers.ModelSerializer):
     """Serializer for Chatbot model"""
     qualification_rules = ChatbotQualificationRuleSerializer(many=True, read_only=True)
     conversations_count = serializers.SerializerMethodField()
+    qualified_count = serializers.SerializerMethodField()
+    converted_count = serializers.SerializerMethodField()
+    active_today_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Chatbot
@@ -713,18 +831,38 @@ class ChatbotSerializer(serializers.ModelSerializer):
             'project_id', 'agent_id', 'welcome_message', 'fallback_message',
             'qualification_enabled', 'auto_create_lead', 'auto_assign_agent',
             'qualification_questions', 'website_url', 'widget_code',
-            'config', 'qualification_rules', 'conversations_count',
-            'created_at', 'updated_at'
+            'config', 'qualification_rules', 'conversations_count', 'qualified_count',
+            'converted_count', 'active_today_count', 'created_at', 'updated_at'
+        )
+        read_only_fields = (
+            'id', 'created_at', 'updated_at', 'conversations_count', 'qualified_count',
+            'converted_count', 'active_today_count'
         )
-        read_only_fields = ('id', 'created_at', 'updated_at', 'conversations_count')
         extra_kwargs = {
             'api_key': {'write_only': True},
             'api_secret': {'write_only': True},
         }
     
+    def _counters(self, obj):
+        """Conversation counters, annotated by the viewset or counted once per bot"""
+        from .services.chatbot_service import get_conversation_counters
+        
+        if not hasattr(obj, '_conversation_counters'):
+            obj._conversation_counters = get_conversation_counters(obj)
+        return obj._conversation_counters
+    
     def get_conversations_count(self, obj):
         """Get count of conversations for this chatbot"""
-        return obj.conversations.count()
+        return self._counters(obj)['conversations_count']
+    
+    def get_qualified_count(self, obj):
+        return self._counters(obj)['qualified_count']
+    
+    def get_converted_count(self, obj):
+        return self._counters(obj)['converted_count']
+    
+    def get_active_today_count(self, obj):
+        return self._counters(obj)['active_today_count']
 
 
 # ==================== PROJECT STRUCTURE SERIALIZERS ====================
@@ -914,6 +1052,14 @@ class LedgerSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'created_at')
 
 
+class StatementEntrySerializer(LedgerSerializer):
+    """Serializer for statement rows, balance is the running balance as of each entry"""
+    balance = serializers.DecimalField(source='running_balance', max_digits=14, decimal_places=2, read_only=True)
+    
+    class Meta(LedgerSerializer.Meta):
+        fields = LedgerSerializer.Meta.fields + ('source_type', 'source_id')
+
+
 # ==================== REFUND SERIALIZERS ====================
 
 class RefundSerializer(serializers.ModelSerializer):
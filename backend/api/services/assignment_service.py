@@ -0,0 +1,284 @@
+"""
+Assignment Service
+Picks agents for calls, chats and leads from a cache-backed index of live agent load
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from datetime import datetime
+from ..models import Agent, CallLog, ChatbotConversation, Lead
+from .process_cache import bump_version, get_version, is_fresh, timestamp
+import logging
+
+logger = logging.getLogger(__name__)
+
+STRATEGY_ROUND_ROBIN = 'round_robin'
+STRATEGY_LEAST_BUSY = 'least_busy'
+STRATEGIES = (STRATEGY_ROUND_ROBIN, STRATEGY_LEAST_BUSY)
+
+CHANNEL_CALL = 'call'
+CHANNEL_CHAT = 'chat'
+CHANNEL_LEAD = 'lead'
+
+# Roles that take work from each channel
+CHANNEL_ROLES = {
+    CHANNEL_CALL: (Agent.Role.AGENT, Agent.Role.TELECALLER),
+    CHANNEL_CHAT: (Agent.Role.AGENT, Agent.Role.TELECALLER, Agent.Role.CUSTOMER_SUPPORT),
+    CHANNEL_LEAD: (Agent.Role.AGENT, Agent.Role.TELECALLER),
+}
+
+# Load counters kept per agent
+LOAD_OPEN_CALLS = 'calls'
+LOAD_OPEN_CHATS = 'chats'
+LOAD_LEADS_TODAY = 'leads'
+LOAD_KINDS = (LOAD_OPEN_CALLS, LOAD_OPEN_CHATS, LOAD_LEADS_TODAY)
+
+OPEN_CALL_STATUSES = (CallLog.Status.INITIATED, CallLog.Status.RINGING, CallLog.Status.ANSWERED)
+
+# Counters are updated from events and reconciled with the database (reconcile_agent_loads) to correct
+# any drift; without a reconciliation within this many seconds the next assignment rebuilds them
+LOAD_INDEX_TIMEOUT = 5 * 60
+
+# Cache key holding the current roster version (see process_cache for how it reaches other processes)
+ROSTER_VERSION_KEY = 'assignment_roster_version'
+
+# Roster built by this process, the version it was built for and when
+_roster = {'version': None, 'loaded_at': None, 'agents': None}
+
+
+# ==================== ROSTER ====================
+
+def invalidate_roster():
+    """Force every worker to reload the agent roster on its next assignment"""
+    bump_version(ROSTER_VERSION_KEY)
+    # Newly active agents have no counters yet
+    cache.delete(_built_key())
+
+
+def _skills(deals_in):
+    return frozenset(skill.strip().lower() for skill in (deals_in or '').split(',') if skill.strip())
+
+
+def get_roster():
+    """
+    Get active agents as (id, role, team, skills) tuples, reloaded only when agents changed
+
+    Skills are the comma-separated values of Agent.deals_in.
+    """
+    version = get_version(ROSTER_VERSION_KEY)
+    if not is_fresh(_roster['version'], _roster['loaded_at'], version):
+        _roster['agents'] = [
+            (agent_id, role, team, _skills(deals_in))
+            for agent_id, role, team, deals_in in Agent.objects.filter(is_active=True).order_by('id').values_list(
+                'id', 'role', 'team', 'deals_in'
+            )
+        ]
+        _roster['version'] = version
+        _roster['loaded_at'] = timestamp()
+    return _roster['agents']
+
+
+# ==================== LOAD INDEX ====================
+
+def _index_enabled():
+    """The index needs a cache shared by all workers; otherwise loads are counted per pick"""
+    return getattr(settings, 'ASSIGNMENT_LOAD_INDEX', False)
+
+
+def _today():
+    return timezone.localdate().isoformat()
+
+
+def _load_key(kind, agent_id, day=None):
+    if kind == LOAD_LEADS_TODAY:
+        return f"agent_load:{kind}:{day or _today()}:{agent_id}"
+    return f"agent_load:{kind}:{agent_id}"
+
+
+def _built_key():
+    return f"agent_load:built:{_today()}"
+
+
+def _open_count(queryset, agent_field):
+    """Per-agent count of `queryset` rows, as a subquery on Agent"""
+    return Coalesce(Subquery(
+        queryset.filter(**{agent_field: OuterRef('pk')}).order_by().values(agent_field).annotate(
+            total=Count('id')
+        ).values('total'),
+        output_field=IntegerField(),
+    ), Value(0))
+
+
+def count_agent_loads(agent_ids):
+    """
+    Count open calls, open chats and today's new leads per agent from the database in one query
+
+    Returns:
+        Dictionary of agent id -> {kind: count}
+    """
+    start_of_day = timezone.make_aware(datetime.combine(timezone.localdate(), datetime.min.time()))
+    rows = Agent.objects.filter(pk__in=agent_ids).annotate(
+        open_calls=_open_count(CallLog.objects.filter(status__in=OPEN_CALL_STATUSES), 'agent'),
+        open_chats=_open_count(
+            ChatbotConversation.objects.filter(status=ChatbotConversation.Status.ACTIVE), 'assigned_agent'
+        ),
+        leads_today=_open_count(Lead.objects.filter(created_at__gte=start_of_day), 'agent'),
+    ).values_list('pk', 'open_calls', 'open_chats', 'leads_today')
+    loads = {agent_id: dict.fromkeys(LOAD_KINDS, 0) for agent_id in agent_ids}
+    for agent_id, calls, chats, leads in rows:
+        loads[agent_id] = {LOAD_OPEN_CALLS: calls, LOAD_OPEN_CHATS: chats, LOAD_LEADS_TODAY: leads}
+    return loads
+
+
+def rebuild_load_index():
+    """
+    Reset the counters of all active agents from the database
+
+    Run periodically by the reconcile_agent_loads command; assignments only
+    rebuild when no reconciliation happened within LOAD_INDEX_TIMEOUT.
+
+    Returns:
+        Dictionary of agent id -> {kind: count}
+    """
+    loads = count_agent_loads([agent_id for agent_id, _, _, _ in get_roster()])
+    values = {
+        _load_key(kind, agent_id): count for agent_id, counts in loads.items() for kind, count in counts.items()
+    }
+    # Counters outlive the built marker, so increments never land on a missing key mid-rebuild
+    cache.set_many(values, LOAD_INDEX_TIMEOUT * 2)
+    cache.set(_built_key(), True, LOAD_INDEX_TIMEOUT)
+    return loads
+
+
+def record_load_change(kind, agent_id, delta):
+    """
+    Apply an event to an agent's load counter
+
+    Missing counters are left alone; the next rebuild counts the event.
+    """
+    if not agent_id or not delta or not _index_enabled():
+        return
+    try:
+        cache.incr(_load_key(kind, agent_id), delta)
+    except ValueError:
+        pass
+
+
+def _load_holder(instance):
+    """Agent an open call or chat counts against, or None"""
+    if isinstance(instance, CallLog):
+        return instance.agent_id if instance.status in OPEN_CALL_STATUSES else None
+    return instance.assigned_agent_id if instance.status == ChatbotConversation.Status.ACTIVE else None
+
+
+def remember_load_holder(instance):
+    """Note who a freshly loaded call or chat counts against, so saves can move the load"""
+    fields = ('status', 'agent_id') if isinstance(instance, CallLog) else ('status', 'assigned_agent_id')
+    # post_init runs before from_db() marks the instance as loaded, so a pk is the only hint
+    if instance.pk is None:
+        instance._load_holder = None
+    elif all(field in instance.__dict__ for field in fields):
+        instance._load_holder = _load_holder(instance)
+
+
+def track_load_change(instance, deleted=False):
+    """
+    Move load counters after a call or chat was saved or deleted
+
+    Called from model signals, and directly by bulk writers that bypass them.
+    """
+    kind = LOAD_OPEN_CALLS if isinstance(instance, CallLog) else LOAD_OPEN_CHATS
+    before = getattr(instance, '_load_holder', None)
+    after = None if deleted else _load_holder(instance)
+    if before != after:
+        record_load_change(kind, before, -1)
+        record_load_change(kind, after, 1)
+    instance._load_holder = after
+
+
+def get_agent_loads(agent_ids):
+    """
+    Get current load per agent
+
+    With the index enabled this is a single cache read (the counters and the
+    built marker together); otherwise the loads are counted from the database.
+
+    Returns:
+        Dictionary of agent id -> total of open calls, open chats and today's leads
+    """
+    if not _index_enabled():
+        return {agent_id: sum(counts.values()) for agent_id, counts in count_agent_loads(agent_ids).items()}
+
+    keys = {_load_key(kind, agent_id): agent_id for agent_id in agent_ids for kind in LOAD_KINDS}
+    built_key = _built_key()
+    stored = cache.get_many([built_key, *keys])
+    if not stored.pop(built_key, None):
+        rebuild_load_index()
+        stored = cache.get_many(keys.keys())
+    loads = dict.fromkeys(agent_ids, 0)
+    for key, value in stored.items():
+        loads[keys[key]] += max(value, 0)
+    return loads
+
+
+# ==================== SCHEDULER ====================
+
+def _candidates(channel, team=None, skill=None, exclude=()):
+    roles = CHANNEL_ROLES[channel]
+    agents = [agent for agent in get_roster() if agent[1] in roles and agent[0] not in exclude]
+    if not agents:
+        # Nobody in the channel's roles: any active agent is better than none
+        agents = [agent for agent in get_roster() if agent[0] not in exclude]
+    if team:
+        agents = [agent for agent in agents if agent[2] == team] or agents
+    if skill:
+        agents = [agent for agent in agents if skill.strip().lower() in agent[3]] or agents
+    return [agent[0] for agent in agents]
+
+
+def _next_turn(channel, size):
+    key = f"assignment_turn:{channel}"
+    try:
+        return cache.incr(key) % size
+    except ValueError:
+        # First turn for the channel (or the counter was evicted)
+        cache.add(key, 0, None)
+        return 0
+
+
+def pick_agent(channel, strategy=None, team=None, skill=None, exclude=()):
+    """
+    Pick the agent to receive a call, chat or lead
+
+    Candidates are the active agents in the channel's roles, narrowed to a
+    team and/or skill when any agent matches. Round robin rotates through
+    them; least busy takes the lowest current load, ties broken in rotation
+    order so equal agents share work.
+
+    Args:
+        channel: CHANNEL_CALL, CHANNEL_CHAT or CHANNEL_LEAD
+        strategy: STRATEGY_ROUND_ROBIN or STRATEGY_LEAST_BUSY (defaults to settings.ASSIGNMENT_STRATEGY)
+        team: Optional Agent.team to prefer
+        skill: Optional skill (matched against Agent.deals_in) to prefer
+        exclude: Agent ids not to pick
+
+    Returns:
+        Agent id or None when no agent is active
+    """
+    strategy = strategy or getattr(settings, 'ASSIGNMENT_STRATEGY', STRATEGY_LEAST_BUSY)
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown assignment strategy: {strategy}")
+
+    candidates = _candidates(channel, team=team, skill=skill, exclude=set(exclude))
+    if not candidates:
+        return None
+
+    turn = _next_turn(channel, len(candidates))
+    rotated = candidates[turn:] + candidates[:turn]
+    if strategy == STRATEGY_ROUND_ROBIN:
+        return rotated[0]
+
+    loads = get_agent_loads(candidates)
+    return min(rotated, key=lambda agent_id: loads[agent_id])
@@ -0,0 +1,301 @@
+"""
+Bank Statement Import Service
+Stream-parses CSV and MT940 bank statements into BankReconciliation lines
+"""
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from ..models import BankReconciliation
+from .reconciliation_service import normalize_reference
+import csv
+import hashlib
+import io
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Parsed lines inserted per bulk_create
+IMPORT_CHUNK_SIZE = 1000
+
+# Parse errors reported back to the caller
+MAX_REPORTED_ERRORS = 100
+
+STATEMENT_FORMATS = ('csv', 'mt940')
+
+CSV_DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y', '%d-%m-%y', '%d-%b-%Y', '%d %b %Y', '%d.%m.%Y')
+
+# Accepted CSV headers, compared lower-case with non-alphanumerics removed
+CSV_COLUMNS = {
+    'date': ('date', 'transactiondate', 'txndate', 'valuedate', 'postingdate'),
+    'description': ('description', 'narration', 'particulars', 'remarks', 'details'),
+    'reference': ('reference', 'referencenumber', 'refno', 'chqrefno', 'chequeno', 'chequenumber', 'chqno'),
+    'utr': ('utr', 'utrnumber', 'utrno'),
+    'debit': ('debit', 'withdrawal', 'withdrawalamt', 'withdrawalamount', 'dr'),
+    'credit': ('credit', 'deposit', 'depositamt', 'depositamount', 'cr'),
+    'amount': ('amount', 'transactionamount'),
+    'type': ('type', 'transactiontype', 'crdr', 'drcr'),
+}
+
+UTR_PATTERNS = (
+    re.compile(r'\bUTR\s*(?:NO)?\s*[:.\-]?\s*([A-Z0-9]{10,22})'),
+    re.compile(r'\b(?:NEFT|RTGS|IMPS|UPI)\s*[-/:]\s*(?:[A-Z]+\s*[-/:]\s*)?([A-Z0-9]{10,22})'),
+)
+
+# :61:YYMMDD[MMDD](R)C|D[funds code]amount N|F|Sxxx customer reference[//bank reference]
+MT940_STATEMENT_LINE = re.compile(
+    r'^(?P<date>\d{6})(?:\d{4})?(?P<mark>R?[CD])[A-Z]?(?P<amount>\d+,\d*)'
+    r'[NFS][A-Z0-9]{3}(?P<reference>[^/]*?)(?://(?P<bank_reference>.*))?$'
+)
+
+
+class StatementParseError(ValueError):
+    """Raised for a statement line that cannot be parsed"""
+
+
+def _normalize_header(value):
+    return re.sub(r'[^0-9a-z]', '', (value or '').lower())
+
+
+def _parse_amount(value):
+    value = (value or '').replace(',', '').strip()
+    if not value:
+        return None
+    try:
+        return abs(Decimal(value))
+    except InvalidOperation:
+        raise StatementParseError(f"Invalid amount: {value}")
+
+
+def _parse_date(value):
+    value = (value or '').strip()
+    for date_format in CSV_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise StatementParseError(f"Invalid date: {value}")
+
+
+def extract_utr(text):
+    """Find a UTR number in a statement narration, if any"""
+    if not text:
+        return None
+    text = text.upper()
+    for pattern in UTR_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return match.group(1)
+    return None
+
+
+def parse_csv(stream):
+    """
+    Parse a CSV bank statement
+
+    Supports separate debit/credit columns or an amount with a Cr/Dr type column.
+
+    Args:
+        stream: Text stream
+
+    Yields:
+        Tuple of (line number, parsed line dictionary or StatementParseError)
+    """
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        return
+    positions = {_normalize_header(title): index for index, title in enumerate(header)}
+    columns = {}
+    for field, aliases in CSV_COLUMNS.items():
+        for alias in aliases:
+            if alias in positions:
+                columns[field] = positions[alias]
+                break
+    if 'date' not in columns or not ({'debit', 'credit'} & columns.keys() or 'amount' in columns):
+        raise StatementParseError('CSV needs a date column and debit/credit or amount columns')
+
+    for line_number, row in enumerate(reader, start=2):
+        if not any(cell.strip() for cell in row):
+            continue
+        value = lambda field: row[columns[field]] if field in columns and columns[field] < len(row) else ''
+        try:
+            credit = _parse_amount(value('credit'))
+            debit = _parse_amount(value('debit'))
+            if credit:
+                transaction_type, amount = 'Credit', credit
+            elif debit:
+                transaction_type, amount = 'Debit', debit
+            else:
+                amount = _parse_amount(value('amount'))
+                if amount is None:
+                    raise StatementParseError('Missing amount')
+                signed = value('amount').strip().startswith('-')
+                is_debit = value('type').strip().upper().startswith(('D', 'W')) or signed
+                transaction_type = 'Debit' if is_debit else 'Credit'
+            description = value('description').strip()
+            yield line_number, {
+                'transaction_date': _parse_date(value('date')),
+                'transaction_type': transaction_type,
+                'amount': amount,
+                'reference_number': value('reference').strip(),
+                'utr_number': value('utr').strip() or extract_utr(description),
+                'description': description,
+            }
+        except StatementParseError as e:
+            yield line_number, e
+
+
+def parse_mt940(stream):
+    """
+    Parse an MT940 bank statement, reading :61: statement lines and their :86: narrative
+
+    Args:
+        stream: Text stream
+
+    Yields:
+        Tuple of (line number, parsed line dictionary or StatementParseError)
+    """
+    pending = None
+    narrative = None
+
+    def finish():
+        line_number, parsed = pending
+        if isinstance(parsed, dict):
+            # Narrative is wrapped at a fixed width, so continuation lines join without a separator
+            parsed['description'] = ''.join(narrative or []).strip()
+            parsed['utr_number'] = extract_utr(parsed['description']) or extract_utr(parsed['bank_reference'])
+        return line_number, parsed
+
+    for line_number, raw_line in enumerate(stream, start=1):
+        line = raw_line.rstrip('\r\n')
+        if line.startswith(':61:'):
+            if pending:
+                yield finish()
+            narrative = None
+            match = MT940_STATEMENT_LINE.match(line[4:].strip())
+            if not match:
+                pending = (line_number, StatementParseError(f"Invalid :61: line: {line}"))
+                continue
+            try:
+                transaction_date = datetime.strptime(match.group('date'), '%y%m%d').date()
+            except ValueError:
+                pending = (line_number, StatementParseError(f"Invalid date in :61: line: {line}"))
+                continue
+            reference = match.group('reference').strip()
+            pending = (line_number, {
+                'transaction_date': transaction_date,
+                # Reversal of a credit is a debit and vice versa
+                'transaction_type': 'Credit' if match.group('mark') in ('C', 'RD') else 'Debit',
+                'amount': Decimal(match.group('amount').replace(',', '.')),
+                'reference_number': '' if reference.upper() == 'NONREF' else reference,
+                'bank_reference': (match.group('bank_reference') or '').strip(),
+            })
+        elif line.startswith(':86:') and pending:
+            narrative = [line[4:]]
+        elif line.startswith(':') or line.startswith('-'):
+            if pending:
+                yield finish()
+                pending = None
+            narrative = None
+        elif narrative is not None:
+            narrative.append(line)
+
+    if pending:
+        yield finish()
+
+
+def line_fingerprint(bank_name, account_number, parsed, occurrence):
+    """
+    Fingerprint a statement line so re-importing the same statement is a no-op
+
+    Identical lines within one statement are told apart by their occurrence number.
+    """
+    key = '|'.join(str(part) for part in (
+        bank_name, account_number, parsed['transaction_date'].isoformat(), parsed['transaction_type'],
+        parsed['amount'], parsed['utr_number'] or '', parsed['reference_number'] or '',
+        parsed['description'], occurrence,
+    ))
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _insert_chunk(chunk):
+    """Insert a chunk of lines, skipping already imported fingerprints. Returns the number created."""
+    fingerprints = [line.line_fingerprint for line in chunk]
+    existing = set(BankReconciliation.objects.filter(
+        line_fingerprint__in=fingerprints
+    ).values_list('line_fingerprint', flat=True))
+    new_lines = [line for line in chunk if line.line_fingerprint not in existing]
+    # ignore_conflicts covers a concurrent import of the same statement
+    BankReconciliation.objects.bulk_create(new_lines, ignore_conflicts=True)
+    return len(new_lines)
+
+
+def import_statement(uploaded_file, statement_format, bank_name, account_number):
+    """
+    Import a bank statement file into BankReconciliation lines
+
+    The file is parsed as a stream and inserted in chunks, so memory use does
+    not grow with the statement size. Each chunk is committed on its own; an
+    interrupted import can simply be re-run since imported lines are skipped.
+
+    Args:
+        uploaded_file: Uploaded (binary) file
+        statement_format: 'csv' or 'mt940'
+        bank_name: Bank name recorded on the lines
+        account_number: Bank account number recorded on the lines
+
+    Returns:
+        Dictionary with parsed, created and duplicate counts and parse errors
+
+    Raises:
+        StatementParseError: If the file layout is not recognised
+    """
+    if statement_format not in STATEMENT_FORMATS:
+        raise StatementParseError(f"Unsupported statement format: {statement_format}")
+
+    stream = io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', errors='replace', newline='')
+    parser = parse_csv if statement_format == 'csv' else parse_mt940
+    stats = {'parsed': 0, 'created': 0, 'duplicates': 0, 'errors': []}
+    occurrences = {}
+    chunk = []
+
+    try:
+        for line_number, parsed in parser(stream):
+            if isinstance(parsed, StatementParseError):
+                if len(stats['errors']) < MAX_REPORTED_ERRORS:
+                    stats['errors'].append({'line': line_number, 'error': str(parsed)})
+                continue
+
+            stats['parsed'] += 1
+            parsed['utr_number'] = normalize_reference(parsed['utr_number'])
+            parsed['reference_number'] = normalize_reference(parsed['reference_number'])
+            base_fingerprint = line_fingerprint(bank_name, account_number, parsed, 0)
+            occurrence = occurrences.get(base_fingerprint, 0)
+            occurrences[base_fingerprint] = occurrence + 1
+
+            chunk.append(BankReconciliation(
+                bank_name=bank_name,
+                account_number=account_number,
+                transaction_date=parsed['transaction_date'],
+                transaction_type=parsed['transaction_type'],
+                amount=parsed['amount'],
+                reference_number=parsed['reference_number'],
+                utr_number=parsed['utr_number'],
+                description=parsed['description'] or None,
+                line_fingerprint=base_fingerprint if occurrence == 0 else line_fingerprint(
+                    bank_name, account_number, parsed, occurrence
+                ),
+            ))
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                stats['created'] += _insert_chunk(chunk)
+                chunk = []
+
+        if chunk:
+            stats['created'] += _insert_chunk(chunk)
+    finally:
+        # Leave the uploaded file open for Django to clean up
+        stream.detach()
+
+    stats['duplicates'] = stats['parsed'] - stats['created']
+    logger.info(f"Imported bank statement for {bank_name} {account_number}: {stats['created']} new lines")
+    return stats
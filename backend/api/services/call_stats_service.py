@@ -0,0 +1,185 @@
+"""
+Call Stats Service
+Maintains CallDailyStat rollups per day, agent and lead source, and serves call analytics from them
+"""
+from django.db import transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from ..models import CallDailyStat, CallLog, Lead
+
+# Calls are counted once they reach one of these statuses
+FINISHED_CALL_STATUSES = (
+    CallLog.Status.COMPLETED, CallLog.Status.BUSY, CallLog.Status.NO_ANSWER,
+    CallLog.Status.FAILED, CallLog.Status.CANCELLED,
+)
+
+# CallLog fields a call's contribution is derived from
+STAT_FIELDS = ('status', 'initiated_at', 'agent_id', 'lead_id', 'direction', 'answered_at', 'duration', 'ring_duration')
+
+COUNTERS = ('total_calls', 'outbound_calls', 'connected_calls', 'talk_seconds', 'ring_seconds', 'ring_samples')
+
+
+def call_stat_state(call_log):
+    """
+    Rollup key and counters a call contributes
+
+    Returns:
+        Tuple of (date, agent_id, lead_id, outbound, connected, talk_seconds, ring_seconds),
+        ring_seconds being None when unknown, or None while the call is not finished
+    """
+    if call_log.status not in FINISHED_CALL_STATUSES or not call_log.initiated_at:
+        return None
+    connected = call_log.answered_at is not None or (
+        call_log.status == CallLog.Status.COMPLETED and bool(call_log.duration)
+    )
+    return (
+        timezone.localtime(call_log.initiated_at).date(),
+        call_log.agent_id,
+        call_log.lead_id,
+        call_log.direction == CallLog.Direction.OUTBOUND,
+        connected,
+        (call_log.duration or 0) if connected else 0,
+        call_log.ring_duration,
+    )
+
+
+def remember_call_stat_state(call_log):
+    """Note what a freshly loaded call contributes, so saves can move the difference"""
+    # post_init runs before from_db() marks the instance as loaded, so a pk is the only hint
+    if call_log.pk is None:
+        call_log._call_stat_state = None
+    elif all(field in call_log.__dict__ for field in STAT_FIELDS):
+        call_log._call_stat_state = call_stat_state(call_log)
+
+
+def _counters(state, sign):
+    _, _, _, outbound, connected, talk, ring = state
+    return [sign, sign * outbound, sign * connected, sign * talk, sign * (ring or 0), sign * (ring is not None)]
+
+
+def _apply_changes(changes):
+    """Add the (previous, current) state pairs to the rollup, one increment per touched row"""
+    lead_ids = {state[2] for pair in changes for state in pair if state and state[2]}
+    sources = dict(Lead.objects.filter(pk__in=lead_ids).values_list('id', 'source')) if lead_ids else {}
+
+    deltas = {}
+    for previous, current in changes:
+        for state, sign in ((previous, -1), (current, 1)):
+            if state is None:
+                continue
+            key = (state[0], state[1], sources.get(state[2], ''))
+            row = deltas.setdefault(key, [0] * len(COUNTERS))
+            for index, value in enumerate(_counters(state, sign)):
+                row[index] += value
+
+    with transaction.atomic():
+        for (day, agent_id, lead_source), values in deltas.items():
+            if not any(values):
+                continue
+            stat, _ = CallDailyStat.objects.get_or_create(date=day, agent_id=agent_id, lead_source=lead_source)
+            CallDailyStat.objects.filter(pk=stat.pk).update(
+                **{counter: F(counter) + value for counter, value in zip(COUNTERS, values)},
+                updated_at=timezone.now()
+            )
+
+
+def track_call_stats(call_logs, deleted=False):
+    """
+    Move rollup counters after calls were saved or deleted
+
+    Called from model signals, and directly by bulk writers that bypass them.
+    Uses F() increments so concurrent changes to the same day never lose updates.
+
+    Args:
+        call_logs: Iterable of CallLog instances
+        deleted: True when the calls were deleted
+    """
+    changes = []
+    for call_log in call_logs:
+        previous = getattr(call_log, '_call_stat_state', None)
+        current = None if deleted else call_stat_state(call_log)
+        if previous != current:
+            changes.append((previous, current))
+        call_log._call_stat_state = current
+    if changes:
+        _apply_changes(changes)
+
+
+def rebuild_call_stats():
+    """
+    Recompute every rollup row from the call logs table
+
+    Returns:
+        Number of rollup rows written
+    """
+    rows = {}
+    calls = CallLog.objects.filter(status__in=FINISHED_CALL_STATUSES).order_by().only(*STAT_FIELDS).annotate(
+        lead_source=Coalesce('lead__source', Value(''))
+    )
+    for call_log in calls.iterator(chunk_size=2000):
+        state = call_stat_state(call_log)
+        if state is None:
+            continue
+        key = (state[0], state[1], call_log.lead_source)
+        row = rows.setdefault(key, [0] * len(COUNTERS))
+        for index, value in enumerate(_counters(state, 1)):
+            row[index] += value
+
+    stats = [
+        CallDailyStat(date=day, agent_id=agent_id, lead_source=lead_source, **dict(zip(COUNTERS, values)))
+        for (day, agent_id, lead_source), values in rows.items()
+    ]
+    CallDailyStat.objects.all().delete()
+    CallDailyStat.objects.bulk_create(stats, batch_size=1000)
+    return len(stats)
+
+
+def _summary(row):
+    connected = row['connected_calls'] or 0
+    ring_samples = row['ring_samples'] or 0
+    return {
+        'total_calls': row['total_calls'] or 0,
+        'outbound_calls': row['outbound_calls'] or 0,
+        'inbound_calls': (row['total_calls'] or 0) - (row['outbound_calls'] or 0),
+        'connected_calls': connected,
+        'connect_rate': round(connected * 100 / row['total_calls'], 2) if row['total_calls'] else None,
+        'total_talk_seconds': row['talk_seconds'] or 0,
+        'avg_talk_seconds': round(row['talk_seconds'] / connected, 1) if connected else None,
+        'avg_ring_seconds': round(row['ring_seconds'] / ring_samples, 1) if ring_samples else None,
+    }
+
+
+def get_call_analytics(stats=None):
+    """
+    Call totals overall, per agent, per lead source and per day from the rollup table
+
+    Args:
+        stats: Optional CallDailyStat queryset (e.g. filtered by date or agent)
+
+    Returns:
+        Dictionary with totals, by_agent, by_source and by_day summaries
+    """
+    if stats is None:
+        stats = CallDailyStat.objects.all()
+    sums = {counter: Sum(counter) for counter in COUNTERS}
+
+    by_agent = []
+    for row in stats.order_by().values(
+        'agent_id', 'agent__first_name', 'agent__last_name', 'agent__username'
+    ).annotate(**sums).order_by('-total_calls'):
+        name = f"{row['agent__first_name'] or ''} {row['agent__last_name'] or ''}".strip() or row['agent__username']
+        by_agent.append({'agent_id': row['agent_id'], 'agent_name': name, **_summary(row)})
+
+    return {
+        'totals': _summary(stats.order_by().aggregate(**sums)),
+        'by_agent': by_agent,
+        'by_source': [
+            {'lead_source': row['lead_source'] or None, **_summary(row)}
+            for row in stats.order_by().values('lead_source').annotate(**sums).order_by('-total_calls')
+        ],
+        'by_day': [
+            {'date': row['date'], **_summary(row)}
+            for row in stats.order_by().values('date').annotate(**sums).order_by('date')
+        ],
+    }
@@ -0,0 +1,187 @@
+"""
+Chat Archive Service
+Moves messages of long-ended chatbot conversations to compressed JSON-lines segments on media storage
+and reads them back for the message endpoints
+"""
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from decimal import Decimal
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+from tempfile import SpooledTemporaryFile
+from ..models import ChatbotConversation, ChatbotMessage
+import gzip
+import json
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Conversations moved per segment
+ARCHIVE_BATCH_SIZE = 200
+
+ARCHIVE_DIR = 'chatbot_archive'
+
+# Segments are built in memory up to this size, then spill to a temporary file
+SEGMENT_MEMORY_LIMIT = 8 * 1024 * 1024
+
+# Messages deleted from the hot table per statement
+DELETE_CHUNK_SIZE = 1000
+
+MESSAGE_FIELDS = (
+    'id', 'message_type', 'content', 'intent', 'confidence', 'entities', 'quick_replies', 'timestamp', 'metadata',
+)
+
+
+def get_archivable_conversations(days=None):
+    """
+    Conversations that ended more than `days` days ago and still have messages to archive
+
+    A conversation has ended once ended_at is set or it left the Active status;
+    without ended_at its last message time counts as the end. Archived
+    conversations come back once they have hot messages (e.g. a reopened chat)
+    and none newer than the cutoff.
+    """
+    days = settings.CHATBOT_ARCHIVE_AFTER_DAYS if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    hot = ChatbotMessage.objects.filter(conversation=OuterRef('pk'))
+    return ChatbotConversation.objects.filter(
+        Q(archived_at__isnull=True) & (
+            Q(ended_at__lt=cutoff) |
+            Q(ended_at__isnull=True, last_message_at__lt=cutoff) & ~Q(status=ChatbotConversation.Status.ACTIVE)
+        ) |
+        Q(archived_at__isnull=False) & Exists(hot) & ~Exists(hot.filter(timestamp__gte=cutoff)) &
+        ~Q(status=ChatbotConversation.Status.ACTIVE)
+    )
+
+
+def _encode(row):
+    """One JSON line for a message row"""
+    line = {field: row[field] for field in MESSAGE_FIELDS}
+    line['timestamp'] = row['timestamp'].isoformat()
+    line['confidence'] = str(row['confidence']) if row['confidence'] is not None else None
+    return json.dumps(line, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def archive_conversations(days=None, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Archive one batch of ended conversations into a new segment
+
+    Each conversation's messages become one gzip member of the segment, so a
+    transcript is read back with a single ranged read. A conversation archived
+    before is rewritten whole into the new segment (its old member is left
+    unreferenced). Conversations are locked with SKIP LOCKED while their
+    pointers are written and their messages deleted, so several workers can
+    run at once.
+
+    Args:
+        days: Archive conversations ended more than this many days ago
+              (defaults to settings.CHATBOT_ARCHIVE_AFTER_DAYS)
+        batch_size: Maximum number of conversations in the segment
+
+    Returns:
+        Dictionary with counts of conversations and messages archived
+    """
+    stats = {'conversations': 0, 'messages': 0}
+    with transaction.atomic():
+        conversations = list(get_archivable_conversations(days).select_for_update(skip_locked=True).order_by('id').only(
+            'id', 'archive_segment', 'archive_offset', 'archive_length', 'archived_message_count', 'archived_at'
+        )[:batch_size])
+        if not conversations:
+            return stats
+
+        messages = ChatbotMessage.objects.filter(
+            conversation_id__in=[conversation.pk for conversation in conversations]
+        ).order_by('conversation_id', 'timestamp', 'id').values('conversation_id', *MESSAGE_FIELDS)
+
+        segment = SpooledTemporaryFile(max_size=SEGMENT_MEMORY_LIMIT)
+        pointers = {}
+        message_ids = []
+        by_id = {conversation.pk: conversation for conversation in conversations}
+        for conversation_id, rows in groupby(messages.iterator(chunk_size=2000), key=itemgetter('conversation_id')):
+            conversation = by_id[conversation_id]
+            # Messages that arrived after an earlier archival join the ones archived then
+            archived = _read_member(conversation) if conversation.archive_segment else b''
+            lines = []
+            for row in rows:
+                message_ids.append(row['id'])
+                lines.append(_encode(row))
+            member = gzip.compress(archived + b''.join(lines))
+            pointers[conversation_id] = (segment.tell(), len(member), conversation.archived_message_count + len(lines))
+            segment.write(member)
+
+        name = None
+        if pointers:
+            segment.seek(0)
+            name = default_storage.save(
+                f"{ARCHIVE_DIR}/{timezone.now():%Y/%m/%d}/{uuid.uuid4().hex}.jsonl.gz", File(segment)
+            )
+        segment.close()
+
+        try:
+            now = timezone.now()
+            for conversation in conversations:
+                if conversation.pk in pointers:
+                    conversation.archive_segment = name
+                    offset, length, count = pointers[conversation.pk]
+                    conversation.archive_offset = offset
+                    conversation.archive_length = length
+                    conversation.archived_message_count = count
+                conversation.archived_at = now
+            ChatbotConversation.objects.bulk_update(conversations, [
+                'archive_segment', 'archive_offset', 'archive_length', 'archived_message_count', 'archived_at'
+            ])
+            for start in range(0, len(message_ids), DELETE_CHUNK_SIZE):
+                ChatbotMessage.objects.filter(pk__in=message_ids[start:start + DELETE_CHUNK_SIZE]).delete()
+        except Exception:
+            if name:
+                default_storage.delete(name)
+            raise
+
+    stats['conversations'] = len(conversations)
+    stats['messages'] = len(message_ids)
+    logger.info(f"Archived {stats['messages']} messages of {stats['conversations']} conversations to {name}")
+    return stats
+
+
+def _read_member(conversation):
+    """A conversation's archived JSON lines, read from its segment with one ranged read"""
+    with default_storage.open(conversation.archive_segment, 'rb') as segment:
+        segment.seek(conversation.archive_offset)
+        return gzip.decompress(segment.read(conversation.archive_length))
+
+
+def load_archived_messages(conversation):
+    """
+    Read a conversation's archived messages back from its segment
+
+    Returns:
+        List of unsaved ChatbotMessage instances (with their original ids), oldest first
+    """
+    if not conversation.archive_segment:
+        return []
+    messages = []
+    for line in _read_member(conversation).splitlines():
+        row = json.loads(line)
+        row['timestamp'] = parse_datetime(row['timestamp'])
+        row['confidence'] = Decimal(row['confidence']) if row['confidence'] is not None else None
+        messages.append(ChatbotMessage(conversation=conversation, **row))
+    return messages
+
+
+def get_conversation_messages(conversation):
+    """
+    All messages of a conversation, archived ones included, in (timestamp, id) order
+
+    Uses prefetched messages when the conversation was loaded with them.
+    """
+    hot = list(conversation.messages.all())
+    if not conversation.archived_at:
+        return hot
+    return sorted(load_archived_messages(conversation) + hot, key=lambda message: (message.timestamp, message.pk))
@@ -2,9 +2,15 @@
 Chatbot Service
 Handles chatbot conversations, lead qualification, and integration
 """
+from django.db.models import Count, Q
 from django.utils import timezone
+from collections import namedtuple
 from datetime import timedelta
-from ..models import Chatbot, ChatbotConversation, ChatbotMessage, ChatbotQualificationRule, Lead, Agent
+from types import MappingProxyType
+from ..models import Chatbot, ChatbotConversation, ChatbotMessage, ChatbotQualificationRule, Lead
+from .assignment_service import CHANNEL_CHAT, CHANNEL_LEAD, pick_agent
+from .keyword_matcher import KeywordMatcher
+from .process_cache import bump_version, get_version, is_fresh, timestamp
 import uuid
 import json
 import logging
@@ -12,6 +18,107 @@ import re
 
 logger = logging.getLogger(__name__)
 
+# Cache key prefix holding each chatbot's flow version (see process_cache for how it reaches other processes)
+FLOW_VERSION_KEY = 'chatbot_flow_version'
+
+# A compiled qualification question: scores resolved up front and every scoring keyword
+# (positive ones first, then negative ones) in a single matcher
+QualificationQuestion = namedtuple('QualificationQuestion', [
+    'field_name', 'question', 'is_choice', 'options', 'positive_keywords', 'negative_keywords',
+    'keyword_matcher', 'positive_score', 'negative_score', 'option_scores',
+])
+
+# Canned replies of the custom provider; the first listed keyword found in a message wins
+CUSTOM_RESPONSES = {
+    'hello': 'Hello! How can I help you today?',
+    'hi': 'Hi there! What can I do for you?',
+    'price': 'Our prices vary based on the property. Could you tell me your budget range?',
+    'location': 'We have properties in multiple locations. Which area are you interested in?',
+    'contact': 'I can connect you with one of our agents. Could you share your contact details?',
+}
+_custom_response_matcher = KeywordMatcher(CUSTOM_RESPONSES)
+_custom_response_list = tuple(CUSTOM_RESPONSES.values())
+
+# Flows compiled by this process: chatbot id -> (version, loaded_at, tuple of questions)
+_flows = {}
+
+
+# ==================== QUALIFICATION FLOW ====================
+
+def invalidate_qualification_flow(chatbot_id):
+    """Make workers recompile a chatbot's flow on their next message"""
+    bump_version(f"{FLOW_VERSION_KEY}:{chatbot_id}")
+
+
+def compile_question(rule):
+    """
+    Compile a ChatbotQualificationRule into an immutable QualificationQuestion
+
+    Returns:
+        QualificationQuestion
+    """
+    scoring_rules = rule.scoring_rules or {}
+    is_choice = rule.field_type == 'choice'
+    positive_keywords = tuple(keyword.lower() for keyword in scoring_rules.get('positive_keywords', []))
+    negative_keywords = tuple(keyword.lower() for keyword in scoring_rules.get('negative_keywords', []))
+    return QualificationQuestion(
+        field_name=rule.field_name,
+        question=rule.question,
+        is_choice=is_choice,
+        options=tuple(rule.options or ()),
+        positive_keywords=positive_keywords,
+        negative_keywords=negative_keywords,
+        keyword_matcher=KeywordMatcher(positive_keywords + negative_keywords),
+        positive_score=scoring_rules.get('positive_score', 10),
+        negative_score=scoring_rules.get('negative_score', 10),
+        option_scores=MappingProxyType(dict(scoring_rules.get('option_scores', {})) if is_choice else {}),
+    )
+
+
+def get_qualification_flow(chatbot):
+    """
+    Get a chatbot's active qualification questions in order, compiled once per rule change or expiry
+
+    Only the version key is read from the cache; compiled flows stay in process memory.
+
+    Args:
+        chatbot: Chatbot instance or id
+
+    Returns:
+        Tuple of QualificationQuestion
+    """
+    chatbot_id = getattr(chatbot, 'pk', chatbot)
+    version = get_version(f"{FLOW_VERSION_KEY}:{chatbot_id}")
+
+    compiled = _flows.get(chatbot_id)
+    if compiled is None or not is_fresh(compiled[0], compiled[1], version):
+        rules = ChatbotQualificationRule.objects.filter(chatbot_id=chatbot_id, is_active=True).order_by('order', 'id')
+        compiled = _flows[chatbot_id] = (version, timestamp(), tuple(compile_question(rule) for rule in rules))
+    return compiled[2]
+
+
+def score_answer(question, answer):
+    """
+    Score an answer to a compiled question
+
+    Keywords are found in one pass over the answer. Each positive keyword found
+    adds positive_score, each negative keyword subtracts negative_score and
+    choice answers add their option score.
+
+    Returns:
+        Score clamped to 0-100
+    """
+    positive_count = len(question.positive_keywords)
+    score = 0
+    for index in question.keyword_matcher.find(answer):
+        score += question.positive_score if index < positive_count else -question.negative_score
+    if question.is_choice and answer in question.options:
+        score += question.option_scores.get(answer, 0)
+    return max(0, min(100, score))
+
+
+# ==================== CONVERSATIONS ====================
+
 
 def generate_conversation_id():
     """Generate unique conversation ID"""
@@ -49,13 +156,13 @@ def start_conversation(chatbot, visitor_id=None, visitor_name=None, visitor_emai
         status=ChatbotConversation.Status.ACTIVE
     )
     
-    # Send welcome message
+    # Send welcome message (the conversation was just created, so nothing to save)
     if chatbot.welcome_message:
-        send_bot_message(conversation, chatbot.welcome_message)
+        send_bot_message(conversation, chatbot.welcome_message, save=False)
     
     # Start qualification if enabled
     if chatbot.qualification_enabled:
-        ask_next_qualification_question(conversation)
+        ask_next_qualification_question(conversation, save=False)
     
     return conversation
 
@@ -72,7 +179,7 @@ def send_user_message(conversation, content, intent=None, confidence=None, entit
         entities: Extracted entities (optional)
     
     Returns:
-        ChatbotMessage instance
+        Tuple of (user ChatbotMessage, bot ChatbotMessage)
     """
     message = ChatbotMessage.objects.create(
         conversation=conversation,
@@ -83,17 +190,16 @@ def send_user_message(conversation, content, intent=None, confidence=None, entit
         entities=entities or []
     )
     
-    # Update conversation last message time
+    # Process message and get bot response; the conversation's changes are saved once below
+    bot_response = process_message(conversation, message)
+    
     conversation.last_message_at = timezone.now()
     conversation.save()
     
-    # Process message and get bot response
-    bot_response = process_message(conversation, message)
-    
     return message, bot_response
 
 
-def send_bot_message(conversation, content, quick_replies=None):
+def send_bot_message(conversation, content, quick_replies=None, save=True):
     """
     Send a bot message in conversation
     
@@ -101,6 +207,7 @@ def send_bot_message(conversation, content, quick_replies=None):
         conversation: ChatbotConversation instance
         content: Message content
         quick_replies: Quick reply buttons (optional)
+        save: Save the conversation (False when the caller saves it once afterwards)
     
     Returns:
         ChatbotMessage instance
@@ -113,7 +220,8 @@ def send_bot_message(conversation, content, quick_replies=None):
     )
     
     conversation.last_message_at = timezone.now()
-    conversation.save()
+    if save:
+        conversation.save()
     
     return message
 
@@ -122,6 +230,8 @@ def process_message(conversation, user_message):
     """
     Process user message and generate bot response
     
+    Changes to the conversation are left unsaved for the caller to save once.
+    
     Args:
         conversation: ChatbotConversation instance
         user_message: ChatbotMessage instance (user message)
@@ -151,14 +261,14 @@ def process_message(conversation, user_message):
         response = chatbot.fallback_message
     
     # Send bot response
-    bot_message = send_bot_message(conversation, response)
+    bot_message = send_bot_message(conversation, response, save=False)
     
     return bot_message
 
 
 def extract_visitor_info(conversation, message):
     """
-    Extract visitor information from message
+    Extract visitor information from message (the caller saves the conversation)
     
     Args:
         conversation: ChatbotConversation instance
@@ -191,8 +301,6 @@ def extract_visitor_info(conversation, message):
                 if name and len(name) > 2 and not conversation.visitor_name:
                     conversation.visitor_name = name
                     break
-    
-    conversation.save()
 
 
 def handle_qualification_answer(conversation, message):
@@ -206,34 +314,26 @@ def handle_qualification_answer(conversation, message):
     Returns:
         Bot response message or None
     """
-    chatbot = conversation.chatbot
-    rules = chatbot.qualification_rules.filter(is_active=True).order_by('order')
+    flow = get_qualification_flow(conversation.chatbot_id)
     
     # Get current question index from metadata
     current_index = conversation.metadata.get('qualification_index', 0)
     
-    if current_index < len(rules):
-        current_rule = rules[current_index]
+    if current_index < len(flow):
+        question = flow[current_index]
         
-        # Store answer
+        # Store answer and add its score
         answer = message.content
-        conversation.qualification_data[current_rule.field_name] = answer
-        
-        # Calculate score for this answer
-        score = calculate_qualification_score(current_rule, answer)
-        current_score = conversation.qualification_score or 0
-        conversation.qualification_score = current_score + score
-        
-        conversation.save()
+        conversation.qualification_data[question.field_name] = answer
+        conversation.qualification_score = (conversation.qualification_score or 0) + score_answer(question, answer)
         
         # Move to next question
         next_index = current_index + 1
         conversation.metadata['qualification_index'] = next_index
-        conversation.save()
         
-        if next_index < len(rules):
+        if next_index < len(flow):
             # Ask next question
-            return ask_next_qualification_question(conversation)
+            return ask_next_qualification_question(conversation, save=False)
         else:
             # Qualification complete
             return complete_qualification(conversation)
@@ -241,32 +341,28 @@ def handle_qualification_answer(conversation, message):
     return None
 
 
-def ask_next_qualification_question(conversation):
+def ask_next_qualification_question(conversation, save=True):
     """
     Ask next qualification question
     
     Args:
         conversation: ChatbotConversation instance
+        save: Save the conversation (False when the caller saves it once afterwards)
     
     Returns:
         Bot message with question
     """
-    chatbot = conversation.chatbot
-    rules = chatbot.qualification_rules.filter(is_active=True).order_by('order')
+    flow = get_qualification_flow(conversation.chatbot_id)
     
     current_index = conversation.metadata.get('qualification_index', 0)
     
-    if current_index < len(rules):
-        rule = rules[current_index]
-        question = rule.question
+    if current_index < len(flow):
+        question = flow[current_index]
         
         # Add quick replies if choice type
-        quick_replies = []
-        if rule.field_type == 'choice' and rule.options:
-            quick_replies = rule.options
+        quick_replies = list(question.options) if question.is_choice else []
         
-        bot_message = send_bot_message(conversation, question, quick_replies)
-        return bot_message
+        return send_bot_message(conversation, question.question, quick_replies, save=save)
     
     return None
 
@@ -282,35 +378,7 @@ def calculate_qualification_score(rule, answer):
     Returns:
         Score (integer)
     """
-    scoring_rules = rule.scoring_rules or {}
-    
-    if not scoring_rules:
-        return 0
-    
-    # Simple scoring logic
-    # Can be enhanced with more complex rules
-    answer_lower = answer.lower()
-    
-    # Check for positive keywords
-    positive_keywords = scoring_rules.get('positive_keywords', [])
-    negative_keywords = scoring_rules.get('negative_keywords', [])
-    
-    score = 0
-    
-    for keyword in positive_keywords:
-        if keyword.lower() in answer_lower:
-            score += scoring_rules.get('positive_score', 10)
-    
-    for keyword in negative_keywords:
-        if keyword.lower() in answer_lower:
-            score -= scoring_rules.get('negative_score', 10)
-    
-    # Check exact match for choice type
-    if rule.field_type == 'choice' and answer in rule.options:
-        option_score = scoring_rules.get('option_scores', {}).get(answer, 0)
-        score += option_score
-    
-    return max(0, min(100, score))  # Clamp between 0 and 100
+    return score_answer(compile_question(rule), answer)
 
 
 def complete_qualification(conversation):
@@ -332,17 +400,14 @@ def complete_qualification(conversation):
     
     conversation.is_qualified = is_qualified
     conversation.status = ChatbotConversation.Status.QUALIFIED if is_qualified else ChatbotConversation.Status.NOT_QUALIFIED
-    conversation.save()
     
     # Create lead if auto_create_lead is enabled
     if chatbot.auto_create_lead and (is_qualified or chatbot.config.get('create_lead_always', False)):
-        lead = create_lead_from_conversation(conversation)
-        conversation.lead = lead
-        conversation.save()
+        conversation.lead = create_lead_from_conversation(conversation)
         
         # Auto-assign agent if enabled
         if chatbot.auto_assign_agent:
-            assign_agent_to_conversation(conversation)
+            assign_agent_to_conversation(conversation, save=False)
     
     # Send completion message
     if is_qualified:
@@ -352,7 +417,7 @@ def complete_qualification(conversation):
         response = chatbot.config.get('not_qualified_message',
             "Thank you for your interest. We'll review your information and get back to you.")
     
-    bot_message = send_bot_message(conversation, response)
+    bot_message = send_bot_message(conversation, response, save=False)
     return bot_message
 
 
@@ -378,8 +443,12 @@ def create_lead_from_conversation(conversation):
         lead = Lead.objects.filter(phone=conversation.visitor_phone).first()
     
     if not lead:
+        config = conversation.chatbot.config or {}
         # Create new lead
         lead = Lead.objects.create(
+            agent_id=conversation.assigned_agent_id or pick_agent(
+                CHANNEL_LEAD, team=config.get('assignment_team'), skill=config.get('assignment_skill')
+            ),
             name=conversation.visitor_name or 'Chatbot Visitor',
             phone=conversation.visitor_phone or '',
             email=conversation.visitor_email or '',
@@ -405,24 +474,31 @@ def create_lead_from_conversation(conversation):
     return lead
 
 
-def assign_agent_to_conversation(conversation):
+def assign_agent_to_conversation(conversation, save=True):
     """
     Assign agent to conversation
     
     Args:
         conversation: ChatbotConversation instance
+        save: Save the conversation (False when the caller saves it once afterwards)
     
     Returns:
         Updated conversation
     """
-    # Simple round-robin assignment
-    # Can be enhanced with load balancing, skills matching, etc.
-    agent = Agent.objects.filter(is_active=True).first()
+    # The lead's owner keeps the conversation; otherwise the scheduler picks
+    config = conversation.chatbot.config or {}
+    agent_id = conversation.lead.agent_id if conversation.lead else None
+    if not agent_id:
+        agent_id = pick_agent(
+            CHANNEL_CHAT, strategy=config.get('assignment_strategy'),
+            team=config.get('assignment_team'), skill=config.get('assignment_skill')
+        )
     
-    if agent:
-        conversation.assigned_agent = agent
+    if agent_id:
+        conversation.assigned_agent_id = agent_id
         conversation.assigned_at = timezone.now()
-        conversation.save()
+        if save:
+            conversation.save()
     
     return conversation
 
@@ -430,19 +506,9 @@ def assign_agent_to_conversation(conversation):
 def process_custom_chatbot(conversation, message):
     """Process message with custom chatbot logic"""
     # Simple keyword-based responses
-    content = message.content.lower()
-    
-    responses = {
-        'hello': 'Hello! How can I help you today?',
-        'hi': 'Hi there! What can I do for you?',
-        'price': 'Our prices vary based on the property. Could you tell me your budget range?',
-        'location': 'We have properties in multiple locations. Which area are you interested in?',
-        'contact': 'I can connect you with one of our agents. Could you share your contact details?',
-    }
-    
-    for keyword, response in responses.items():
-        if keyword in content:
-            return response
+    index = _custom_response_matcher.first(message.content)
+    if index is not None:
+        return _custom_response_list[index]
     
     return conversation.chatbot.fallback_message
 
@@ -460,3 +526,47 @@ def process_gemini_chatbot(conversation, message, chatbot):
     # This would use Gemini API to generate responses
     return chatbot.fallback_message
 
+
+
+# ==================== ANALYTICS ====================
+
+def _conversation_counter_filters():
+    """Counter name -> conversation lookups; conversations_count counts them all"""
+    today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    return {
+        'conversations_count': {},
+        'qualified_count': {'is_qualified': True},
+        'converted_count': {'lead__isnull': False},
+        'active_today_count': {'last_message_at__gte': today},
+    }
+
+
+def annotate_conversation_counters(queryset):
+    """
+    Annotate a Chatbot queryset with its conversation counters
+
+    All counters are conditional counts over a single join, so listing bots
+    never loads conversation rows.
+    """
+    return queryset.annotate(**{
+        name: Count('conversations', filter=Q(**{f'conversations__{key}': value for key, value in lookups.items()}))
+        for name, lookups in _conversation_counter_filters().items()
+    })
+
+
+def get_conversation_counters(chatbot):
+    """
+    Conversation counters of a chatbot: total, qualified, converted to a lead and active today
+
+    Uses the annotations from annotate_conversation_counters when present,
+    otherwise counts with one aggregate query.
+
+    Returns:
+        Dictionary of counter name -> count
+    """
+    filters = _conversation_counter_filters()
+    if all(hasattr(chatbot, name) for name in filters):
+        return {name: getattr(chatbot, name) for name in filters}
+    return ChatbotConversation.objects.filter(chatbot=chatbot).aggregate(**{
+        name: Count('id', filter=Q(**lookups)) for name, lookups in filters.items()
+    })
@@ -2,8 +2,18 @@
 Commission Calculation Service
 Handles commission calculation, splits, and approval workflow
 """
-from decimal import Decimal
-from ..models import Deal, Commission, CommissionSplit, Agent
+from django.db import transaction
+from django.db.models import Count, DateField, F, Q, Sum, Value, DecimalField
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+from django.utils import timezone
+from decimal import Decimal, ROUND_HALF_UP
+from ..models import Deal, Commission, CommissionSplit, CommissionMonthlyRollup, CommissionRule, Agent
+
+# Used when no commission rule matches a deal
+DEFAULT_COMMISSION_PERCENTAGE = Decimal('2.00')
+
+# Deals processed per transaction by the commission engine
+COMMISSION_ENGINE_BATCH_SIZE = 1000
 
 
 def calculate_commission(deal, agent, commission_type='Percentage', commission_percentage=None, fixed_amount=None, role=None):
@@ -59,26 +69,29 @@ def create_commission_split(commission, splits_data):
     if total_percentage != 100:
         raise ValueError(f"Total split percentage must be 100%, got {total_percentage}%")
     
-    split_instances = []
-    for split_data in splits_data:
-        agent = Agent.objects.get(id=split_data['agent_id'])
-        allocated_amount = commission.calculated_amount * (Decimal(split_data['split_percentage']) / 100)
-        
-        split = CommissionSplit.objects.create(
+    agents = Agent.objects.in_bulk({split['agent_id'] for split in splits_data})
+    missing = {split['agent_id'] for split in splits_data} - agents.keys()
+    if missing:
+        raise Agent.DoesNotExist(f"Agents not found: {sorted(missing)}")
+    
+    split_instances = [
+        CommissionSplit(
             commission=commission,
-            agent=agent,
+            agent=agents[split_data['agent_id']],
             split_percentage=split_data['split_percentage'],
-            allocated_amount=allocated_amount,
+            allocated_amount=commission.calculated_amount * (Decimal(split_data['split_percentage']) / 100),
             role=split_data.get('role', 'Agent')
         )
-        split_instances.append(split)
+        for split_data in splits_data
+    ]
+    CommissionSplit.objects.bulk_create(split_instances)
     
     return split_instances
 
 
 def auto_calculate_commission_on_deal_close(deal):
     """
-    Automatically calculate commission when deal is closed
+    Automatically calculate commission when deal is closed, using the commission rules
     
     Args:
         deal: Deal instance that was just closed
@@ -89,21 +102,8 @@ def auto_calculate_commission_on_deal_close(deal):
     if deal.stage != Deal.Stage.CLOSED:
         return None
     
-    agent = deal.agent
-    
-    # Get commission configuration for agent (would be from settings or agent profile)
-    # For now, use default 2% commission
-    commission_percentage = 2.0
-    
-    commission = calculate_commission(
-        deal=deal,
-        agent=agent,
-        commission_type=Commission.Type.PERCENTAGE,
-        commission_percentage=commission_percentage,
-        role='Agent'
-    )
-    
-    return commission
+    created = compute_commissions(Deal.objects.filter(pk=deal.pk))['commissions']
+    return created[0] if created else None
 
 
 def approve_commission(commission):
@@ -154,9 +154,6 @@ def get_agent_commission_summary(agent, start_date=None, end_date=None):
     Returns:
         Dictionary with commission statistics
     """
-    from django.db.models import Sum
-    from django.utils import timezone
-    
     queryset = Commission.objects.filter(agent=agent)
     
     if start_date:
@@ -164,19 +161,324 @@ def get_agent_commission_summary(agent, start_date=None, end_date=None):
     if end_date:
         queryset = queryset.filter(created_at__lte=end_date)
     
-    summary = {
-        'total_earned': queryset.filter(status=Commission.Status.PAID).aggregate(
-            total=Sum('calculated_amount')
-        )['total'] or Decimal('0'),
-        'pending': queryset.filter(status=Commission.Status.PENDING).aggregate(
-            total=Sum('calculated_amount')
-        )['total'] or Decimal('0'),
-        'approved': queryset.filter(status=Commission.Status.APPROVED).aggregate(
-            total=Sum('calculated_amount')
-        )['total'] or Decimal('0'),
-        'total_commissions': queryset.count(),
-        'paid_commissions': queryset.filter(status=Commission.Status.PAID).count(),
-    }
+    return summarize_commissions(queryset)
+
+
+def summarize_commissions(queryset):
+    """
+    Summarize commissions by status with a single conditional aggregation
     
-    return summary
+    Args:
+        queryset: Commission queryset
+    
+    Returns:
+        Dictionary with total_earned, pending, approved, total_commissions and paid_commissions
+    """
+    zero = Value(Decimal('0'), output_field=DecimalField(max_digits=14, decimal_places=2))
+    paid = Q(status=Commission.Status.PAID)
+    return queryset.order_by().aggregate(
+        total_earned=Coalesce(Sum('calculated_amount', filter=paid), zero),
+        pending=Coalesce(Sum('calculated_amount', filter=Q(status=Commission.Status.PENDING)), zero),
+        approved=Coalesce(Sum('calculated_amount', filter=Q(status=Commission.Status.APPROVED)), zero),
+        total_commissions=Count('id'),
+        paid_commissions=Count('id', filter=paid),
+    )
+
+
+# ==================== MONTHLY ROLLUPS ====================
+
+def commission_month(created_at):
+    """First day of the (local) month a commission belongs to"""
+    return timezone.localtime(created_at).date().replace(day=1)
+
+
+def rollup_state(commission):
+    """
+    Rollup key and amount a commission contributes
+
+    Returns:
+        Tuple of (agent_id, month, status, amount), or None if not saved yet
+    """
+    if not commission.created_at:
+        return None
+    return (commission.agent_id, commission_month(commission.created_at), commission.status,
+            Decimal(str(commission.calculated_amount)))
+
+
+def _apply_rollup_delta(agent_id, month, status, count_delta, amount_delta):
+    rollup, _ = CommissionMonthlyRollup.objects.get_or_create(agent_id=agent_id, month=month, status=status)
+    CommissionMonthlyRollup.objects.filter(pk=rollup.pk).update(
+        commission_count=F('commission_count') + count_delta,
+        total_amount=F('total_amount') + amount_delta,
+        updated_at=timezone.now()
+    )
+
+
+def record_commission_change(previous, current):
+    """
+    Move a commission's contribution between rollup rows
+
+    Uses F() increments so concurrent changes to the same agent/month never lose updates.
+
+    Args:
+        previous: rollup_state before the change (None for a new commission)
+        current: rollup_state after the change (None for a deleted commission)
+    """
+    if previous == current:
+        return
+    if previous:
+        agent_id, month, status, amount = previous
+        _apply_rollup_delta(agent_id, month, status, -1, -amount)
+    if current:
+        agent_id, month, status, amount = current
+        _apply_rollup_delta(agent_id, month, status, 1, amount)
+
+
+def rebuild_commission_rollups():
+    """
+    Recompute every rollup row from the commissions table
+
+    Returns:
+        Number of rollup rows written
+    """
+    rows = Commission.objects.order_by().annotate(
+        month=TruncMonth('created_at', output_field=DateField())
+    ).values('agent_id', 'month', 'status').annotate(
+        commission_count=Count('id'), total_amount=Sum('calculated_amount')
+    )
+    rollups = [CommissionMonthlyRollup(**row) for row in rows]
+    CommissionMonthlyRollup.objects.all().delete()
+    CommissionMonthlyRollup.objects.bulk_create(rollups)
+    return len(rollups)
+
+
+def get_commission_analytics(rollups=None):
+    """
+    Commission totals by status, agent, team and month from the rollup table
+
+    All breakdowns are derived from one conditional-aggregation query grouped by
+    agent and month, so cost depends on agents x months rather than commissions.
 
+    Args:
+        rollups: Optional CommissionMonthlyRollup queryset (e.g. filtered by month or agent)
+
+    Returns:
+        Dictionary with totals (per status), by_agent (leaderboard sorted by paid
+        amount), by_team (grouped by the agent's manager) and by_month
+    """
+    if rollups is None:
+        rollups = CommissionMonthlyRollup.objects.all()
+    statuses = [status.lower() for status in Commission.Status.values]
+    zero = Value(Decimal('0'), output_field=DecimalField(max_digits=14, decimal_places=2))
+
+    aggregates = {'count': Coalesce(Sum('commission_count'), 0)}
+    for status in Commission.Status.values:
+        aggregates[status.lower()] = Coalesce(Sum('total_amount', filter=Q(status=status)), zero)
+
+    rows = rollups.order_by().values(
+        'agent_id', 'agent__first_name', 'agent__last_name', 'agent__username',
+        'agent__reports_to_id', 'month'
+    ).annotate(**aggregates)
+
+    def empty():
+        return {'count': 0, **{status: Decimal('0') for status in statuses}}
+
+    def add(target, row):
+        target['count'] += row['count']
+        for status in statuses:
+            target[status] += row[status]
+
+    totals = empty()
+    by_agent = {}
+    by_team = {}
+    by_month = {}
+    for row in rows:
+        add(totals, row)
+        agent = by_agent.setdefault(row['agent_id'], {
+            'agent_id': row['agent_id'],
+            'agent_name': f"{row['agent__first_name']} {row['agent__last_name']}".strip() or row['agent__username'],
+            **empty(),
+        })
+        add(agent, row)
+        add(by_team.setdefault(row['agent__reports_to_id'], {'manager_id': row['agent__reports_to_id'], **empty()}), row)
+        add(by_month.setdefault(row['month'], {'month': row['month'], **empty()}), row)
+
+    return {
+        'totals': totals,
+        'by_agent': sorted(by_agent.values(), key=lambda agent: (-agent['paid'], agent['agent_id'])),
+        'by_team': list(by_team.values()),
+        'by_month': [by_month[month] for month in sorted(by_month)],
+    }
+
+
+# ==================== RULE ENGINE ====================
+
+def load_commission_rules():
+    """
+    Load active commission rules indexed by (agent role, project)
+
+    Returns:
+        Dictionary of (agent_role, project_id) -> rules ordered by priority
+    """
+    rules = {}
+    for rule in CommissionRule.objects.filter(is_active=True).order_by('-priority', 'min_deal_value', 'id'):
+        rules.setdefault((rule.agent_role, rule.project_id), []).append(rule)
+    return rules
+
+
+def match_commission_rule(rules, agent_role, project_id, deal_value):
+    """
+    Find the rule for a deal: highest priority whose slab contains the deal value,
+    preferring role + project specific rules over generic ones on equal priority
+
+    Returns:
+        CommissionRule or None
+    """
+    best = None
+    for key in ((agent_role, project_id), (agent_role, None), (None, project_id), (None, None)):
+        for rule in rules.get(key, ()):
+            in_slab = rule.min_deal_value <= deal_value and (rule.max_deal_value is None or deal_value < rule.max_deal_value)
+            if in_slab:
+                if best is None or rule.priority > best.priority:
+                    best = rule
+                break
+    return best
+
+
+def _rule_terms(rule, deal_value):
+    """Return (commission_type, commission_percentage, fixed_amount, calculated_amount) for a rule"""
+    if rule is not None and rule.commission_type == Commission.Type.FIXED:
+        fixed_amount = rule.fixed_amount or Decimal('0')
+        return Commission.Type.FIXED, None, fixed_amount, fixed_amount
+    percentage = DEFAULT_COMMISSION_PERCENTAGE if rule is None else (rule.commission_percentage or Decimal('0'))
+    amount = (deal_value * percentage / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    return Commission.Type.PERCENTAGE, percentage, None, amount
+
+
+def compute_commissions(deals=None, start_date=None, end_date=None, recalculate=False):
+    """
+    Compute commissions and splits for closed deals in one pass
+
+    Deals, their agents and project are read with one query per batch; rules are
+    loaded once. Commissions and splits are written with bulk inserts and the
+    monthly rollups updated per agent/month. Deals that already have a
+    commission for their agent are skipped, unless recalculate is set, in which
+    case pending commissions are replaced (approved and paid ones are kept).
+
+    Args:
+        deals: Optional Deal queryset (defaults to all deals)
+        start_date: Optional first closing date (registry date, else last update)
+        end_date: Optional last closing date
+        recalculate: Replace existing pending commissions
+
+    Returns:
+        Dictionary with deals, created, replaced and skipped counts and the
+        created commissions
+    """
+    queryset = (deals if deals is not None else Deal.objects.all()).filter(stage=Deal.Stage.CLOSED)
+    if start_date or end_date:
+        queryset = queryset.annotate(closed_on=Coalesce('registry_date', TruncDate('updated_at')))
+        if start_date:
+            queryset = queryset.filter(closed_on__gte=start_date)
+        if end_date:
+            queryset = queryset.filter(closed_on__lte=end_date)
+    rows = list(queryset.order_by('id').values_list(
+        'id', 'deal_value', 'agent_id', 'agent__role', 'agent__reports_to_id', 'property__unit__floor__tower__project_id'
+    ))
+
+    rules = load_commission_rules()
+    stats = {'deals': len(rows), 'created': 0, 'replaced': 0, 'skipped': 0, 'commissions': []}
+    for offset in range(0, len(rows), COMMISSION_ENGINE_BATCH_SIZE):
+        with transaction.atomic():
+            _compute_commission_batch(rows[offset:offset + COMMISSION_ENGINE_BATCH_SIZE], rules, recalculate, stats)
+    return stats
+
+
+def _compute_commission_batch(rows, rules, recalculate, stats):
+    existing = {}
+    for commission in Commission.objects.filter(deal_id__in=[row[0] for row in rows]).exclude(
+        status=Commission.Status.CANCELLED
+    ).only('id', 'deal_id', 'agent_id', 'status', 'created_at', 'calculated_amount'):
+        existing.setdefault((commission.deal_id, commission.agent_id), []).append(commission)
+
+    replaced = []
+    planned = []
+    for deal_id, deal_value, agent_id, agent_role, manager_id, project_id in rows:
+        current = existing.get((deal_id, agent_id), [])
+        locked = any(commission.status != Commission.Status.PENDING for commission in current)
+        if current and (locked or not recalculate):
+            stats['skipped'] += 1
+            continue
+        replaced.extend(current)
+
+        rule = match_commission_rule(rules, agent_role, project_id, deal_value)
+        commission_type, percentage, fixed_amount, amount = _rule_terms(rule, deal_value)
+        commission = Commission(
+            deal_id=deal_id,
+            agent_id=agent_id,
+            commission_type=commission_type,
+            commission_percentage=percentage,
+            fixed_amount=fixed_amount,
+            calculated_amount=amount,
+            role='Agent',
+            status=Commission.Status.PENDING,
+            notes=f"Rule: {rule.name}" if rule else 'Default commission rate',
+        )
+        planned.append((commission, rule, manager_id))
+
+    if replaced:
+        # Deletes send post_delete per commission, which takes them out of the rollups
+        Commission.objects.filter(pk__in=[commission.pk for commission in replaced]).delete()
+        stats['replaced'] += len(replaced)
+
+    if not planned:
+        return
+
+    commissions = [commission for commission, _, _ in planned]
+    Commission.objects.bulk_create(commissions)
+    if any(commission.pk is None for commission in commissions):
+        # bulk_create does not return primary keys on every backend (e.g. MySQL)
+        created_ids = {
+            (deal_id, agent_id): pk for pk, deal_id, agent_id in Commission.objects.filter(
+                deal_id__in=[commission.deal_id for commission in commissions], status=Commission.Status.PENDING
+            ).values_list('id', 'deal_id', 'agent_id')
+        }
+        for commission in commissions:
+            commission.pk = created_ids.get((commission.deal_id, commission.agent_id))
+
+    splits = []
+    for commission, rule, manager_id in planned:
+        manager_share = rule.manager_split_percentage if rule and manager_id else Decimal('0')
+        if not manager_share:
+            continue
+        manager_amount = (commission.calculated_amount * manager_share / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        splits.append(CommissionSplit(
+            commission_id=commission.pk, agent_id=commission.agent_id, split_percentage=100 - manager_share,
+            allocated_amount=commission.calculated_amount - manager_amount, role='Closer',
+        ))
+        splits.append(CommissionSplit(
+            commission_id=commission.pk, agent_id=manager_id, split_percentage=manager_share,
+            allocated_amount=manager_amount, role='Manager',
+        ))
+    CommissionSplit.objects.bulk_create(splits)
+
+    record_commission_batch(rollup_state(commission) for commission in commissions)
+    stats['created'] += len(commissions)
+    stats['commissions'].extend(commissions)
+
+
+def record_commission_batch(states, sign=1):
+    """
+    Apply rollup deltas for many commissions at once, one update per agent/month/status
+
+    Args:
+        states: Iterable of rollup_state tuples
+        sign: 1 to add the commissions, -1 to remove them
+    """
+    grouped = {}
+    for agent_id, month, status, amount in states:
+        totals = grouped.setdefault((agent_id, month, status), [0, Decimal('0')])
+        totals[0] += 1
+        totals[1] += amount
+    for (agent_id, month, status), (count, amount) in grouped.items():
+        _apply_rollup_delta(agent_id, month, status, sign * count, sign * amount)
@@ -0,0 +1,294 @@
+"""
+Dialer Service
+Power-dialer campaigns: dials filtered leads for a pool of agents, paced by answer rate
+"""
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from datetime import timedelta
+from ..models import Agent, CallLog, DialerCampaign, DialerCampaignEntry, Lead
+from .assignment_service import OPEN_CALL_STATUSES
+from .call_stats_service import FINISHED_CALL_STATUSES
+from .provider_registry import get_default_telephony_config
+from .telephony_service import initiate_outbound_call
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+# Campaign lead_filter keys -> Lead lookups
+LEAD_FILTERS = {
+    'status': 'status',
+    'status__in': 'status__in',
+    'tag': 'tag',
+    'tag__in': 'tag__in',
+    'source': 'source',
+    'source__in': 'source__in',
+    'agent': 'agent_id',
+    'agent__in': 'agent_id__in',
+    'property': 'property_id',
+    'created_after': 'created_at__date__gte',
+    'created_before': 'created_at__date__lte',
+}
+
+# Calls in flight per provider unless TelephonyConfig.config['max_concurrent_calls'] says otherwise
+DEFAULT_PROVIDER_CONCURRENCY = 10
+
+# Pacing uses the answer rate of the campaign's most recent finished calls once there are enough of them
+PACING_WINDOW = 50
+PACING_MIN_SAMPLES = 10
+
+# Calls still without a final status after this long are given up on
+DIAL_TIMEOUT = timedelta(hours=2)
+
+
+def get_campaign_leads(campaign):
+    """
+    Leads matching a campaign's lead_filter
+
+    Raises:
+        ValueError: If the filter has unknown keys
+    """
+    unknown = set(campaign.lead_filter or {}) - LEAD_FILTERS.keys()
+    if unknown:
+        raise ValueError(f"Unknown lead filter: {', '.join(sorted(unknown))}")
+    return Lead.objects.filter(**{LEAD_FILTERS[key]: value for key, value in (campaign.lead_filter or {}).items()})
+
+
+def start_campaign(campaign):
+    """
+    Add the campaign's matching leads as entries and set it running
+
+    Leads already in the campaign are kept as they are, so restarting a paused
+    campaign only adds leads that started matching since.
+
+    Returns:
+        Number of entries added
+    """
+    lead_ids = list(get_campaign_leads(campaign).order_by('created_at', 'id').values_list('id', flat=True))
+    with transaction.atomic():
+        existing = DialerCampaignEntry.objects.filter(campaign=campaign).count()
+        DialerCampaignEntry.objects.bulk_create([
+            DialerCampaignEntry(campaign=campaign, lead_id=lead_id) for lead_id in lead_ids
+        ], batch_size=1000, ignore_conflicts=True)
+        added = DialerCampaignEntry.objects.filter(campaign=campaign).count() - existing
+        campaign.status = DialerCampaign.Status.RUNNING
+        campaign.started_at = campaign.started_at or timezone.now()
+        campaign.completed_at = None
+        campaign.save(update_fields=['status', 'started_at', 'completed_at', 'updated_at'])
+    return added
+
+
+def get_dial_ratio(campaign):
+    """
+    Calls to place per free agent slot: the inverse of the recent answer rate, capped at max_dial_ratio
+
+    Returns 1 until the campaign has PACING_MIN_SAMPLES finished calls.
+    """
+    recent = list(DialerCampaignEntry.objects.filter(
+        campaign=campaign, status=DialerCampaignEntry.Status.COMPLETED
+    ).order_by('-finished_at').values_list('answered', flat=True)[:PACING_WINDOW])
+    if len(recent) < PACING_MIN_SAMPLES:
+        return 1.0
+    answer_rate = sum(recent) / len(recent)
+    if not answer_rate:
+        return float(campaign.max_dial_ratio)
+    return min(max(1 / answer_rate, 1.0), float(campaign.max_dial_ratio))
+
+
+def sync_campaign_outcomes(campaign, now=None):
+    """
+    Move dialing entries whose calls finished (or timed out) to their outcome with one bulk update
+
+    Returns:
+        Number of entries finished
+    """
+    now = now or timezone.now()
+    dialing = DialerCampaignEntry.objects.filter(
+        campaign=campaign, status=DialerCampaignEntry.Status.DIALING
+    ).select_related('call_log').only(
+        'id', 'status', 'dialed_at', 'call_log__status', 'call_log__answered_at', 'call_log__duration'
+    )
+    finished = []
+    for entry in dialing:
+        call_log = entry.call_log
+        if call_log and call_log.status in FINISHED_CALL_STATUSES:
+            entry.status = DialerCampaignEntry.Status.COMPLETED
+            entry.outcome = call_log.status
+            entry.answered = call_log.answered_at is not None or (
+                call_log.status == CallLog.Status.COMPLETED and bool(call_log.duration)
+            )
+        elif entry.dialed_at and now - entry.dialed_at > DIAL_TIMEOUT:
+            entry.status = DialerCampaignEntry.Status.FAILED
+            entry.note = 'No final call status received'
+        else:
+            continue
+        entry.finished_at = now
+        finished.append(entry)
+    DialerCampaignEntry.objects.bulk_update(finished, ['status', 'outcome', 'answered', 'note', 'finished_at'])
+    return len(finished)
+
+
+def _claim_entries(campaign, telephony_config, now):
+    """
+    Pick the entries to dial now and mark them Dialing; skipped leads are marked in bulk
+
+    Returns:
+        Tuple of (claimed entries, number of entries skipped)
+    """
+    agent_ids = list(campaign.agents.filter(is_active=True).values_list('id', flat=True))
+    ratio = get_dial_ratio(campaign)
+    slots_per_agent = max(int(math.floor(campaign.calls_per_agent * ratio)), 1)
+
+    # Calls in flight: open call logs plus entries being dialed that have no call log yet
+    in_flight = DialerCampaignEntry.objects.filter(status=DialerCampaignEntry.Status.DIALING, call_log__isnull=True)
+    open_calls = CallLog.objects.filter(status__in=OPEN_CALL_STATUSES).order_by()
+    agent_busy = dict(open_calls.filter(agent__isnull=False).values('agent').annotate(
+        total=Count('id')).values_list('agent', 'total'))
+    for agent_id, total in in_flight.filter(agent__isnull=False).order_by().values('agent').annotate(
+            total=Count('id')).values_list('agent', 'total'):
+        agent_busy[agent_id] = agent_busy.get(agent_id, 0) + total
+    provider_limit = int((telephony_config.config or {}).get('max_concurrent_calls', DEFAULT_PROVIDER_CONCURRENCY))
+    provider_free = provider_limit - open_calls.filter(
+        direction=CallLog.Direction.OUTBOUND, provider=telephony_config.provider
+    ).count() - in_flight.count()
+    if provider_free <= 0:
+        return [], 0
+
+    free = {agent_id: slots_per_agent - agent_busy.get(agent_id, 0) for agent_id in agent_ids}
+    if agent_ids and not any(slots > 0 for slots in free.values()):
+        return [], 0
+
+    wanted = min(provider_free, sum(max(slots, 0) for slots in free.values())) if agent_ids else provider_free
+    # Look further than the free slots so skipped leads don't stall the campaign
+    pending = list(DialerCampaignEntry.objects.filter(
+        campaign=campaign, status=DialerCampaignEntry.Status.PENDING
+    ).select_related('lead').order_by('id')[:wanted * 3])
+    if not pending:
+        return [], 0
+
+    lead_ids = [entry.lead_id for entry in pending]
+    in_call = set(CallLog.objects.filter(lead_id__in=lead_ids, status__in=OPEN_CALL_STATUSES).values_list('lead_id', flat=True))
+    recent = set(CallLog.objects.filter(
+        lead_id__in=lead_ids, initiated_at__gte=now - timedelta(hours=campaign.recontact_hours)
+    ).values_list('lead_id', flat=True)) if campaign.recontact_hours else set()
+
+    claimed = []
+    changed = []
+    owners_free = {}
+    for entry in pending:
+        if len(claimed) >= wanted:
+            break
+        if entry.lead_id in in_call or entry.lead_id in recent:
+            entry.status = DialerCampaignEntry.Status.SKIPPED
+            entry.note = 'Lead is in a call' if entry.lead_id in in_call else 'Lead was called recently'
+            entry.finished_at = now
+            changed.append(entry)
+            continue
+        if agent_ids:
+            agent_id = max(free, key=free.get)
+            if free[agent_id] <= 0:
+                break
+            free[agent_id] -= 1
+        else:
+            # No agent pool: each lead is dialed for its own agent
+            agent_id = entry.lead.agent_id
+            owners_free.setdefault(agent_id, slots_per_agent - agent_busy.get(agent_id, 0))
+            if owners_free[agent_id] <= 0:
+                continue
+            owners_free[agent_id] -= 1
+        entry.status = DialerCampaignEntry.Status.DIALING
+        entry.agent_id = agent_id
+        entry.dialed_at = now
+        claimed.append(entry)
+        changed.append(entry)
+
+    DialerCampaignEntry.objects.bulk_update(changed, ['status', 'agent', 'note', 'dialed_at', 'finished_at'])
+    return claimed, len(changed) - len(claimed)
+
+
+def run_campaign_tick(campaign):
+    """
+    Run one pacing step of a running campaign
+
+    Finished calls are recorded, then as many leads are claimed as agent and
+    provider capacity allow: each agent gets calls_per_agent slots multiplied
+    by the dial ratio, and the provider at most its max_concurrent_calls.
+    Leads already in a call or called within recontact_hours are skipped.
+    Claiming happens under a SKIP LOCKED lock on the campaign, so concurrent
+    workers never double-dial; the calls themselves are placed after commit.
+
+    Args:
+        campaign: DialerCampaign instance
+
+    Returns:
+        Dictionary with counts of finished, dialed, failed and skipped entries
+    """
+    stats = {'finished': 0, 'dialed': 0, 'failed': 0, 'skipped': 0}
+    telephony_config = get_default_telephony_config()
+    now = timezone.now()
+
+    with transaction.atomic():
+        locked = DialerCampaign.objects.select_for_update(skip_locked=True).filter(
+            pk=campaign.pk, status=DialerCampaign.Status.RUNNING
+        ).first()
+        if locked is None:
+            return stats
+        stats['finished'] = sync_campaign_outcomes(locked, now)
+        claimed, stats['skipped'] = _claim_entries(locked, telephony_config, now) if telephony_config else ([], 0)
+
+        if not claimed and not DialerCampaignEntry.objects.filter(
+            campaign=locked, status__in=[DialerCampaignEntry.Status.PENDING, DialerCampaignEntry.Status.DIALING]
+        ).exists():
+            locked.status = DialerCampaign.Status.COMPLETED
+            locked.completed_at = now
+            locked.save(update_fields=['status', 'completed_at', 'updated_at'])
+            return stats
+
+    agents = Agent.objects.in_bulk({entry.agent_id for entry in claimed}) if claimed else {}
+    for entry in claimed:
+        try:
+            entry.call_log = initiate_outbound_call(
+                to_number=entry.lead.phone,
+                lead=entry.lead,
+                agent=agents.get(entry.agent_id),
+                telephony_config=telephony_config,
+            )
+            stats['dialed'] += 1
+        except Exception as e:
+            logger.warning(f"Dialer campaign {locked.pk} could not call lead {entry.lead_id}: {e}")
+            entry.status = DialerCampaignEntry.Status.FAILED
+            entry.note = str(e)[:255]
+            entry.finished_at = timezone.now()
+            stats['failed'] += 1
+    DialerCampaignEntry.objects.bulk_update(claimed, ['call_log', 'status', 'note', 'finished_at'])
+    return stats
+
+
+def run_dialer(campaign_ids=None):
+    """
+    Run one tick of every running campaign
+
+    Returns:
+        Dictionary of campaign id -> tick stats
+    """
+    campaigns = DialerCampaign.objects.filter(status=DialerCampaign.Status.RUNNING)
+    if campaign_ids is not None:
+        campaigns = campaigns.filter(pk__in=campaign_ids)
+    return {campaign.pk: run_campaign_tick(campaign) for campaign in campaigns.order_by('id')}
+
+
+def get_campaign_stats(campaign):
+    """Entry counts per status, answer rate and current dial ratio for a campaign"""
+    counts = dict(DialerCampaignEntry.objects.filter(campaign=campaign).order_by().values('status').annotate(
+        total=Count('id')
+    ).values_list('status', 'total'))
+    completed = counts.get(DialerCampaignEntry.Status.COMPLETED, 0)
+    answered = DialerCampaignEntry.objects.filter(
+        campaign=campaign, status=DialerCampaignEntry.Status.COMPLETED, answered=True
+    ).count()
+    return {
+        'entries': {status_value: counts.get(status_value, 0) for status_value in DialerCampaignEntry.Status.values},
+        'answer_rate': round(answered * 100 / completed, 2) if completed else None,
+        'dial_ratio': round(get_dial_ratio(campaign), 2),
+    }
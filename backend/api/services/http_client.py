@@ -0,0 +1,238 @@
+"""
+Provider HTTP Client
+Pooled, timeout-bounded HTTP sessions for telephony, messaging and webhook providers,
+with bounded retries, a circuit breaker and latency metrics per provider
+"""
+from django.conf import settings
+from collections import deque
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ReadTimeoutError
+from urllib3.util.retry import Retry
+import logging
+import requests
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable per provider with settings.PROVIDER_HTTP = {'exotel': {'read_timeout': 20}, ...}
+DEFAULT_PROVIDER_HTTP = {
+    'connect_timeout': 3.05,
+    'read_timeout': 10,
+    'retries': 2,
+    'backoff_factor': 0.3,
+    'pool_maxsize': 10,
+    'failure_threshold': 5,
+    'reset_timeout': 30,
+}
+
+# Responses retried for idempotent methods; POST is only retried when the connection failed
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# Latency samples kept per provider for percentiles
+LATENCY_WINDOW = 500
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling a provider whose circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+
+    After failure_threshold failures in a row the circuit opens and calls fail
+    fast for reset_timeout seconds. Then a single trial call is let through:
+    success closes the circuit, failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        """Return True if a call may go through now"""
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class ProviderClient:
+    """HTTP client for one provider: a keep-alive connection pool plus timeouts, retries, breaker and metrics"""
+
+    def __init__(self, name, **options):
+        self.name = name
+        self.options = {**DEFAULT_PROVIDER_HTTP, **options}
+        self.timeout = (self.options['connect_timeout'], self.options['read_timeout'])
+        self.breaker = CircuitBreaker(self.options['failure_threshold'], self.options['reset_timeout'])
+
+        retry = Retry(
+            total=self.options['retries'],
+            connect=self.options['retries'],
+            read=0,
+            status=self.options['retries'],
+            status_forcelist=RETRY_STATUSES,
+            backoff_factor=self.options['backoff_factor'],
+            respect_retry_after_header=False,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.options['pool_maxsize'], max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._metrics_lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._counts = {'requests': 0, 'errors': 0, 'server_errors': 0, 'short_circuited': 0}
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request through the provider's pool
+
+        Args:
+            method: HTTP method
+            url: Request URL
+            **kwargs: Passed to requests (json, params, headers, ...); timeout defaults to the provider's
+
+        Returns:
+            requests.Response
+
+        Raises:
+            CircuitOpenError: If the provider's circuit is open
+            requests.RequestException: On connection errors and timeouts (after retries)
+        """
+        if not self.breaker.allow():
+            with self._metrics_lock:
+                self._counts['short_circuited'] += 1
+            raise CircuitOpenError(f"{self.name} circuit is open, not calling {url}")
+
+        kwargs.setdefault('timeout', self.timeout)
+        started = time.perf_counter()
+        try:
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.ConnectionError as exc:
+                # With read retries disabled urllib3 reports a read timeout as exhausted retries
+                cause = exc.args[0] if exc.args else None
+                if isinstance(cause, MaxRetryError) and isinstance(cause.reason, ReadTimeoutError):
+                    raise requests.ReadTimeout(cause.reason, request=exc.request) from exc
+                raise
+        except Exception:
+            # Any exception counts, so a failed half-open trial never leaves the circuit waiting on it
+            self._record(time.perf_counter() - started, error=True)
+            self.breaker.record_failure()
+            logger.warning(f"{self.name} {method} {url} failed", exc_info=True)
+            raise
+
+        server_error = response.status_code >= 500
+        self._record(time.perf_counter() - started, server_error=server_error)
+        if server_error:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def _record(self, elapsed, error=False, server_error=False):
+        with self._metrics_lock:
+            self._counts['requests'] += 1
+            self._counts['errors'] += error
+            self._counts['server_errors'] += server_error
+            self._latencies.append(elapsed)
+
+    def metrics(self):
+        """Request counts, breaker state and latency percentiles (milliseconds) over the recent window"""
+        with self._metrics_lock:
+            latencies = sorted(self._latencies)
+            counts = dict(self._counts)
+
+        def percentile(fraction):
+            if not latencies:
+                return None
+            return round(latencies[min(int(len(latencies) * fraction), len(latencies) - 1)] * 1000, 2)
+
+        return {
+            **counts,
+            'circuit': self.breaker.state,
+            'latency_ms': {'p50': percentile(0.5), 'p95': percentile(0.95), 'p99': percentile(0.99),
+                           'max': percentile(1)},
+        }
+
+    def close(self):
+        self.session.close()
+
+
+def get_client(provider):
+    """
+    Get the shared client for a provider, created on first use
+
+    Args:
+        provider: Provider name, e.g. 'exotel', 'meta_whatsapp', 'webhook'
+
+    Returns:
+        ProviderClient
+    """
+    provider = provider.lower()
+    client = _clients.get(provider)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(provider)
+            if client is None:
+                options = getattr(settings, 'PROVIDER_HTTP', {}).get(provider, {})
+                client = _clients[provider] = ProviderClient(provider, **options)
+    return client
+
+
+def get_http_metrics():
+    """Metrics of every provider client used by this process"""
+    return {name: client.metrics() for name, client in sorted(_clients.items())}
+
+
+def reset_clients():
+    """Close and drop all clients (settings changes, tests)"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -3,6 +3,7 @@ Email Integration Service
 Supports SMTP, SendGrid, and AWS SES
 """
 from ..models import IntegrationConfig
+from ..provider_registry import get_integration_config, get_provider_client
 
 
 def send_email(to, subject, body, html_body=None, attachments=None, integration_config=None):
@@ -21,10 +22,7 @@ def send_email(to, subject, body, html_body=None, attachments=None, integration_
         Boolean indicating success
     """
     if not integration_config:
-        integration_config = IntegrationConfig.objects.filter(
-            type=IntegrationConfig.IntegrationType.EMAIL,
-            is_enabled=True
-        ).first()
+        integration_config = get_integration_config(IntegrationConfig.IntegrationType.EMAIL)
     
     if not integration_config:
         # Fallback to Django's default email backend
@@ -70,7 +68,9 @@ def send_via_sendgrid(to, subject, body, html_body, attachments, config):
         import sendgrid
         from sendgrid.helpers.mail import Mail, Attachment
         
-        sg = sendgrid.SendGridAPIClient(api_key=config.get('api_key'))
+        sg = get_provider_client(
+            'sendgrid', (config.get('api_key'),), lambda: sendgrid.SendGridAPIClient(api_key=config.get('api_key'))
+        )
         
         message = Mail(
             from_email=config.get('from_email'),
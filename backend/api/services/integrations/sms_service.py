@@ -3,6 +3,8 @@ SMS Integration Service
 Supports Twilio and Textlocal
 """
 from ..models import IntegrationConfig
+from ..provider_registry import get_integration_config, get_twilio_client
+from ..http_client import get_client
 
 
 def send_sms(to, message, integration_config=None):
@@ -18,10 +20,7 @@ def send_sms(to, message, integration_config=None):
         Boolean indicating success
     """
     if not integration_config:
-        integration_config = IntegrationConfig.objects.filter(
-            type=IntegrationConfig.IntegrationType.SMS,
-            is_enabled=True
-        ).first()
+        integration_config = get_integration_config(IntegrationConfig.IntegrationType.SMS)
     
     if not integration_config:
         return False
@@ -40,9 +39,7 @@ def send_sms(to, message, integration_config=None):
 def send_via_twilio(to, message, config):
     """Send SMS via Twilio"""
     try:
-        from twilio.rest import Client
-        
-        client = Client(config.get('account_sid'), config.get('auth_token'))
+        client = get_twilio_client(config.get('account_sid'), config.get('auth_token'))
         
         message = client.messages.create(
             body=message,
@@ -58,8 +55,6 @@ def send_via_twilio(to, message, config):
 def send_via_textlocal(to, message, config):
     """Send SMS via Textlocal"""
     try:
-        import requests
-        
         url = "https://api.textlocal.in/send/"
         params = {
             'apikey': config.get('api_key'),
@@ -68,7 +63,7 @@ def send_via_textlocal(to, message, config):
             'sender': config.get('sender_id', 'TXTLCL')
         }
         
-        response = requests.get(url, params=params)
+        response = get_client('textlocal').get(url, params=params)
         return response.status_code == 200
     except Exception as e:
         print(f"Textlocal error: {e}")
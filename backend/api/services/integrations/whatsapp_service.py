@@ -3,6 +3,8 @@ WhatsApp Integration Service
 Supports Meta WhatsApp Cloud API
 """
 from ..models import IntegrationConfig
+from ..provider_registry import get_integration_config
+from ..http_client import get_client
 
 
 def send_whatsapp(to, message, template_name=None, template_params=None, integration_config=None):
@@ -20,10 +22,7 @@ def send_whatsapp(to, message, template_name=None, template_params=None, integra
         Boolean indicating success
     """
     if not integration_config:
-        integration_config = IntegrationConfig.objects.filter(
-            type=IntegrationConfig.IntegrationType.WHATSAPP,
-            is_enabled=True
-        ).first()
+        integration_config = get_integration_config(IntegrationConfig.IntegrationType.WHATSAPP)
     
     if not integration_config:
         return False
@@ -40,8 +39,6 @@ def send_whatsapp(to, message, template_name=None, template_params=None, integra
 def send_via_meta_whatsapp(to, message, template_name, template_params, config):
     """Send WhatsApp message via Meta Cloud API"""
     try:
-        import requests
-        
         url = f"https://graph.facebook.com/v18.0/{config.get('phone_number_id')}/messages"
         headers = {
             'Authorization': f"Bearer {config.get('access_token')}",
@@ -69,7 +66,7 @@ def send_via_meta_whatsapp(to, message, template_name, template_params, config):
                 'text': {'body': message}
             }
         
-        response = requests.post(url, json=payload, headers=headers)
+        response = get_client('meta_whatsapp').post(url, json=payload, headers=headers)
         return response.status_code == 200
     except Exception as e:
         print(f"Meta WhatsApp error: {e}")
@@ -2,9 +2,12 @@
 Invoice Generation Service
 Handles PDF generation, email sending, and automated invoice creation
 """
+from django.db import transaction
 from django.utils import timezone
-from datetime import timedelta
-from ..models import Invoice, Deal, PaymentPlan, InvoiceTemplate
+from datetime import date, timedelta
+from decimal import Decimal
+from ..models import Invoice, Deal, PaymentPlan, InvoiceTemplate, GSTConfiguration, TaxBreakdown
+from .tax_service import build_tax_breakdowns
 import uuid
 
 
@@ -20,7 +23,10 @@ def create_invoice_from_deal(deal, trigger_point='Deal Closed', tax_config=None)
     Args:
         deal: Deal instance
         trigger_point: One of Invoice.TriggerPoint choices
-        tax_config: Dictionary with tax configuration
+        tax_config: Dictionary with tax configuration. With a 'property_type' the GST
+            rate is resolved from GSTConfiguration for each entry of 'charges'
+            ([{'charge_type', 'amount'}], defaults to the deal value as Base Price)
+            and 'inter_state' selects IGST; a plain 'rate' is applied as-is.
     
     Returns:
         Invoice instance
@@ -45,7 +51,11 @@ def create_invoice_from_deal(deal, trigger_point='Deal Closed', tax_config=None)
     # Calculate amounts
     amount = deal.deal_value
     tax_amount = 0
-    if tax_config:
+    breakdowns = []
+    if tax_config and tax_config.get('property_type'):
+        breakdowns = build_tax_breakdowns(gst_lines_from_config(None, amount, tax_config))
+        tax_amount = sum((breakdown.total_tax for breakdown in breakdowns), Decimal('0'))
+    elif tax_config:
         # Calculate tax based on configuration
         tax_rate = tax_config.get('rate', 0)
         tax_amount = amount * (tax_rate / 100)
@@ -59,22 +69,93 @@ def create_invoice_from_deal(deal, trigger_point='Deal Closed', tax_config=None)
     due_date = timezone.now().date() + timedelta(days=30)
     
     # Create invoice
-    invoice = Invoice.objects.create(
-        invoice_number=invoice_number,
-        deal=deal,
-        client=client,
-        amount=amount,
-        tax_amount=tax_amount,
-        total_amount=total_amount,
-        due_date=due_date,
-        status=Invoice.Status.DRAFT,
-        trigger_point=trigger_point,
-        tax_config=tax_config or {}
-    )
+    with transaction.atomic():
+        invoice = Invoice.objects.create(
+            invoice_number=invoice_number,
+            deal=deal,
+            client=client,
+            amount=amount,
+            tax_amount=tax_amount,
+            total_amount=total_amount,
+            due_date=due_date,
+            status=Invoice.Status.DRAFT,
+            trigger_point=trigger_point,
+            tax_config=tax_config or {}
+        )
+        
+        if breakdowns:
+            for breakdown in breakdowns:
+                breakdown.invoice = invoice
+            TaxBreakdown.objects.bulk_create(breakdowns)
     
     return invoice
 
 
+def gst_lines_from_config(invoice, amount, tax_config):
+    """
+    Build tax engine lines for an invoice from its tax configuration
+    
+    Args:
+        invoice: Invoice instance (None while the invoice is being built)
+        amount: Taxable amount used when no charges are listed
+        tax_config: Dictionary with property_type and optional charges, inter_state, on_date
+    
+    Returns:
+        List of line dictionaries for tax_service.build_tax_breakdowns
+    """
+    on_date = tax_config.get('on_date')
+    if isinstance(on_date, str):
+        on_date = date.fromisoformat(on_date)
+    charges = tax_config.get('charges') or [
+        {'charge_type': GSTConfiguration.ChargeType.BASE_PRICE, 'amount': amount}
+    ]
+    return [{
+        'invoice': invoice,
+        'property_type': tax_config['property_type'],
+        'charge_type': charge['charge_type'],
+        'base_amount': charge['amount'],
+        'inter_state': tax_config.get('inter_state', False),
+        'on_date': on_date,
+    } for charge in charges]
+
+
+@transaction.atomic
+def apply_gst_to_invoices(invoices):
+    """
+    Compute GST for a batch of invoices from their tax_config
+    
+    Rates come from the in-memory GST index, breakdowns are written with one
+    bulk insert and invoice totals with one bulk update. Existing breakdowns of
+    the invoices are replaced.
+    
+    Args:
+        invoices: List of Invoice instances with tax_config['property_type'] set
+    
+    Returns:
+        List of created TaxBreakdown instances
+    """
+    invoices = [invoice for invoice in invoices if (invoice.tax_config or {}).get('property_type')]
+    if not invoices:
+        return []
+    
+    lines = []
+    for invoice in invoices:
+        lines.extend(gst_lines_from_config(invoice, invoice.amount, invoice.tax_config))
+    breakdowns = build_tax_breakdowns(lines)
+    
+    tax_by_invoice = {}
+    for breakdown in breakdowns:
+        tax_by_invoice[breakdown.invoice.pk] = tax_by_invoice.get(breakdown.invoice.pk, Decimal('0')) + breakdown.total_tax
+    for invoice in invoices:
+        invoice.tax_amount = tax_by_invoice.get(invoice.pk, Decimal('0'))
+        invoice.total_amount = invoice.amount + invoice.tax_amount
+    
+    TaxBreakdown.objects.filter(invoice__in=invoices).delete()
+    TaxBreakdown.objects.bulk_create(breakdowns)
+    Invoice.objects.bulk_update(invoices, ['tax_amount', 'total_amount'])
+    return breakdowns
+
+
 def generate_invoice_pdf(invoice, template=None):
     """
     Generate PDF from invoice using template
@@ -0,0 +1,77 @@
+"""
+Keyword Matcher
+Case-insensitive multi-keyword matching with an Aho-Corasick automaton: one pass over the text finds every keyword
+"""
+from collections import deque
+
+
+class KeywordMatcher:
+    """
+    Finds which of a list of keywords occur in a text, as substrings and ignoring case
+
+    The automaton is built once; matching walks the text a single time, so its
+    cost depends on the text length and not on the number of keywords.
+    Instances are immutable after construction and safe to share between threads.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = tuple(keyword.lower() for keyword in keywords)
+        # Keywords matching any text (empty strings), as `'' in text` would
+        self._always = frozenset(index for index, keyword in enumerate(self.keywords) if not keyword)
+
+        goto = [{}]
+        outputs = [set()]
+        for index, keyword in enumerate(self.keywords):
+            state = 0
+            for char in keyword:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = goto[state][char] = len(goto)
+                    goto.append({})
+                    outputs.append(set())
+                state = next_state
+            if keyword:
+                outputs[state].add(index)
+
+        # Breadth-first: each state's failure link points to its longest proper suffix in the trie
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                outputs[next_state] |= outputs[fail[next_state]]
+
+        self._goto = goto
+        self._fail = fail
+        self._outputs = [frozenset(output) for output in outputs]
+
+    def find(self, text):
+        """
+        Args:
+            text: Text to search
+
+        Returns:
+            Set of indices (into keywords) of the keywords found in text
+        """
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        found = set(self._always)
+        state = 0
+        for char in (text or '').lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                found |= outputs[state]
+        return found
+
+    def first(self, text):
+        """Index of the earliest listed keyword found in text, or None"""
+        found = self.find(text)
+        return min(found) if found else None
@@ -0,0 +1,403 @@
+"""
+Ledger Posting Service
+Posts payments, booking payments, refunds and credit notes to the customer,
+unit and project ledgers while keeping running account balances
+"""
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value, Window
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from ..models import Ledger, LedgerAccount, LedgerCheckpoint, Unit
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Source document types recorded on ledger entries
+SOURCE_PAYMENT = 'Payment'
+SOURCE_BOOKING_PAYMENT = 'BookingPayment'
+SOURCE_REFUND = 'Refund'
+SOURCE_CREDIT_NOTE = 'CreditNote'
+
+# Lower bound used when an account has no checkpoint yet
+LEDGER_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+AMOUNT_FIELD = DecimalField(max_digits=14, decimal_places=2)
+
+# Net movement of an entry on its account balance
+ENTRY_AMOUNT = ExpressionWrapper(F('debit') - F('credit'), output_field=AMOUNT_FIELD)
+
+
+def get_account_key(ledger_type, object_id):
+    """Build the unique key of a ledger account, e.g. "Customer:12" """
+    return f"{ledger_type}:{object_id}"
+
+
+def payment_posting(payment):
+    """
+    Build the ledger posting for an invoice payment (credit)
+
+    Args:
+        payment: Payment instance
+
+    Returns:
+        Posting dictionary for post_documents
+    """
+    invoice = payment.invoice
+    return {
+        'source_type': SOURCE_PAYMENT,
+        'source_id': payment.pk,
+        'transaction_type': 'Payment',
+        'transaction_date': payment.payment_date,
+        'reference_number': payment.payment_id,
+        'description': f"Payment {payment.payment_id} against invoice {invoice.invoice_number}",
+        'debit': Decimal('0'),
+        'credit': payment.amount,
+        'customer_id': invoice.client_id,
+        'unit_id': invoice.unit_id,
+        'project_id': invoice.project_id,
+    }
+
+
+def booking_payment_posting(booking):
+    """
+    Build the ledger posting for a booking payment (credit)
+
+    Args:
+        booking: BookingPayment instance
+
+    Returns:
+        Posting dictionary for post_documents
+    """
+    return {
+        'source_type': SOURCE_BOOKING_PAYMENT,
+        'source_id': booking.pk,
+        'transaction_type': 'Booking',
+        'transaction_date': booking.payment_date,
+        'reference_number': booking.booking_id,
+        'description': f"Booking amount {booking.booking_id}",
+        'debit': Decimal('0'),
+        'credit': booking.amount,
+        'customer_id': booking.client_id,
+        'unit_id': booking.unit_id,
+        'project_id': None,
+    }
+
+
+def refund_posting(refund):
+    """
+    Build the ledger posting for a processed refund (debit of the net refund)
+
+    Args:
+        refund: Refund instance
+
+    Returns:
+        Posting dictionary for post_documents
+    """
+    unit_id = None
+    project_id = None
+    if refund.booking_payment_id:
+        unit_id = refund.booking_payment.unit_id
+    elif refund.payment_id:
+        unit_id = refund.payment.invoice.unit_id
+        project_id = refund.payment.invoice.project_id
+
+    return {
+        'source_type': SOURCE_REFUND,
+        'source_id': refund.pk,
+        'transaction_type': 'Refund',
+        'transaction_date': refund.processed_at or timezone.now(),
+        'reference_number': refund.refund_id,
+        'description': f"Refund {refund.refund_id} ({refund.reason})",
+        'debit': refund.net_refund_amount,
+        'credit': Decimal('0'),
+        'customer_id': refund.deal.client_id,
+        'unit_id': unit_id,
+        'project_id': project_id,
+    }
+
+
+def credit_note_posting(credit_note):
+    """
+    Build the ledger posting for a credit note (credit)
+
+    Args:
+        credit_note: CreditNote instance
+
+    Returns:
+        Posting dictionary for post_documents
+    """
+    invoice = credit_note.applied_to_invoice
+    return {
+        'source_type': SOURCE_CREDIT_NOTE,
+        'source_id': credit_note.pk,
+        'transaction_type': 'Credit Note',
+        'transaction_date': credit_note.created_at or timezone.now(),
+        'reference_number': credit_note.credit_note_number,
+        'description': f"Credit note {credit_note.credit_note_number}",
+        'debit': Decimal('0'),
+        'credit': credit_note.amount,
+        'customer_id': credit_note.deal.client_id or (invoice.client_id if invoice else None),
+        'unit_id': invoice.unit_id if invoice else None,
+        'project_id': invoice.project_id if invoice else None,
+    }
+
+
+def _posting_accounts(posting):
+    """Return (ledger_type, field, object_id) for every account a posting touches"""
+    targets = [
+        (Ledger.LedgerType.CUSTOMER, 'customer_id', posting['customer_id']),
+        (Ledger.LedgerType.UNIT, 'unit_id', posting['unit_id']),
+        (Ledger.LedgerType.PROJECT, 'project_id', posting['project_id']),
+    ]
+    return [target for target in targets if target[2]]
+
+
+def _lock_accounts(postings):
+    """
+    Get or create the ledger accounts used by the postings and lock them
+
+    Accounts are locked in account_key order so concurrent posters never deadlock.
+
+    Returns:
+        Dictionary of account_key -> locked LedgerAccount
+    """
+    wanted = {}
+    for posting in postings:
+        for ledger_type, field, object_id in _posting_accounts(posting):
+            wanted[get_account_key(ledger_type, object_id)] = (ledger_type, field, object_id)
+
+    if not wanted:
+        return {}
+
+    existing = set(LedgerAccount.objects.filter(account_key__in=wanted.keys()).values_list('account_key', flat=True))
+    missing = [
+        LedgerAccount(account_key=key, ledger_type=ledger_type, **{field: object_id})
+        for key, (ledger_type, field, object_id) in wanted.items() if key not in existing
+    ]
+    if missing:
+        LedgerAccount.objects.bulk_create(missing, ignore_conflicts=True)
+
+    accounts = LedgerAccount.objects.select_for_update().filter(
+        account_key__in=wanted.keys()
+    ).order_by('account_key')
+    return {account.account_key: account for account in accounts}
+
+
+@transaction.atomic
+def post_documents(postings):
+    """
+    Post source documents to their customer, unit and project ledgers
+
+    All entries are written with a single multi-row insert and the running
+    balance of each touched account is updated under a row lock. Documents that
+    were already posted are skipped, so posting is idempotent.
+
+    Args:
+        postings: List of posting dictionaries (see payment_posting etc.)
+
+    Returns:
+        List of created Ledger entries
+    """
+    postings = [posting for posting in postings if posting['source_id']]
+    if not postings:
+        return []
+
+    # Derive projects from units in one query where the document has no project
+    unit_ids = {posting['unit_id'] for posting in postings if posting['unit_id'] and not posting['project_id']}
+    if unit_ids:
+        unit_projects = dict(Unit.objects.filter(pk__in=unit_ids).values_list('id', 'floor__tower__project_id'))
+        for posting in postings:
+            if posting['unit_id'] and not posting['project_id']:
+                posting['project_id'] = unit_projects.get(posting['unit_id'])
+
+    accounts = _lock_accounts(postings)
+
+    # Checked after the account locks are held so concurrent posters see each other's entries
+    source_ids = {}
+    for posting in postings:
+        source_ids.setdefault(posting['source_type'], set()).add(posting['source_id'])
+    already_posted = set()
+    for source_type, ids in source_ids.items():
+        already_posted.update(
+            (source_type, source_id) for source_id in Ledger.objects.filter(
+                source_type=source_type, source_id__in=ids
+            ).values_list('source_id', flat=True)
+        )
+
+    entries = []
+    touched = {}
+    postings.sort(key=lambda posting: posting['transaction_date'])
+    for posting in postings:
+        source = (posting['source_type'], posting['source_id'])
+        if source in already_posted:
+            continue
+        already_posted.add(source)
+
+        for ledger_type, field, object_id in _posting_accounts(posting):
+            account = accounts[get_account_key(ledger_type, object_id)]
+            account.balance += posting['debit'] - posting['credit']
+            touched[account.account_key] = account
+            entries.append(Ledger(
+                account=account,
+                ledger_type=ledger_type,
+                customer_id=account.customer_id,
+                unit_id=account.unit_id,
+                project_id=account.project_id,
+                transaction_date=posting['transaction_date'],
+                transaction_type=posting['transaction_type'],
+                reference_number=posting['reference_number'],
+                description=posting['description'],
+                debit=posting['debit'],
+                credit=posting['credit'],
+                balance=account.balance,
+                source_type=posting['source_type'],
+                source_id=posting['source_id'],
+            ))
+
+    if entries:
+        Ledger.objects.bulk_create(entries)
+        _invalidate_checkpoints(entries)
+        now = timezone.now()
+        for account in touched.values():
+            account.updated_at = now
+        LedgerAccount.objects.bulk_update(touched.values(), ['balance', 'updated_at'])
+        logger.info(f"Posted {len(entries)} ledger entries to {len(touched)} accounts")
+
+    return entries
+
+
+def _invalidate_checkpoints(entries):
+    """Drop checkpoints that a back-dated entry falls before, they no longer hold the right balance"""
+    earliest = {}
+    for entry in entries:
+        current = earliest.get(entry.account_id)
+        if current is None or entry.transaction_date < current:
+            earliest[entry.account_id] = entry.transaction_date
+
+    stale = Q()
+    for account_id, transaction_date in earliest.items():
+        stale |= Q(account_id=account_id, as_of__gt=transaction_date)
+    deleted, _ = LedgerCheckpoint.objects.filter(stale).delete()
+    if deleted:
+        logger.info(f"Removed {deleted} ledger checkpoints invalidated by back-dated entries")
+
+
+def post_payment(payment):
+    """Post an invoice payment to the ledgers"""
+    return post_documents([payment_posting(payment)])
+
+
+def post_payments(payments):
+    """Post several invoice payments to the ledgers in one batch"""
+    return post_documents([payment_posting(payment) for payment in payments])
+
+
+def post_booking_payment(booking):
+    """Post a received booking payment to the ledgers"""
+    return post_documents([booking_payment_posting(booking)])
+
+
+def post_refund(refund):
+    """Post a processed refund to the ledgers"""
+    return post_documents([refund_posting(refund)])
+
+
+def post_credit_note(credit_note):
+    """Post a credit note to the ledgers"""
+    return post_documents([credit_note_posting(credit_note)])
+
+
+def get_balance_before(account, before):
+    """
+    Get the balance of an account from all entries dated before a moment
+
+    Starts from the nearest checkpoint so only entries since then are summed.
+
+    Args:
+        account: LedgerAccount instance
+        before: Aware datetime
+
+    Returns:
+        Decimal balance (debit minus credit)
+    """
+    checkpoint = account.checkpoints.filter(as_of__lte=before).order_by('-as_of').first()
+    entries = account.entries.filter(transaction_date__lt=before)
+    opening = Decimal('0')
+    if checkpoint:
+        entries = entries.filter(transaction_date__gte=checkpoint.as_of)
+        opening = checkpoint.balance
+
+    movement = entries.aggregate(total=Sum(ENTRY_AMOUNT))['total'] or Decimal('0')
+    return opening + movement
+
+
+def get_statement(account, start=None, end=None):
+    """
+    Get statement entries for an account with running balances
+
+    The running balance is computed in the database with a window function
+    seeded with the opening balance, so the queryset can be paginated.
+
+    Args:
+        account: LedgerAccount instance
+        start: Optional aware datetime, entries on or after it are included
+        end: Optional aware datetime, entries before it are included
+
+    Returns:
+        Tuple of (opening balance, queryset of Ledger annotated with running_balance)
+    """
+    queryset = account.entries.all()
+    opening = Decimal('0')
+    if start:
+        opening = get_balance_before(account, start)
+        queryset = queryset.filter(transaction_date__gte=start)
+    if end:
+        queryset = queryset.filter(transaction_date__lt=end)
+
+    queryset = queryset.annotate(
+        running_balance=ExpressionWrapper(
+            Value(opening, output_field=AMOUNT_FIELD) + Window(
+                expression=Sum(ENTRY_AMOUNT),
+                order_by=[F('transaction_date').asc(), F('id').asc()],
+            ),
+            output_field=AMOUNT_FIELD,
+        )
+    ).order_by('transaction_date', 'id')
+    return opening, queryset
+
+
+def create_checkpoints(as_of):
+    """
+    Snapshot the balance of every ledger account as of a moment
+
+    Each account's balance is its latest earlier checkpoint plus the entries
+    since, computed for all accounts in a single query.
+
+    Args:
+        as_of: Aware datetime, entries dated before it are included
+
+    Returns:
+        Number of checkpoints created
+    """
+    previous = LedgerCheckpoint.objects.filter(account=OuterRef('pk'), as_of__lte=as_of).order_by('-as_of')
+    movement = Ledger.objects.filter(
+        account=OuterRef('pk'),
+        transaction_date__lt=as_of,
+        transaction_date__gte=OuterRef('previous_as_of'),
+    ).order_by().values('account').annotate(total=Sum(ENTRY_AMOUNT)).values('total')
+
+    accounts = LedgerAccount.objects.annotate(
+        previous_as_of=Coalesce(Subquery(previous.values('as_of')[:1]), Value(LEDGER_EPOCH)),
+        previous_balance=Coalesce(Subquery(previous.values('balance')[:1]), Value(Decimal('0')), output_field=AMOUNT_FIELD),
+        movement=Coalesce(Subquery(movement, output_field=AMOUNT_FIELD), Value(Decimal('0')), output_field=AMOUNT_FIELD),
+    ).values_list('id', 'previous_as_of', 'previous_balance', 'movement')
+
+    checkpoints = [
+        LedgerCheckpoint(account_id=account_id, as_of=as_of, balance=previous_balance + movement)
+        for account_id, previous_as_of, previous_balance, movement in accounts
+        if previous_as_of != as_of
+    ]
+    LedgerCheckpoint.objects.bulk_create(checkpoints, ignore_conflicts=True)
+    return len(checkpoints)
@@ -2,11 +2,37 @@
 Payment Tracking Service
 Handles payment reminders, overdue detection, and payment gateway integration
 """
+from django.db import transaction
+from django.db.models import Sum
 from django.utils import timezone
-from datetime import timedelta
-from ..models import Invoice, Payment, Installment, PaymentPlan
+from datetime import timedelta, datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+from ..models import Invoice, Payment, Installment, PaymentPlan, PaymentGatewayEvent, IntegrationConfig
+from .ledger_service import post_payment, post_payments
+from .provider_registry import get_enabled_integrations
+import hashlib
+import hmac
+import json
+import logging
 import uuid
 
+logger = logging.getLogger(__name__)
+
+# Number of inbox events a worker claims per batch
+GATEWAY_EVENT_BATCH_SIZE = 200
+
+# Pending events are retried this many times before being marked failed
+GATEWAY_EVENT_MAX_ATTEMPTS = 5
+
+# Stripe rejects signatures older than this many seconds
+STRIPE_SIGNATURE_TOLERANCE = 300
+
+# Provider event types that represent a captured payment
+GATEWAY_CAPTURE_EVENTS = {
+    PaymentGatewayEvent.Provider.RAZORPAY: {'payment.captured', 'order.paid'},
+    PaymentGatewayEvent.Provider.STRIPE: {'payment_intent.succeeded', 'checkout.session.completed'},
+}
+
 
 def generate_payment_id():
     """Generate unique payment ID"""
@@ -31,27 +57,35 @@ def record_payment(invoice, amount, method, transaction_id=None, reference_numbe
     """
     payment_id = generate_payment_id()
     
-    payment = Payment.objects.create(
-        payment_id=payment_id,
-        invoice=invoice,
-        amount=amount,
-        method=method,
-        transaction_id=transaction_id,
-        payment_date=timezone.now(),
-        reference_number=reference_number,
-        notes=notes,
-        created_by=created_by
-    )
-    
-    # Update invoice status
-    update_invoice_status(invoice)
+    with transaction.atomic():
+        payment = Payment.objects.create(
+            payment_id=payment_id,
+            invoice=invoice,
+            amount=amount,
+            method=method,
+            transaction_id=transaction_id,
+            payment_date=timezone.now(),
+            reference_number=reference_number,
+            notes=notes,
+            created_by=created_by
+        )
+        
+        post_payment(payment)
+        
+        # Update invoice status
+        update_invoice_status(invoice)
     
     return payment
 
 
 def update_invoice_status(invoice):
     """Update invoice status based on payments"""
-    paid_amount = invoice.paid_amount
+    apply_invoice_status(invoice, invoice.paid_amount)
+    invoice.save()
+
+
+def apply_invoice_status(invoice, paid_amount):
+    """Set invoice status from the amount paid so far (does not save)"""
     total_amount = invoice.total_amount
     
     if paid_amount >= total_amount:
@@ -62,8 +96,30 @@ def update_invoice_status(invoice):
         invoice.status = Invoice.Status.OVERDUE
     elif invoice.status == Invoice.Status.DRAFT:
         invoice.status = Invoice.Status.UNPAID
+
+
+def refresh_invoice_statuses(invoices):
+    """
+    Update status of several invoices with one aggregate query and one bulk update
     
-    invoice.save()
+    Args:
+        invoices: Iterable of Invoice instances
+    """
+    invoices = {invoice.id: invoice for invoice in invoices}
+    if not invoices:
+        return
+    
+    paid = dict(
+        Payment.objects.filter(invoice_id__in=invoices.keys())
+        .values('invoice_id')
+        .annotate(total=Sum('amount'))
+        .values_list('invoice_id', 'total')
+    )
+    
+    for invoice_id, invoice in invoices.items():
+        apply_invoice_status(invoice, paid.get(invoice_id) or 0)
+    
+    Invoice.objects.bulk_update(invoices.values(), ['status'])
 
 
 def send_payment_reminder(invoice):
@@ -106,18 +162,364 @@ def process_payment_gateway_callback(payment_gateway, transaction_data):
     """
     Process payment gateway callback/webhook
     
+    The event goes through the gateway event inbox, so a callback that was
+    already delivered by webhook is not posted twice.
+    
     Args:
         payment_gateway: Payment gateway name (razorpay, stripe, etc.)
-        transaction_data: Transaction data from gateway
+        transaction_data: Transaction data from gateway (dict with optional
+            'body', 'signature' and 'event_id' keys, or the raw body itself)
     
     Returns:
-        Payment instance
+        Payment instance or None
     """
-    # TODO: Implement payment gateway callback processing
-    # This should verify the transaction and create payment record
+    if isinstance(transaction_data, dict) and 'body' in transaction_data:
+        body = transaction_data['body']
+        signature = transaction_data.get('signature')
+        event_id = transaction_data.get('event_id')
+    else:
+        body = transaction_data
+        signature = None
+        event_id = None
+    
+    provider = normalize_gateway_provider(payment_gateway)
+    event_id = record_gateway_event(provider, body, signature=signature, event_id=event_id)
+    process_gateway_events(event_ids=[event_id])
+    
+    event = PaymentGatewayEvent.objects.select_related('payment').get(provider=provider, event_id=event_id)
+    return event.payment
+
+
+# ==================== PAYMENT GATEWAY EVENT INBOX ====================
+
+def normalize_gateway_provider(payment_gateway):
+    """Map a gateway name (any case) to PaymentGatewayEvent.Provider"""
+    for provider in PaymentGatewayEvent.Provider:
+        if provider.value.lower() == str(payment_gateway).strip().lower():
+            return provider
+    raise ValueError(f"Unsupported payment gateway: {payment_gateway}")
+
+
+def extract_gateway_event_id(provider, body, payload=None, header_event_id=None):
+    """
+    Get the provider's unique event ID
+    
+    Razorpay sends it in the X-Razorpay-Event-Id header, Stripe in the body.
+    Falls back to a hash of the body so identical retries still collapse.
+    """
+    if header_event_id:
+        return header_event_id
+    if provider == PaymentGatewayEvent.Provider.STRIPE and isinstance(payload, dict) and payload.get('id'):
+        return payload['id']
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return f"sha256:{hashlib.sha256(body).hexdigest()}"
+
+
+def record_gateway_event(provider, body, signature=None, event_id=None):
+    """
+    Persist a raw webhook event in the inbox
+    
+    This is the only work done on the request path: a single INSERT that is
+    silently skipped when the provider retries an event we already have.
+    
+    Args:
+        provider: PaymentGatewayEvent.Provider value
+        body: Raw request body (bytes or str)
+        signature: Signature header sent by the provider
+        event_id: Event ID header sent by the provider (optional)
+    
+    Returns:
+        Event ID under which the event was stored
+    """
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+    elif not isinstance(body, str):
+        body = json.dumps(body)
+    
+    try:
+        payload = json.loads(body) if body else {}
+    except ValueError:
+        payload = {}
+    
+    event_id = extract_gateway_event_id(provider, body, payload, header_event_id=event_id)
+    event_type = payload.get('event') or payload.get('type') if isinstance(payload, dict) else None
+    
+    PaymentGatewayEvent.objects.bulk_create([
+        PaymentGatewayEvent(
+            provider=provider,
+            event_id=event_id[:255],
+            event_type=(event_type or '')[:100] or None,
+            raw_body=body,
+            signature=(signature or '')[:500] or None,
+        )
+    ], ignore_conflicts=True)
+    
+    return event_id[:255]
+
+
+def get_gateway_webhook_secrets():
+    """Load webhook secrets for enabled payment gateways, keyed by provider"""
+    secrets = {}
+    for config in get_enabled_integrations(IntegrationConfig.IntegrationType.PAYMENT_GATEWAY):
+        try:
+            provider = normalize_gateway_provider(config.provider)
+        except ValueError:
+            continue
+        secret = (config.config or {}).get('webhook_secret')
+        if secret and provider not in secrets:
+            secrets[provider] = secret
+    return secrets
+
+
+def verify_gateway_signature(provider, body, signature, secret, now=None):
+    """
+    Verify webhook signature
+    
+    Razorpay: hex HMAC-SHA256 of the body.
+    Stripe: 't=<timestamp>,v1=<hex HMAC-SHA256 of "timestamp.body">'.
+    
+    Args:
+        now: When the webhook was received; Stripe timestamps must be within
+             STRIPE_SIGNATURE_TOLERANCE of it (defaults to the current time)
+    
+    Returns:
+        Boolean indicating a valid signature
+    """
+    if not signature or not secret:
+        return False
+    
+    key = secret.encode('utf-8')
+    body_bytes = body.encode('utf-8')
+    
+    if provider == PaymentGatewayEvent.Provider.RAZORPAY:
+        expected = hmac.new(key, body_bytes, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature)
+    
+    if provider == PaymentGatewayEvent.Provider.STRIPE:
+        parts = {}
+        for item in signature.split(','):
+            name, _, value = item.strip().partition('=')
+            parts.setdefault(name, []).append(value)
+        timestamp = (parts.get('t') or [None])[0]
+        if not timestamp or not timestamp.isdigit():
+            return False
+        now = now or timezone.now()
+        if abs(now.timestamp() - int(timestamp)) > STRIPE_SIGNATURE_TOLERANCE:
+            return False
+        signed = f"{timestamp}.".encode('utf-8') + body_bytes
+        expected = hmac.new(key, signed, hashlib.sha256).hexdigest()
+        return any(hmac.compare_digest(expected, candidate) for candidate in parts.get('v1', []))
+    
+    return False
+
+
+def _timestamp_to_datetime(value):
+    """Convert a unix timestamp from a gateway payload to an aware datetime"""
+    try:
+        return datetime.fromtimestamp(int(value), tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def _minor_units_to_amount(value):
+    """Convert paise/cents to a Decimal amount"""
+    try:
+        return (Decimal(int(value)) / 100).quantize(Decimal('0.01'))
+    except (TypeError, ValueError, InvalidOperation):
+        return None
+
+
+def parse_gateway_capture(provider, payload):
+    """
+    Extract captured payment details from a gateway event payload
+    
+    Returns:
+        Dictionary with transaction_id, amount, invoice_number, reference_number
+        and occurred_at, or None if the event is not a payment capture
+    """
+    event_type = payload.get('event') or payload.get('type')
+    if event_type not in GATEWAY_CAPTURE_EVENTS.get(provider, set()):
+        return None
+    
+    if provider == PaymentGatewayEvent.Provider.RAZORPAY:
+        entity = ((payload.get('payload') or {}).get('payment') or {}).get('entity') or {}
+        notes = entity.get('notes') or {}
+        return {
+            'transaction_id': entity.get('id'),
+            'amount': _minor_units_to_amount(entity.get('amount')),
+            'invoice_number': notes.get('invoice_number') if isinstance(notes, dict) else None,
+            'reference_number': entity.get('order_id'),
+            'occurred_at': _timestamp_to_datetime(entity.get('created_at') or payload.get('created_at')),
+        }
+    
+    obj = (payload.get('data') or {}).get('object') or {}
+    metadata = obj.get('metadata') or {}
+    if event_type == 'checkout.session.completed':
+        transaction_id = obj.get('payment_intent')
+        amount = obj.get('amount_total')
+    else:
+        transaction_id = obj.get('id')
+        amount = obj.get('amount_received', obj.get('amount'))
+    return {
+        'transaction_id': transaction_id,
+        'amount': _minor_units_to_amount(amount),
+        'invoice_number': metadata.get('invoice_number'),
+        'reference_number': obj.get('id'),
+        'occurred_at': _timestamp_to_datetime(payload.get('created') or obj.get('created')),
+    }
+
+
+def process_gateway_events(batch_size=GATEWAY_EVENT_BATCH_SIZE, event_ids=None):
+    """
+    Drain one batch of pending gateway events into Payment rows
+    
+    Claims pending events (skipping rows locked by other workers), verifies
+    signatures, drops duplicates (same event or same gateway transaction),
+    applies captures in provider event order and writes payments, invoice
+    statuses and event outcomes with bulk queries.
+    
+    Args:
+        batch_size: Maximum number of events to process
+        event_ids: Restrict the batch to these provider event IDs (optional)
+    
+    Returns:
+        Dictionary with counts per outcome
+    """
+    stats = {status_value: 0 for status_value in PaymentGatewayEvent.Status.values}
+    
+    with transaction.atomic():
+        queryset = PaymentGatewayEvent.objects.select_for_update(skip_locked=True).filter(
+            status=PaymentGatewayEvent.Status.PENDING
+        )
+        if event_ids is not None:
+            queryset = queryset.filter(event_id__in=event_ids)
+        events = list(queryset.order_by('received_at', 'id')[:batch_size])
+        
+        if not events:
+            return stats
+        
+        now = timezone.now()
+        secrets = get_gateway_webhook_secrets()
+        captures = []
+        
+        for event in events:
+            event.attempts += 1
+            event.last_error = None
+            try:
+                payload = json.loads(event.raw_body)
+            except ValueError:
+                payload = None
+            
+            if not isinstance(payload, dict):
+                event.status = PaymentGatewayEvent.Status.FAILED
+                event.last_error = 'Event body is not a JSON object'
+                continue
+            
+            secret = secrets.get(event.provider)
+            if not secret:
+                event.last_error = f"No webhook secret configured for {event.provider}"
+                if event.attempts >= GATEWAY_EVENT_MAX_ATTEMPTS:
+                    event.status = PaymentGatewayEvent.Status.FAILED
+                continue
+            
+            # Stripe's replay window is measured from arrival, so a worker backlog never rejects real events
+            if not verify_gateway_signature(
+                event.provider, event.raw_body, event.signature, secret, now=event.received_at
+            ):
+                event.status = PaymentGatewayEvent.Status.FAILED
+                event.last_error = 'Invalid webhook signature'
+                continue
+            
+            event.event_type = event.event_type or payload.get('event') or payload.get('type')
+            capture = parse_gateway_capture(event.provider, payload)
+            if capture is None:
+                event.status = PaymentGatewayEvent.Status.IGNORED
+                continue
+            
+            event.occurred_at = capture['occurred_at']
+            if not capture['transaction_id'] or capture['amount'] is None:
+                event.status = PaymentGatewayEvent.Status.FAILED
+                event.last_error = 'Capture event is missing transaction ID or amount'
+                continue
+            
+            captures.append((event, capture))
+        
+        # Apply captures in the order the provider produced them, not the order they arrived
+        captures.sort(key=lambda item: (item[1]['occurred_at'] or item[0].received_at, item[0].id))
+        
+        transaction_ids = {capture['transaction_id'] for _, capture in captures}
+        already_posted = dict(
+            Payment.objects.filter(transaction_id__in=transaction_ids).values_list('transaction_id', 'id')
+        )
+        invoices = Invoice.objects.in_bulk(
+            {capture['invoice_number'] for _, capture in captures if capture['invoice_number']},
+            field_name='invoice_number'
+        )
+        
+        new_payments = {}
+        for event, capture in captures:
+            transaction_id = capture['transaction_id']
+            if transaction_id in already_posted or transaction_id in new_payments:
+                event.status = PaymentGatewayEvent.Status.DUPLICATE
+                event.payment_id = already_posted.get(transaction_id)
+                continue
+            
+            invoice = invoices.get(capture['invoice_number'])
+            if not invoice:
+                event.status = PaymentGatewayEvent.Status.FAILED
+                event.last_error = f"Invoice not found: {capture['invoice_number']}"
+                continue
+            
+            new_payments[transaction_id] = (event, Payment(
+                payment_id=generate_payment_id(),
+                invoice=invoice,
+                amount=capture['amount'],
+                method=event.provider,
+                transaction_id=transaction_id,
+                payment_date=capture['occurred_at'] or event.received_at,
+                reference_number=capture['reference_number'],
+                notes=f"{event.provider} {event.event_type} {event.event_id}",
+            ))
+        
+        if new_payments:
+            # Another worker may be posting the same capture from a different event (e.g. Razorpay
+            # payment.captured and order.paid): the unique transaction ID lets only one insert through
+            Payment.objects.bulk_create([payment for _, payment in new_payments.values()], ignore_conflicts=True)
+            # Re-read to learn which inserts won; bulk_create does not return primary keys on every backend
+            posted = {
+                transaction_id: (payment_id, pk)
+                for transaction_id, payment_id, pk in Payment.objects.filter(
+                    transaction_id__in=new_payments.keys()
+                ).values_list('transaction_id', 'payment_id', 'id')
+            }
+            created = []
+            for transaction_id, (event, payment) in new_payments.items():
+                payment_id, pk = posted.get(transaction_id, (None, None))
+                event.payment_id = pk
+                if payment_id == payment.payment_id:
+                    event.status = PaymentGatewayEvent.Status.PROCESSED
+                    payment.pk = pk
+                    created.append(payment)
+                else:
+                    event.status = PaymentGatewayEvent.Status.DUPLICATE
+            
+            post_payments(created)
+            refresh_invoice_statuses(payment.invoice for payment in created)
+        
+        for event in events:
+            if event.status != PaymentGatewayEvent.Status.PENDING:
+                event.processed_at = now
+            stats[event.status] += 1
+        
+        PaymentGatewayEvent.objects.bulk_update(events, [
+            'status', 'attempts', 'last_error', 'event_type', 'occurred_at', 'payment', 'processed_at'
+        ])
+    
+    if stats[PaymentGatewayEvent.Status.FAILED]:
+        logger.warning(f"Payment gateway events failed: {stats[PaymentGatewayEvent.Status.FAILED]}")
     
-    # Placeholder implementation
-    return None
+    return stats
 
 
 def create_installments_from_payment_plan(payment_plan):
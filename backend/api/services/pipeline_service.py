@@ -0,0 +1,170 @@
+"""
+Pipeline Service
+Records deal stage / lead status transitions and computes funnel and velocity analytics
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Max, Value, When, Window
+from django.db.models.functions import Lead as NextValue
+from django.utils import timezone
+from datetime import datetime, timedelta
+from statistics import median
+from ..models import Deal, Lead, StageTransition
+
+# Model -> (entity type, stage field)
+STAGE_FIELDS = {
+    Deal: (StageTransition.EntityType.DEAL, 'stage'),
+    Lead: (StageTransition.EntityType.LEAD, 'status'),
+}
+
+# Funnel order per entity type; lead statuses outside the order (Rejected, Lost) are exits
+FUNNEL_STAGES = {
+    StageTransition.EntityType.DEAL: [stage for stage, _ in Deal.Stage.choices],
+    StageTransition.EntityType.LEAD: [
+        Lead.Status.NEW, Lead.Status.CONTACTED, Lead.Status.SITE_VISIT,
+        Lead.Status.NEGOTIATION, Lead.Status.APPROVED, Lead.Status.CLOSED,
+    ],
+}
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def record_transition(instance, from_stage, changed_by=None):
+    """
+    Append a transition for a deal or lead whose stage differs from from_stage
+
+    Returns:
+        StageTransition instance or None when the stage did not change
+    """
+    entity_type, field = STAGE_FIELDS[type(instance)]
+    to_stage = getattr(instance, field)
+    if to_stage == from_stage:
+        return None
+    return StageTransition.objects.create(
+        entity_type=entity_type,
+        entity_id=instance.pk,
+        from_stage=from_stage,
+        to_stage=to_stage,
+        changed_by=changed_by,
+    )
+
+
+@transaction.atomic
+def bulk_update_stage(queryset, stage, changed_by=None):
+    """
+    Move every deal or lead in a queryset to a stage with one update
+
+    QuerySet.update() sends no signals, so the transitions are written here
+    with one bulk insert. Records already at the stage are left untouched.
+
+    Args:
+        queryset: Deal or Lead queryset
+        stage: New stage (Deal) or status (Lead)
+        changed_by: Agent making the change
+
+    Returns:
+        Number of records moved
+    """
+    entity_type, field = STAGE_FIELDS[queryset.model]
+    rows = list(
+        queryset.select_related(None).select_for_update().exclude(**{field: stage}).order_by().values_list('id', field)
+    )
+    if not rows:
+        return 0
+
+    queryset.model.objects.filter(pk__in=[row_id for row_id, _ in rows]).update(
+        **{field: stage, 'updated_at': timezone.now()}
+    )
+    now = timezone.now()
+    StageTransition.objects.bulk_create([
+        StageTransition(
+            entity_type=entity_type, entity_id=row_id, from_stage=from_stage,
+            to_stage=stage, changed_by=changed_by, transitioned_at=now,
+        )
+        for row_id, from_stage in rows
+    ], batch_size=1000)
+    return len(rows)
+
+
+def _cohort(entity_type, entity_ids=None, start_date=None, end_date=None):
+    """Transitions of the entities that entered the pipeline within the dates"""
+    transitions = StageTransition.objects.filter(entity_type=entity_type)
+    if entity_ids is not None:
+        transitions = transitions.filter(entity_id__in=entity_ids)
+    if start_date or end_date:
+        entered = StageTransition.objects.filter(entity_type=entity_type, from_stage__isnull=True)
+        if start_date:
+            entered = entered.filter(transitioned_at__gte=timezone.make_aware(
+                datetime.combine(start_date, datetime.min.time())
+            ))
+        if end_date:
+            entered = entered.filter(transitioned_at__lt=timezone.make_aware(
+                datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+            ))
+        transitions = transitions.filter(entity_id__in=entered.values('entity_id'))
+    return transitions
+
+
+def get_pipeline_analytics(entity_type, entity_ids=None, start_date=None, end_date=None):
+    """
+    Compute funnel conversion and time-in-stage for deals or leads
+
+    Conversion counts each entity at the furthest funnel stage it reached, so
+    skipped stages still count as passed. Time in stage is the gap to the next
+    transition, computed with a LEAD() window over each entity's transitions;
+    stages an entity is still in are left out of the medians.
+
+    Args:
+        entity_type: StageTransition.EntityType value
+        entity_ids: Optional queryset / list of ids restricting the scope
+        start_date: Optional first date entities entered the pipeline
+        end_date: Optional last date entities entered the pipeline
+
+    Returns:
+        Dictionary with total entities, per-stage funnel rows and exits
+    """
+    stages = FUNNEL_STAGES[entity_type]
+    transitions = _cohort(entity_type, entity_ids, start_date, end_date)
+
+    position = Case(
+        *[When(to_stage=stage, then=Value(index)) for index, stage in enumerate(stages)],
+        default=Value(-1),
+        output_field=IntegerField(),
+    )
+    furthest = transitions.order_by().values('entity_id').annotate(furthest=Max(position))
+    reached_counts = [0] * len(stages)
+    total = 0
+    for row in furthest:
+        total += 1
+        if row['furthest'] >= 0:
+            reached_counts[row['furthest']] += 1
+
+    durations = {}
+    exits = {}
+    timeline = transitions.annotate(
+        left_at=Window(
+            expression=NextValue('transitioned_at'),
+            partition_by=[F('entity_id')],
+            order_by=[F('transitioned_at').asc(), F('id').asc()],
+        )
+    ).order_by().values_list('to_stage', 'transitioned_at', 'left_at')
+    for stage, entered_at, left_at in timeline.iterator(chunk_size=2000):
+        if stage not in stages:
+            exits[stage] = exits.get(stage, 0) + 1
+        if left_at is not None:
+            durations.setdefault(stage, []).append((left_at - entered_at).total_seconds() / SECONDS_PER_DAY)
+
+    funnel = []
+    reached = sum(reached_counts)
+    for index, stage in enumerate(stages):
+        next_reached = reached - reached_counts[index]
+        stage_durations = durations.get(stage, [])
+        funnel.append({
+            'stage': stage,
+            'reached': reached,
+            'conversion_rate': round(next_reached * 100 / reached, 2) if reached and index < len(stages) - 1 else None,
+            'median_days': round(median(stage_durations), 2) if stage_durations else None,
+            'completed': len(stage_durations),
+        })
+        reached = next_reached
+
+    return {'entity_type': entity_type, 'total': total, 'funnel': funnel, 'exits': exits}
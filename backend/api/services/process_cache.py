@@ -0,0 +1,47 @@
+"""
+Process Cache
+Version keys for indexes each process builds in memory from the database
+
+A change bumps the index's version in the cache. With Redis (REDIS_URL) every
+process sees the bump on its next lookup. The per-process LocMem fallback only
+reaches the process that made the change, so local copies are also rebuilt once
+they are older than settings.PROCESS_CACHE_MAX_AGE seconds. Other processes
+(e.g. standalone workers) therefore pick up changes within that time.
+"""
+from django.conf import settings
+from django.core.cache import cache
+import time
+import uuid
+
+
+def bump_version(key):
+    """Give the index under `key` a new version, so processes rebuild it on their next lookup"""
+    cache.set(key, uuid.uuid4().hex, None)
+
+
+def get_version(key):
+    """Current version of the index under `key`, created on first use"""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def is_fresh(version, loaded_at, current_version):
+    """
+    Whether a local copy built for `version` at monotonic time `loaded_at` can still be used
+
+    Args:
+        version: Version the local copy was built for (None if never built)
+        loaded_at: time.monotonic() when it was built
+        current_version: Result of get_version()
+    """
+    if version is None or version != current_version or loaded_at is None:
+        return False
+    return time.monotonic() - loaded_at < getattr(settings, 'PROCESS_CACHE_MAX_AGE', 60)
+
+
+def timestamp():
+    """Value to store as loaded_at when a local copy is built"""
+    return time.monotonic()
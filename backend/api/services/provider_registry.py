@@ -0,0 +1,111 @@
+"""
+Provider Registry
+Process-memory registry of active telephony / integration configs and the provider SDK clients built from them
+"""
+from ..models import IntegrationConfig, TelephonyConfig
+from .process_cache import bump_version, get_version, is_fresh, timestamp
+import threading
+
+# Cache key holding the current registry version (see process_cache for how it reaches other processes)
+PROVIDER_REGISTRY_VERSION_KEY = 'provider_registry_version'
+
+# Registry loaded by this process, the version it was loaded for and when
+_registry = {'version': None, 'loaded_at': None, 'telephony': None, 'integrations': None, 'clients': {}}
+_registry_lock = threading.Lock()
+
+
+def invalidate_provider_registry():
+    """Make workers reload provider configs (and rebuild clients) on their next lookup"""
+    bump_version(PROVIDER_REGISTRY_VERSION_KEY)
+
+
+def _load():
+    telephony = TelephonyConfig.objects.filter(is_active=True, is_default=True).order_by('id').first()
+    integrations = {}
+    for integration in IntegrationConfig.objects.filter(is_enabled=True).order_by('id'):
+        integrations.setdefault(integration.type, []).append(integration)
+    return telephony, integrations
+
+
+def _current():
+    """
+    Get the registry, reloading it when a provider config changed or the local copy expired
+
+    Only the version key is read from the cache; configs and clients stay in process memory.
+    Clients are dropped when the version changed; an expired copy keeps them, as they
+    are keyed by their credentials.
+    """
+    version = get_version(PROVIDER_REGISTRY_VERSION_KEY)
+    if not is_fresh(_registry['version'], _registry['loaded_at'], version):
+        with _registry_lock:
+            if not is_fresh(_registry['version'], _registry['loaded_at'], version):
+                telephony, integrations = _load()
+                clients = _registry['clients'] if _registry['version'] == version else {}
+                _registry.update(
+                    telephony=telephony, integrations=integrations, clients=clients, version=version,
+                    loaded_at=timestamp(),
+                )
+    return _registry
+
+
+def get_default_telephony_config():
+    """
+    Get the default active telephony configuration
+
+    The instance is shared by every caller in the process: treat it as read-only.
+    """
+    return _current()['telephony']
+
+
+def get_enabled_integrations(integration_type):
+    """
+    Get enabled integrations of a type, oldest first (shared instances, read-only)
+
+    Args:
+        integration_type: IntegrationConfig.IntegrationType value
+
+    Returns:
+        List of IntegrationConfig instances
+    """
+    return list(_current()['integrations'].get(integration_type, ()))
+
+
+def get_integration_config(integration_type):
+    """Get the integration used for a type (the oldest enabled one) or None"""
+    enabled = _current()['integrations'].get(integration_type)
+    return enabled[0] if enabled else None
+
+
+def get_provider_client(provider, credentials, factory):
+    """
+    Get an SDK client for a provider account, built once per registry version
+
+    Clients are keyed by provider and credentials, so rotated credentials get a
+    new client and config changes drop every client built before them.
+
+    Args:
+        provider: Provider name, e.g. 'twilio'
+        credentials: Hashable tuple identifying the account
+        factory: Callable building the client
+
+    Returns:
+        The client returned by factory
+    """
+    clients = _current()['clients']
+    key = (provider, *credentials)
+    client = clients.get(key)
+    if client is None:
+        with _registry_lock:
+            client = clients.get(key)
+            if client is None:
+                client = clients[key] = factory()
+    return client
+
+
+def get_twilio_client(account_sid, auth_token):
+    """Shared Twilio REST client for an account"""
+    def build():
+        from twilio.rest import Client
+        return Client(account_sid, auth_token)
+
+    return get_provider_client('twilio', (account_sid, auth_token), build)
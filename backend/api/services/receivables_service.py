@@ -0,0 +1,163 @@
+"""
+Receivables Service
+Accounts-receivable aging computed in a single SQL query
+"""
+from django.core.cache import cache
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+from ..models import CreditNote, Invoice, Payment
+
+AMOUNT_FIELD = DecimalField(max_digits=14, decimal_places=2)
+
+# Aging buckets as (key, lowest days overdue, highest days overdue)
+AGING_BUCKETS = (
+    ('0_30', 0, 30),
+    ('31_60', 31, 60),
+    ('61_90', 61, 90),
+    ('90_plus', 91, None),
+)
+
+# Group-by dimension -> (id expression, label expressions); labels must be determined by the id
+# so each group comes back as a single row
+AGING_DIMENSIONS = {
+    'project': (Coalesce('project_id', 'unit__floor__tower__project_id'), {
+        'project_name': Coalesce('project__name', 'unit__floor__tower__project__name'),
+    }),
+    'tower': (F('unit__floor__tower_id'), {
+        'project_name': F('unit__floor__tower__project__name'),
+        'tower_name': F('unit__floor__tower__name'),
+    }),
+    'client': (F('client_id'), {'client_name': F('client__name')}),
+    'agent': (F('deal__agent_id'), {
+        'agent_first_name': F('deal__agent__first_name'),
+        'agent_last_name': F('deal__agent__last_name'),
+        'agent_username': F('deal__agent__username'),
+    }),
+}
+
+# Reports are computed at most once per day per scope
+AGING_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def outstanding_invoices(queryset=None):
+    """
+    Annotate invoices with paid, credited and outstanding amounts using correlated subqueries
+
+    Draft and cancelled invoices are excluded, as are invoices with nothing outstanding.
+    """
+    if queryset is None:
+        queryset = Invoice.objects.all()
+    paid = Payment.objects.filter(invoice=OuterRef('pk')).order_by().values('invoice').annotate(
+        total=Sum('amount')
+    ).values('total')
+    credited = CreditNote.objects.filter(applied_to_invoice=OuterRef('pk')).order_by().values(
+        'applied_to_invoice'
+    ).annotate(total=Sum('amount')).values('total')
+    zero = Value(Decimal('0'), output_field=AMOUNT_FIELD)
+
+    return queryset.exclude(
+        status__in=[Invoice.Status.DRAFT, Invoice.Status.CANCELLED]
+    ).annotate(
+        paid_total=Coalesce(Subquery(paid, output_field=AMOUNT_FIELD), zero),
+        credited_total=Coalesce(Subquery(credited, output_field=AMOUNT_FIELD), zero),
+    ).annotate(
+        outstanding=ExpressionWrapper(
+            F('total_amount') - F('paid_total') - F('credited_total'), output_field=AMOUNT_FIELD
+        )
+    ).filter(outstanding__gt=0)
+
+
+def _bucket_filter(as_of, low, high):
+    condition = Q(due_date__lte=as_of - timedelta(days=low))
+    if high is not None:
+        condition &= Q(due_date__gte=as_of - timedelta(days=high))
+    return condition
+
+
+def _label(dimension, row):
+    if dimension == 'agent':
+        full_name = f"{row['agent_first_name'] or ''} {row['agent_last_name'] or ''}".strip()
+        return full_name or row['agent_username']
+    if dimension == 'project':
+        return row['project_name']
+    if dimension == 'tower':
+        if not row['tower_name']:
+            return None
+        return f"{row['project_name']} - {row['tower_name']}"
+    return row['client_name']
+
+
+def compute_aging_report(group_by='project', as_of=None, queryset=None):
+    """
+    Compute receivable aging buckets grouped by project, tower, client or agent
+
+    Outstanding amounts (total less payments and credit notes) are bucketed by
+    days past due with conditional aggregation, all in one query.
+
+    Args:
+        group_by: One of AGING_DIMENSIONS
+        as_of: Date the aging is computed for (defaults to today)
+        queryset: Optional Invoice queryset restricting the scope (e.g. an agent's deals)
+
+    Returns:
+        Dictionary with as_of, group_by, rows (one per group) and totals
+    """
+    if group_by not in AGING_DIMENSIONS:
+        raise ValueError(f"group_by must be one of: {', '.join(AGING_DIMENSIONS)}")
+    as_of = as_of or timezone.localdate()
+    group_expression, labels = AGING_DIMENSIONS[group_by]
+    zero = Value(Decimal('0'), output_field=AMOUNT_FIELD)
+
+    aggregates = {
+        'current': Coalesce(Sum('outstanding', filter=Q(due_date__gt=as_of)), zero),
+        'total': Coalesce(Sum('outstanding'), zero),
+    }
+    for key, low, high in AGING_BUCKETS:
+        aggregates[key] = Coalesce(Sum('outstanding', filter=_bucket_filter(as_of, low, high)), zero)
+
+    rows = outstanding_invoices(queryset).annotate(group_id=group_expression, **labels).values(
+        'group_id', *labels
+    ).annotate(**aggregates).order_by('group_id')
+
+    bucket_keys = ['current'] + [key for key, _, _ in AGING_BUCKETS] + ['total']
+    totals = {key: Decimal('0') for key in bucket_keys}
+    report_rows = []
+    for row in rows:
+        for key in bucket_keys:
+            totals[key] += row[key]
+        report_rows.append({
+            'id': row['group_id'],
+            'name': _label(group_by, row),
+            **{key: row[key] for key in bucket_keys},
+        })
+
+    return {'as_of': as_of, 'group_by': group_by, 'rows': report_rows, 'totals': totals}
+
+
+def get_aging_report(group_by='project', as_of=None, queryset=None, scope='all', refresh=False):
+    """
+    Get the aging report, cached per day, dimension and scope
+
+    Args:
+        group_by: One of AGING_DIMENSIONS
+        as_of: Date the aging is computed for (defaults to today)
+        queryset: Optional Invoice queryset restricting the scope
+        scope: Cache key part identifying the queryset restriction (e.g. 'agent:5')
+        refresh: Recompute and replace the cached report
+
+    Returns:
+        Report dictionary (see compute_aging_report)
+    """
+    as_of = as_of or timezone.localdate()
+    cache_key = f"ar_aging:{group_by}:{as_of.isoformat()}:{scope}"
+    if not refresh:
+        report = cache.get(cache_key)
+        if report is not None:
+            return report
+
+    report = compute_aging_report(group_by=group_by, as_of=as_of, queryset=queryset)
+    cache.set(cache_key, report, AGING_CACHE_TIMEOUT)
+    return report
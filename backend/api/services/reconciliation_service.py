@@ -0,0 +1,202 @@
+"""
+Bank Reconciliation Service
+Matches bank statement lines with recorded payments and booking payments
+"""
+from django.db import transaction
+from django.utils import timezone
+from datetime import datetime, timedelta
+from decimal import Decimal
+from ..models import BankReconciliation, BookingPayment, Payment
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Days a bank line may be booked before or after the payment it settles
+DEFAULT_DATE_WINDOW_DAYS = 3
+
+# Largest difference accepted between bank and payment amounts (bank charges)
+DEFAULT_AMOUNT_TOLERANCE = Decimal('10.00')
+
+_NON_ALPHANUMERIC = re.compile(r'[^0-9A-Z]')
+
+
+def normalize_reference(value):
+    """Normalize a UTR / reference / cheque number for comparison"""
+    if not value:
+        return None
+    return _NON_ALPHANUMERIC.sub('', str(value).upper()) or None
+
+
+def _candidate(kind, row_id, amount, paid_at, references):
+    return {
+        'kind': kind,
+        'id': row_id,
+        'amount': amount,
+        'date': timezone.localtime(paid_at).date(),
+        'references': {ref for ref in map(normalize_reference, references) if ref},
+    }
+
+
+def load_candidates(start_date, end_date):
+    """
+    Load unreconciled payments and booking payments dated within a window
+
+    Args:
+        start_date: First date of the window
+        end_date: Last date of the window
+
+    Returns:
+        List of candidate dictionaries
+    """
+    start = timezone.make_aware(datetime.combine(start_date, datetime.min.time()))
+    end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+    matched = BankReconciliation.Status.MATCHED
+
+    payments = Payment.objects.filter(
+        payment_date__gte=start, payment_date__lt=end
+    ).exclude(bank_reconciliations__status=matched).values_list(
+        'id', 'amount', 'payment_date', 'transaction_id', 'reference_number'
+    )
+    bookings = BookingPayment.objects.filter(
+        payment_date__gte=start, payment_date__lt=end
+    ).exclude(
+        status__in=[BookingPayment.Status.BOUNCED, BookingPayment.Status.REFUNDED]
+    ).exclude(bank_reconciliations__status=matched).values_list(
+        'id', 'amount', 'payment_date', 'transaction_id', 'reference_number',
+        'rtgs_neft_utr', 'upi_reference', 'cheque_number'
+    )
+
+    candidates = [
+        _candidate('payment', row_id, amount, paid_at, references)
+        for row_id, amount, paid_at, *references in payments
+    ]
+    candidates += [
+        _candidate('booking', row_id, amount, paid_at, references)
+        for row_id, amount, paid_at, *references in bookings
+    ]
+    return candidates
+
+
+def build_indexes(candidates):
+    """
+    Index candidates by normalized reference and by exact amount
+
+    Returns:
+        Tuple of (reference -> candidates, amount -> candidates)
+    """
+    by_reference = {}
+    by_amount = {}
+    for candidate in candidates:
+        for reference in candidate['references']:
+            by_reference.setdefault(reference, []).append(candidate)
+        by_amount.setdefault(candidate['amount'], []).append(candidate)
+    return by_reference, by_amount
+
+
+def _line_references(line):
+    return {ref for ref in map(normalize_reference, (line.utr_number, line.reference_number)) if ref}
+
+
+def _closest(line, candidates):
+    """Pick the candidate nearest to the bank line date, ties broken by id for determinism"""
+    return min(candidates, key=lambda c: (abs((c['date'] - line.transaction_date).days), c['kind'], c['id']))
+
+
+@transaction.atomic
+def auto_match(lines=None, date_window_days=DEFAULT_DATE_WINDOW_DAYS,
+               amount_tolerance=DEFAULT_AMOUNT_TOLERANCE, reconciled_by=None):
+    """
+    Match unreconciled bank credit lines with payments and booking payments
+
+    Candidates for the whole date window are loaded once into hash indexes.
+    Matching then runs in passes, each candidate settling at most one line:
+    1. Exact: same UTR / reference / cheque number and same amount
+    2. Tolerance: same reference within the date window and amount tolerance
+    3. Amount: same amount within the date window when exactly one candidate fits
+
+    All lines are written back with one bulk update; lines with no match are
+    marked Unmatched for manual review.
+
+    Args:
+        lines: Optional BankReconciliation queryset to restrict the run
+        date_window_days: Allowed days between bank and payment dates
+        amount_tolerance: Allowed absolute amount difference for reference matches
+        reconciled_by: Agent recorded on the matches
+
+    Returns:
+        Dictionary with match counts per pass and unmatched count
+    """
+    stats = {'exact': 0, 'tolerance': 0, 'amount': 0, 'unmatched': 0}
+
+    if lines is None:
+        lines = BankReconciliation.objects.all()
+    lines = list(
+        lines.select_related(None).select_for_update(skip_locked=True).filter(
+            status__in=[BankReconciliation.Status.PENDING, BankReconciliation.Status.UNMATCHED],
+            transaction_type__iexact='Credit',
+        ).order_by('transaction_date', 'id')
+    )
+    if not lines:
+        return stats
+
+    window = timedelta(days=date_window_days)
+    candidates = load_candidates(
+        min(line.transaction_date for line in lines) - window,
+        max(line.transaction_date for line in lines) + window,
+    )
+    by_reference, by_amount = build_indexes(candidates)
+    used = set()
+    matches = {}
+
+    def available(candidate, line):
+        return (candidate['kind'], candidate['id']) not in used and abs(candidate['date'] - line.transaction_date) <= window
+
+    def settle(line, candidate, match_type):
+        used.add((candidate['kind'], candidate['id']))
+        matches[line.id] = candidate
+        stats[match_type] += 1
+
+    for line in lines:
+        found = [
+            candidate for reference in _line_references(line) for candidate in by_reference.get(reference, ())
+            if candidate['amount'] == line.amount and available(candidate, line)
+        ]
+        if found:
+            settle(line, _closest(line, found), 'exact')
+
+    for line in lines:
+        if line.id in matches:
+            continue
+        found = [
+            candidate for reference in _line_references(line) for candidate in by_reference.get(reference, ())
+            if abs(candidate['amount'] - line.amount) <= amount_tolerance and available(candidate, line)
+        ]
+        if found:
+            settle(line, min(found, key=lambda c: (abs(c['amount'] - line.amount), c['kind'], c['id'])), 'tolerance')
+
+    for line in lines:
+        if line.id in matches:
+            continue
+        found = [candidate for candidate in by_amount.get(line.amount, ()) if available(candidate, line)]
+        if len(found) == 1:
+            settle(line, found[0], 'amount')
+
+    now = timezone.now()
+    for line in lines:
+        candidate = matches.get(line.id)
+        if candidate is None:
+            line.status = BankReconciliation.Status.UNMATCHED
+            stats['unmatched'] += 1
+            continue
+        line.status = BankReconciliation.Status.MATCHED
+        line.matched_payment_id = candidate['id'] if candidate['kind'] == 'payment' else None
+        line.matched_booking_id = candidate['id'] if candidate['kind'] == 'booking' else None
+        line.reconciled_by = reconciled_by
+        line.reconciled_at = now
+
+    BankReconciliation.objects.bulk_update(
+        lines, ['status', 'matched_payment', 'matched_booking', 'reconciled_by', 'reconciled_at'], batch_size=1000
+    )
+    logger.info(f"Bank auto-match: {stats}")
+    return stats
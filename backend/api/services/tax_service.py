@@ -0,0 +1,167 @@
+"""
+Tax Service
+Resolves effective-dated GST rates and computes CGST/SGST/IGST breakdowns
+"""
+from django.utils import timezone
+from bisect import bisect_right
+from decimal import Decimal, ROUND_HALF_UP
+from ..models import GSTConfiguration, TaxBreakdown
+from .process_cache import bump_version, get_version, is_fresh, timestamp
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Cache key holding the current index version (see process_cache for how it reaches other processes)
+GST_INDEX_VERSION_KEY = 'gst_rate_index_version'
+
+PAISA = Decimal('0.01')
+
+# Index built by this process, the version it was built for and when
+_rate_index = {'version': None, 'loaded_at': None, 'index': None}
+
+
+class GSTRateNotFound(ValueError):
+    """Raised when no active GST configuration covers a line"""
+
+
+def invalidate_rate_index():
+    """Make workers rebuild the rate index on their next lookup"""
+    bump_version(GST_INDEX_VERSION_KEY)
+
+
+def build_rate_index():
+    """
+    Load active GST configurations into an interval index
+
+    Returns:
+        Dictionary of (property_type, charge_type) -> (sorted effective_from dates,
+        list of (effective_from, effective_to, gst_rate, hsn_code))
+    """
+    index = {}
+    configs = GSTConfiguration.objects.filter(is_active=True).order_by('effective_from').values_list(
+        'property_type', 'charge_type', 'effective_from', 'effective_to', 'gst_rate', 'hsn_code'
+    )
+    for property_type, charge_type, effective_from, effective_to, gst_rate, hsn_code in configs:
+        starts, intervals = index.setdefault((property_type, charge_type), ([], []))
+        starts.append(effective_from)
+        intervals.append((effective_from, effective_to, gst_rate, hsn_code))
+    return index
+
+
+def get_rate_index():
+    """
+    Get the GST rate index, rebuilding it only when configurations changed or it expired
+
+    Only the version key is read from the cache; the index itself stays in process memory.
+    """
+    version = get_version(GST_INDEX_VERSION_KEY)
+    if not is_fresh(_rate_index['version'], _rate_index['loaded_at'], version):
+        _rate_index.update(index=build_rate_index(), version=version, loaded_at=timestamp())
+    return _rate_index['index']
+
+
+def resolve_rate(property_type, charge_type, on_date, index=None):
+    """
+    Resolve the GST rate effective on a date
+
+    The configuration with the latest effective_from on or before the date
+    applies, unless its effective_to has passed.
+
+    Args:
+        property_type: GSTConfiguration.PropertyType value
+        charge_type: GSTConfiguration.ChargeType value
+        on_date: Date the tax applies to
+        index: Optional rate index (defaults to get_rate_index())
+
+    Returns:
+        Tuple of (gst_rate, hsn_code)
+
+    Raises:
+        GSTRateNotFound: If no active configuration covers the date
+    """
+    index = get_rate_index() if index is None else index
+    entry = index.get((property_type, charge_type))
+    if entry:
+        starts, intervals = entry
+        position = bisect_right(starts, on_date) - 1
+        if position >= 0:
+            _, effective_to, gst_rate, hsn_code = intervals[position]
+            if effective_to is None or on_date <= effective_to:
+                return gst_rate, hsn_code
+    raise GSTRateNotFound(f"No GST rate for {property_type} / {charge_type} on {on_date}")
+
+
+def split_tax(base_amount, gst_rate, inter_state=False):
+    """
+    Split GST on an amount into CGST/SGST (intra-state) or IGST (inter-state)
+
+    Returns:
+        Dictionary with cgst_amount, sgst_amount, igst_amount and total_tax
+    """
+    total_tax = (Decimal(base_amount) * Decimal(gst_rate) / 100).quantize(PAISA, rounding=ROUND_HALF_UP)
+    if inter_state:
+        return {'cgst_amount': Decimal('0'), 'sgst_amount': Decimal('0'), 'igst_amount': total_tax, 'total_tax': total_tax}
+    cgst_amount = (total_tax / 2).quantize(PAISA, rounding=ROUND_HALF_UP)
+    return {
+        'cgst_amount': cgst_amount,
+        'sgst_amount': total_tax - cgst_amount,
+        'igst_amount': Decimal('0'),
+        'total_tax': total_tax,
+    }
+
+
+def build_tax_breakdowns(lines):
+    """
+    Compute tax breakdowns for a batch of invoice lines
+
+    The rate index is fetched once for the whole batch.
+
+    Args:
+        lines: Iterable of dictionaries with invoice, property_type, charge_type,
+            base_amount and optional on_date (defaults to today) and inter_state
+
+    Returns:
+        List of unsaved TaxBreakdown instances
+
+    Raises:
+        GSTRateNotFound: If any line has no effective rate
+    """
+    index = get_rate_index()
+    today = timezone.localdate()
+    breakdowns = []
+    for line in lines:
+        gst_rate, hsn_code = resolve_rate(line['property_type'], line['charge_type'], line.get('on_date') or today, index)
+        base_amount = Decimal(line['base_amount'])
+        tax = split_tax(base_amount, gst_rate, line.get('inter_state', False))
+        breakdowns.append(TaxBreakdown(
+            invoice=line['invoice'],
+            charge_type=line['charge_type'],
+            base_amount=base_amount,
+            gst_rate=gst_rate,
+            hsn_code=hsn_code,
+            total_amount=base_amount + tax['total_tax'],
+            **tax
+        ))
+    return breakdowns
+
+
+def create_tax_breakdowns(lines):
+    """
+    Compute and save tax breakdowns for a batch of invoice lines with one bulk insert
+
+    Args:
+        lines: See build_tax_breakdowns
+
+    Returns:
+        List of TaxBreakdown instances
+    """
+    breakdowns = build_tax_breakdowns(lines)
+    TaxBreakdown.objects.bulk_create(breakdowns)
+    return breakdowns
+
+
+def is_inter_state(project_state, client_state):
+    """Supply is inter-state (IGST) when both states are known and differ"""
+    if not project_state or not client_state:
+        return False
+    return project_state.strip().lower() != client_state.strip().lower()
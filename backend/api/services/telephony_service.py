@@ -2,18 +2,57 @@
 Telephony Service
 Handles call initiation, recording, transcription, and webhook processing
 """
+from django.db import connection, transaction
+from django.db.models import Q
 from django.utils import timezone
 from datetime import timedelta
-from ..models import CallLog, TelephonyConfig, Lead, Agent, Activity
+from email.utils import parsedate_to_datetime
+from ..models import CallLog, TelephonyConfig, TelephonyWebhookEvent, Lead, Activity
+from .assignment_service import CHANNEL_CALL, CHANNEL_LEAD, pick_agent, track_load_change
+from .call_stats_service import track_call_stats
+from .http_client import get_client
+from .provider_registry import get_default_telephony_config, get_twilio_client
+from .transcription_service import queue_transcriptions
+import hashlib
+import json
 import uuid
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Webhook events claimed per worker batch
+TELEPHONY_EVENT_BATCH_SIZE = 500
 
-def get_default_telephony_config():
-    """Get default active telephony configuration"""
-    return TelephonyConfig.objects.filter(is_active=True, is_default=True).first()
+# Events that cannot be applied yet (e.g. a recording for a call we have no log for) are retried this many times
+TELEPHONY_EVENT_MAX_ATTEMPTS = 5
+
+# Seconds before the first retry of an event; doubled for each further attempt
+TELEPHONY_EVENT_RETRY_DELAY = 30
+
+TWILIO_STATUS_MAP = {
+    'initiated': CallLog.Status.INITIATED,
+    'ringing': CallLog.Status.RINGING,
+    'answered': CallLog.Status.ANSWERED,
+    'in-progress': CallLog.Status.ANSWERED,
+    'completed': CallLog.Status.COMPLETED,
+    'busy': CallLog.Status.BUSY,
+    'no-answer': CallLog.Status.NO_ANSWER,
+    'failed': CallLog.Status.FAILED,
+    'canceled': CallLog.Status.CANCELLED,
+}
+
+# Calls only move to a higher rank; every final status shares the top rank
+CALL_FINAL_RANK = 3
+CALL_STATUS_RANK = {
+    CallLog.Status.INITIATED: 0,
+    CallLog.Status.RINGING: 1,
+    CallLog.Status.ANSWERED: 2,
+    CallLog.Status.COMPLETED: CALL_FINAL_RANK,
+    CallLog.Status.BUSY: CALL_FINAL_RANK,
+    CallLog.Status.NO_ANSWER: CALL_FINAL_RANK,
+    CallLog.Status.FAILED: CALL_FINAL_RANK,
+    CallLog.Status.CANCELLED: CALL_FINAL_RANK,
+}
 
 
 def initiate_outbound_call(to_number, from_number=None, lead=None, agent=None, telephony_config=None):
@@ -172,13 +211,12 @@ def initiate_twilio_call(to_number, from_number, call_log, config):
         Exception: If Twilio API call fails
     """
     try:
-        from twilio.rest import Client
         from twilio.base.exceptions import TwilioRestException
         
         if not config.account_sid or not config.auth_token:
             raise ValueError("Twilio Account SID and Auth Token are required")
         
-        client = Client(config.account_sid, config.auth_token)
+        client = get_twilio_client(config.account_sid, config.auth_token)
         
         # Build callback URLs
         base_url = config.webhook_url or config.config.get('base_url', '')
@@ -219,143 +257,303 @@ def initiate_twilio_call(to_number, from_number, call_log, config):
         raise ValueError(error_msg)
 
 
-def process_twilio_status_webhook(request_data):
+def record_telephony_event(event_type, request_data, provider=TelephonyConfig.Provider.TWILIO):
     """
-    Process Twilio status callback webhook
+    Persist a raw telephony callback in the inbox
+    
+    This is the only work done on the request path: a single INSERT that is
+    skipped when the provider retries a callback we already have.
     
     Args:
-        request_data: Request data from Twilio webhook
+        event_type: TelephonyWebhookEvent.EventType value
+        request_data: Callback parameters (dict)
+        provider: TelephonyConfig.Provider value
     
     Returns:
-        CallLog instance or None
+        Event key under which the callback was stored
     """
-    call_sid = request_data.get('CallSid')
-    call_status = request_data.get('CallStatus')
-    from_number = request_data.get('From')
-    to_number = request_data.get('To')
-    duration = request_data.get('CallDuration')
-    
-    if not call_sid:
-        return None
-    
-    # Find or create call log
-    call_log = CallLog.objects.filter(call_sid=call_sid).first()
-    
-    if not call_log:
-        # Create new call log for inbound call
-        call_log = CallLog.objects.create(
-            call_sid=call_sid,
-            direction=CallLog.Direction.INBOUND,
-            from_number=from_number,
-            to_number=to_number,
-            provider='Twilio',
-            initiated_at=timezone.now()
+    body = json.dumps(request_data, sort_keys=True)
+    event_key = f"{provider}:{event_type}:{hashlib.sha256(body.encode('utf-8')).hexdigest()}"
+    TelephonyWebhookEvent.objects.bulk_create([
+        TelephonyWebhookEvent(
+            provider=provider,
+            event_type=event_type,
+            event_key=event_key,
+            call_sid=(request_data.get('CallSid') or '')[:255] or None,
+            payload=request_data,
         )
+    ], ignore_conflicts=True)
+    return event_key
+
+
+def _event_sequence(data):
+    """Twilio's per-call SequenceNumber, or None when absent"""
+    value = str(data.get('SequenceNumber') or '').strip()
+    return int(value) if value.isdigit() else None
+
+
+def _call_duration(data):
+    """Twilio's CallDuration in seconds, or None when absent or not a number"""
+    value = str(data.get('CallDuration') or '').strip()
+    return int(value) if value.isdigit() else None
+
+
+def _event_time(data, received_at):
+    """Time the provider reports for the event, falling back to when we received it"""
+    value = data.get('Timestamp')
+    if value:
+        try:
+            return parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            pass
+    return received_at
+
+
+def status_event_order(data, received_at):
+    """Sort key putting status callbacks of one call in the order the provider sent them"""
+    sequence = _event_sequence(data)
+    return (sequence is None, sequence or 0, _event_time(data, received_at))
+
+
+def apply_call_status(call_log, data, received_at):
+    """
+    Apply a Twilio status callback through the call state machine
     
-    # Map Twilio status to our status
-    status_map = {
-        'initiated': CallLog.Status.INITIATED,
-        'ringing': CallLog.Status.RINGING,
-        'answered': CallLog.Status.ANSWERED,
-        'completed': CallLog.Status.COMPLETED,
-        'busy': CallLog.Status.BUSY,
-        'no-answer': CallLog.Status.NO_ANSWER,
-        'failed': CallLog.Status.FAILED,
-        'canceled': CallLog.Status.CANCELLED,
-    }
-    
-    call_log.status = status_map.get(call_status.lower(), CallLog.Status.INITIATED)
-    
-    # Update timestamps
-    if call_status == 'answered' and not call_log.answered_at:
-        call_log.answered_at = timezone.now()
-        if call_log.initiated_at:
-            ring_duration = (call_log.answered_at - call_log.initiated_at).total_seconds()
-            call_log.ring_duration = int(ring_duration)
+    A call only moves forward (initiated, ringing, answered, then one final
+    status). Retries, callbacks older than the last applied sequence number and
+    regressions are ignored, so the call log is only written on real transitions.
+    Raw payloads are kept in TelephonyWebhookEvent rather than on the call log.
     
-    if call_status == 'completed':
-        call_log.ended_at = timezone.now()
-        if call_log.answered_at:
-            duration_seconds = (call_log.ended_at - call_log.answered_at).total_seconds()
-            call_log.duration = int(duration_seconds)
-        elif duration:
-            call_log.duration = int(duration)
+    Args:
+        call_log: CallLog instance
+        data: Callback parameters
+        received_at: When the callback was received
     
-    # Store provider data
-    call_log.provider_data = request_data
+    Returns:
+        True if the call log changed and needs saving
+    """
+    sequence = _event_sequence(data)
+    if sequence is not None and call_log.last_event_sequence is not None and sequence <= call_log.last_event_sequence:
+        return False
     
-    call_log.save()
+    call_status = (data.get('CallStatus') or '').lower()
+    new_status = TWILIO_STATUS_MAP.get(call_status)
+    if new_status is None or CALL_STATUS_RANK[new_status] <= CALL_STATUS_RANK[call_log.status]:
+        return False
     
-    # Create Activity if call completed and has lead
-    if call_log.status == CallLog.Status.COMPLETED and call_log.lead:
-        create_call_activity(call_log)
+    occurred_at = _event_time(data, received_at)
+    call_log.status = new_status
+    if sequence is not None:
+        call_log.last_event_sequence = sequence
     
-    return call_log
+    if new_status == CallLog.Status.ANSWERED and not call_log.answered_at:
+        call_log.answered_at = occurred_at
+        if call_log.initiated_at:
+            call_log.ring_duration = max(int((call_log.answered_at - call_log.initiated_at).total_seconds()), 0)
+    
+    if CALL_STATUS_RANK[new_status] == CALL_FINAL_RANK:
+        call_log.ended_at = occurred_at
+        duration = _call_duration(data)
+        if duration is not None:
+            call_log.duration = duration
+        elif call_log.answered_at and new_status == CallLog.Status.COMPLETED:
+            call_log.duration = max(int((call_log.ended_at - call_log.answered_at).total_seconds()), 0)
+    return True
 
 
-def process_twilio_recording_webhook(request_data):
+def _retry_event(event, error, now):
+    """Leave an event pending with a backed-off retry time, or mark it failed after its last attempt"""
+    event.status = TelephonyWebhookEvent.Status.PENDING
+    event.last_error = error
+    if event.attempts >= TELEPHONY_EVENT_MAX_ATTEMPTS:
+        event.status = TelephonyWebhookEvent.Status.FAILED
+    else:
+        event.next_attempt_at = now + timedelta(seconds=TELEPHONY_EVENT_RETRY_DELAY * 2 ** (event.attempts - 1))
+
+
+def process_telephony_events(batch_size=TELEPHONY_EVENT_BATCH_SIZE):
     """
-    Process Twilio recording callback webhook
+    Drain one batch of pending telephony webhook events into call logs
+    
+    Claims pending events (skipping rows locked by other workers), groups them
+    per call_sid and applies them in provider sequence order through the call
+    state machine; stale and duplicate callbacks are marked Ignored and cause
+    no write. Missing inbound call logs,
+    call log changes, call activities and event outcomes are all written with
+    bulk queries.
+    
+    An event that cannot be applied keeps its error and is retried after a
+    growing delay, then marked Failed; it never holds up the rest of the batch.
     
     Args:
-        request_data: Request data from Twilio recording webhook
+        batch_size: Maximum number of events to process
     
     Returns:
-        CallLog instance or None
+        Dictionary with counts per outcome
     """
-    call_sid = request_data.get('CallSid')
-    recording_url = request_data.get('RecordingUrl')
-    recording_sid = request_data.get('RecordingSid')
-    
-    if not call_sid:
-        return None
+    stats = {status_value: 0 for status_value in TelephonyWebhookEvent.Status.values}
+    transcribe = []
+    
+    with transaction.atomic():
+        now = timezone.now()
+        events = list(TelephonyWebhookEvent.objects.select_for_update(skip_locked=True).filter(
+            Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now), status=TelephonyWebhookEvent.Status.PENDING
+        ).order_by('received_at', 'id')[:batch_size])
+        
+        if not events:
+            return stats
+        
+        by_call = {}
+        for event in events:
+            event.attempts += 1
+            event.last_error = None
+            event.next_attempt_at = None
+            if not event.call_sid or not isinstance(event.payload, dict):
+                event.status = TelephonyWebhookEvent.Status.IGNORED
+                continue
+            by_call.setdefault(event.call_sid, []).append(event)
+        
+        call_logs = CallLog.objects.select_related('agent').in_bulk(by_call.keys(), field_name='call_sid')
+        
+        # Status callbacks for calls we did not place are inbound calls
+        new_logs = []
+        for call_sid, call_events in by_call.items():
+            first_status = next((e for e in call_events if e.event_type == TelephonyWebhookEvent.EventType.STATUS), None)
+            if call_sid not in call_logs and first_status:
+                new_logs.append(CallLog(
+                    call_sid=call_sid,
+                    direction=CallLog.Direction.INBOUND,
+                    from_number=first_status.payload.get('From') or '',
+                    to_number=first_status.payload.get('To') or '',
+                    provider=first_status.provider,
+                    provider_data=first_status.payload,
+                    initiated_at=first_status.received_at,
+                ))
+        if new_logs:
+            CallLog.objects.bulk_create(new_logs, ignore_conflicts=True)
+            # Re-read so primary keys are known on every backend
+            call_logs.update(CallLog.objects.select_related('agent').in_bulk(
+                [log.call_sid for log in new_logs], field_name='call_sid'
+            ))
+        
+        changed = {}
+        completed = []
+        for call_sid, call_events in by_call.items():
+            call_log = call_logs.get(call_sid)
+            if call_log is None:
+                for event in call_events:
+                    _retry_event(event, 'Call log not found', now)
+                continue
+            
+            was_completed = call_log.status == CallLog.Status.COMPLETED
+            call_events.sort(key=lambda e: (
+                e.event_type != TelephonyWebhookEvent.EventType.STATUS, status_event_order(e.payload, e.received_at)
+            ))
+            for event in call_events:
+                before = call_log.__dict__.copy()
+                try:
+                    if event.event_type == TelephonyWebhookEvent.EventType.STATUS:
+                        applied = apply_call_status(call_log, event.payload, event.received_at)
+                    else:
+                        recording = (event.payload.get('RecordingUrl'), event.payload.get('RecordingSid'))
+                        applied = recording != (call_log.recording_url, call_log.recording_sid)
+                        if applied:
+                            call_log.recording_url, call_log.recording_sid = recording
+                except Exception as e:
+                    # Undo whatever the event changed before it failed
+                    call_log.__dict__.update(before)
+                    logger.exception(f"Could not apply telephony event {event.pk}")
+                    _retry_event(event, str(e), now)
+                    continue
+                event.status = TelephonyWebhookEvent.Status.PROCESSED if applied else TelephonyWebhookEvent.Status.IGNORED
+                if applied:
+                    changed[call_log.pk] = call_log
+                    if event.event_type == TelephonyWebhookEvent.EventType.RECORDING:
+                        transcribe.append(call_log)
+            if call_log.status == CallLog.Status.COMPLETED and not was_completed and call_log.lead_id and not call_log.activity_id:
+                completed.append(call_log)
+        
+        try:
+            # Savepoint: if the writes fail, the events still record the attempt
+            with transaction.atomic():
+                if completed:
+                    activities = [build_call_activity(call_log) for call_log in completed]
+                    if connection.features.can_return_rows_from_bulk_insert:
+                        Activity.objects.bulk_create(activities)
+                    else:
+                        for activity in activities:
+                            activity.save()
+                    for call_log, activity in zip(completed, activities):
+                        call_log.activity_id = activity.pk
+                
+                for call_log in changed.values():
+                    call_log.updated_at = now
+                CallLog.objects.bulk_update(changed.values(), [
+                    'status', 'last_event_sequence', 'answered_at', 'ended_at', 'duration', 'ring_duration',
+                    'recording_url', 'recording_sid', 'activity', 'updated_at'
+                ], batch_size=500)
+                # bulk_update sends no post_save, so move the call stats here
+                track_call_stats(changed.values())
+        except Exception as e:
+            logger.exception("Could not write telephony event batch")
+            transcribe = []
+            changed = {}
+            for event in events:
+                if event.status != TelephonyWebhookEvent.Status.FAILED:
+                    _retry_event(event, str(e), now)
+        # Load counters live in the cache, so move them only once the writes went through
+        for call_log in changed.values():
+            track_load_change(call_log)
+        
+        for event in events:
+            if event.status != TelephonyWebhookEvent.Status.PENDING:
+                event.processed_at = now
+            stats[event.status] += 1
+        TelephonyWebhookEvent.objects.bulk_update(
+            events, ['status', 'attempts', 'last_error', 'next_attempt_at', 'processed_at']
+        )
     
-    call_log = CallLog.objects.filter(call_sid=call_sid).first()
-    if call_log:
-        call_log.recording_url = recording_url
-        call_log.recording_sid = recording_sid
-        call_log.save()
-        
-        # Trigger transcription if enabled
+    if transcribe:
         telephony_config = get_default_telephony_config()
         if telephony_config and telephony_config.transcribe_calls:
-            transcribe_call(call_log)
+            queue_transcriptions(transcribe)
     
-    return call_log
+    return stats
 
 
-def transcribe_call(call_log):
+def create_call_activity(call_log):
     """
-    Transcribe call recording
+    Create Activity from CallLog
     
     Args:
         call_log: CallLog instance
     
     Returns:
-        Boolean indicating success
+        Activity instance
     """
-    if not call_log.recording_url:
-        return False
+    if not call_log.lead:
+        return None
+    
+    activity = build_call_activity(call_log)
+    activity.save()
     
-    # TODO: Implement transcription using Twilio or other service
-    # For now, this is a placeholder
+    # Link call log to activity
+    call_log.activity = activity
+    call_log.save()
     
-    return False
+    return activity
 
 
-def create_call_activity(call_log):
+def build_call_activity(call_log):
     """
-    Create Activity from CallLog
+    Build an unsaved Activity for a CallLog with a lead
     
     Args:
-        call_log: CallLog instance
+        call_log: CallLog instance (agent should be loaded)
     
     Returns:
         Activity instance
     """
-    if not call_log.lead:
-        return None
-    
     # Determine outcome
     outcome = None
     if call_log.status == CallLog.Status.COMPLETED:
@@ -367,8 +565,8 @@ def create_call_activity(call_log):
     elif call_log.status == CallLog.Status.FAILED:
         outcome = Activity.Outcome.MISSED
     
-    activity = Activity.objects.create(
-        lead=call_log.lead,
+    return Activity(
+        lead_id=call_log.lead_id,
         agent_name=call_log.agent.name if call_log.agent else 'System',
         type=Activity.Type.CALL,
         duration=call_log.duration,
@@ -381,12 +579,6 @@ def create_call_activity(call_log):
         notes=call_log.notes or f"Call from {call_log.from_number} to {call_log.to_number}",
         timestamp=call_log.initiated_at
     )
-    
-    # Link call log to activity
-    call_log.activity = activity
-    call_log.save()
-    
-    return activity
 
 
 def find_or_create_lead_from_call(call_log):
@@ -416,7 +608,7 @@ def find_or_create_lead_from_call(call_log):
             source='Phone Call',
             status=Lead.Status.NEW,
             tag=Lead.Tag.COLD,
-            agent=call_log.agent
+            agent_id=call_log.agent_id or pick_agent(CHANNEL_LEAD)
         )
     
     call_log.lead = lead
@@ -439,7 +631,6 @@ def initiate_exotel_call(to_number, from_number, call_log, config):
         Call ID
     """
     try:
-        import requests
         import base64
         
         subdomain = config.config.get('subdomain', '')
@@ -475,7 +666,7 @@ def initiate_exotel_call(to_number, from_number, call_log, config):
             'Record': 'true' if config.record_calls else 'false'
         }
         
-        response = requests.post(url, json=payload, headers=headers)
+        response = get_client('exotel').post(url, json=payload, headers=headers)
         
         if response.status_code == 200:
             data = response.json()
@@ -502,8 +693,6 @@ def initiate_knowlarity_call(to_number, from_number, call_log, config):
         Call ID
     """
     try:
-        import requests
-        import hashlib
         import time
         
         api_key = config.api_key or config.config.get('api_key', '')
@@ -540,7 +729,7 @@ def initiate_knowlarity_call(to_number, from_number, call_log, config):
             'record': 'true' if config.record_calls else 'false'
         }
         
-        response = requests.post(url, json=payload, headers=headers)
+        response = get_client('knowlarity').post(url, json=payload, headers=headers)
         
         if response.status_code == 200:
             data = response.json()
@@ -567,8 +756,6 @@ def initiate_myoperator_call(to_number, from_number, call_log, config):
         Call ID
     """
     try:
-        import requests
-        
         api_key = config.api_key or config.config.get('api_key', '')
         api_secret = config.api_secret or config.config.get('api_secret', '')
         
@@ -597,7 +784,7 @@ def initiate_myoperator_call(to_number, from_number, call_log, config):
             'record': config.record_calls
         }
         
-        response = requests.post(url, json=payload, headers=headers)
+        response = get_client('myoperator').post(url, json=payload, headers=headers)
         
         if response.status_code == 200:
             data = response.json()
@@ -610,13 +797,16 @@ def initiate_myoperator_call(to_number, from_number, call_log, config):
         return None
 
 
-def assign_call_to_agent(call_log, agent=None):
+def assign_call_to_agent(call_log, agent=None, strategy=None, team=None, skill=None):
     """
     Assign call to agent
     
     Args:
         call_log: CallLog instance
-        agent: Agent instance (optional, uses auto-assign if not provided)
+        agent: Agent instance (optional, uses the assignment scheduler if not provided)
+        strategy: Scheduler strategy (optional, see assignment_service.pick_agent)
+        team: Team to prefer (optional)
+        skill: Skill to prefer (optional)
     
     Returns:
         Updated CallLog instance
@@ -624,11 +814,9 @@ def assign_call_to_agent(call_log, agent=None):
     if agent:
         call_log.agent = agent
     else:
-        # Auto-assign logic (round-robin, least busy, etc.)
-        # For now, just use the first available agent
-        available_agent = Agent.objects.filter(is_active=True).first()
-        if available_agent:
-            call_log.agent = available_agent
+        agent_id = pick_agent(CHANNEL_CALL, strategy=strategy, team=team, skill=skill)
+        if agent_id:
+            call_log.agent_id = agent_id
     
     call_log.save()
     return call_log
@@ -0,0 +1,328 @@
+"""
+Transcription Service
+Queues call recordings, transcribes them off the request path through a pluggable backend
+and extracts keywords, sentiment and a summary in batches
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from tempfile import SpooledTemporaryFile
+from urllib.parse import urlparse
+from ..models import Activity, CallLog, CallTranscriptionJob, TelephonyConfig
+from .http_client import get_client
+from .provider_registry import get_default_telephony_config
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Jobs claimed per worker batch
+TRANSCRIPTION_BATCH_SIZE = 20
+
+# Failed jobs are retried this many times before they are marked Failed
+TRANSCRIPTION_MAX_ATTEMPTS = 3
+
+# Running jobs not finished within this time are assumed abandoned by a dead worker
+TRANSCRIPTION_LEASE = timedelta(minutes=30)
+
+# Recordings are streamed to disk in chunks once larger than the in-memory limit
+RECORDING_CHUNK_SIZE = 64 * 1024
+RECORDING_MEMORY_LIMIT = 1024 * 1024
+RECORDING_MAX_BYTES = 100 * 1024 * 1024
+
+MAX_KEYWORDS = 8
+SUMMARY_SENTENCES = 2
+SUMMARY_MAX_LENGTH = 500
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further get got had has have having he her here hers
+him his how i if in into is it its just know let like me more most my no nor not now of off ok okay on once only or
+other our ours out over own please right same say see she should so some such sure than thank thanks that the their
+them then there these they this those through to too um uh under until up us very was we well were what when where
+which while who whom why will with would yeah yes you your yours
+""".split())
+
+POSITIVE_WORDS = frozenset("""
+good great excellent interested interesting love like happy perfect nice yes sure definitely book booking agree
+agreed confirm confirmed convenient helpful wonderful satisfied amazing fine deal visit
+""".split())
+
+NEGATIVE_WORDS = frozenset("""
+bad poor expensive costly not never no unhappy angry problem issue issues complaint cancel cancelled refund delay
+delayed disappointed worst terrible busy later lost wrong unfortunately
+""".split())
+
+WORD_PATTERN = re.compile(r"[a-z0-9]*[a-z][a-z0-9']*")
+SENTENCE_PATTERN = re.compile(r'(?<=[.!?])\s+')
+
+_backends = {}
+
+
+class TranscriptionError(Exception):
+    """Raised by backends when a recording cannot be transcribed"""
+
+
+class TranscriptionBackend:
+    """
+    Base class for transcription engines
+
+    Backends receive the downloaded recording and return the transcript text.
+    They run on worker threads and must not touch the database.
+    """
+
+    def transcribe(self, audio, content_type, call_log):
+        """
+        Args:
+            audio: Binary file object positioned at the start of the recording
+            content_type: Content type reported by the recording host
+            call_log: CallLog the recording belongs to
+
+        Returns:
+            Transcript text
+        """
+        raise NotImplementedError
+
+
+class LocalTranscriptionBackend(TranscriptionBackend):
+    """
+    Stand-in engine for development and tests
+
+    Reads recordings that are already text (e.g. transcripts served by a
+    provider or fixtures) and rejects audio, so jobs fail visibly until a real
+    speech-to-text backend is configured in TRANSCRIPTION_BACKEND.
+    """
+
+    def transcribe(self, audio, content_type, call_log):
+        if not (content_type or '').startswith('text/'):
+            raise TranscriptionError(f"Local engine cannot transcribe {content_type or 'unknown'} recordings")
+        return audio.read().decode('utf-8', errors='replace').strip()
+
+
+def get_transcription_backend():
+    """Get the configured backend, built once per process"""
+    path = getattr(settings, 'TRANSCRIPTION_BACKEND', 'api.services.transcription_service.LocalTranscriptionBackend')
+    backend = _backends.get(path)
+    if backend is None:
+        backend = _backends[path] = import_string(path)()
+    return backend
+
+
+def queue_transcriptions(call_logs):
+    """
+    Queue recordings for transcription, re-queueing calls whose recording changed
+
+    Args:
+        call_logs: Iterable of CallLog instances with a recording_url
+
+    Returns:
+        Number of jobs queued
+    """
+    recordings = {call_log.pk: call_log.recording_url for call_log in call_logs if call_log.recording_url}
+    if not recordings:
+        return 0
+
+    existing = {job.call_log_id: job for job in CallTranscriptionJob.objects.filter(call_log_id__in=recordings.keys())}
+    new_jobs = [
+        CallTranscriptionJob(call_log_id=call_log_id, recording_url=url)
+        for call_log_id, url in recordings.items() if call_log_id not in existing
+    ]
+    changed = [job for job in existing.values() if job.recording_url != recordings[job.call_log_id]]
+    for job in changed:
+        job.recording_url = recordings[job.call_log_id]
+        job.status = CallTranscriptionJob.Status.PENDING
+        job.attempts = 0
+        job.last_error = None
+
+    CallTranscriptionJob.objects.bulk_create(new_jobs, ignore_conflicts=True)
+    if changed:
+        CallTranscriptionJob.objects.bulk_update(changed, ['recording_url', 'status', 'attempts', 'last_error'])
+    return len(new_jobs) + len(changed)
+
+
+def _recording_auth(url):
+    """Credentials for recordings hosted by the configured telephony provider"""
+    config = get_default_telephony_config()
+    if config and config.provider == TelephonyConfig.Provider.TWILIO and config.account_sid and \
+            (urlparse(url).hostname or '').endswith('twilio.com'):
+        return (config.account_sid, config.auth_token)
+    return None
+
+
+def download_recording(url, auth=None):
+    """
+    Download a recording in chunks, spilling to a temporary file when large
+
+    Args:
+        url: Recording URL
+        auth: Optional (user, password) for the recording host
+
+    Returns:
+        Tuple of (file object positioned at the start, content type)
+
+    Raises:
+        TranscriptionError: If the recording is missing or too large
+        requests.RequestException: On connection errors and timeouts
+    """
+    with get_client('recordings').get(url, auth=auth, stream=True) as response:
+        if response.status_code != 200:
+            raise TranscriptionError(f"Recording download failed with status {response.status_code}")
+        audio = SpooledTemporaryFile(max_size=RECORDING_MEMORY_LIMIT)
+        size = 0
+        for chunk in response.iter_content(chunk_size=RECORDING_CHUNK_SIZE):
+            size += len(chunk)
+            if size > RECORDING_MAX_BYTES:
+                audio.close()
+                raise TranscriptionError(f"Recording is larger than {RECORDING_MAX_BYTES} bytes")
+            audio.write(chunk)
+        audio.seek(0)
+        return audio, response.headers.get('Content-Type', '').split(';')[0].strip()
+
+
+def _transcribe(backend, job, auth):
+    """Download and transcribe one recording; runs on a worker thread"""
+    try:
+        audio, content_type = download_recording(job.recording_url, auth=auth)
+        with audio:
+            return backend.transcribe(audio, content_type, job.call_log), None
+    except Exception as e:
+        logger.warning(f"Transcription of call {job.call_log_id} failed: {e}")
+        return None, str(e) or e.__class__.__name__
+
+
+def extract_call_insights(transcripts):
+    """
+    Extract keywords, sentiment and a summary for a batch of transcripts
+
+    Keywords are the most frequent non-stopwords; sentiment compares matches
+    against positive and negative word lists.
+
+    Args:
+        transcripts: List of transcript strings
+
+    Returns:
+        List of dictionaries with keywords, sentiment and summary, in input order
+    """
+    insights = []
+    for transcript in transcripts:
+        words = WORD_PATTERN.findall((transcript or '').lower())
+        counts = Counter(word for word in words if word not in STOPWORDS and len(word) > 2)
+        score = sum(word in POSITIVE_WORDS for word in words) - sum(word in NEGATIVE_WORDS for word in words)
+        if score > 0:
+            sentiment = Activity.Sentiment.POSITIVE
+        elif score < 0:
+            sentiment = Activity.Sentiment.NEGATIVE
+        else:
+            sentiment = Activity.Sentiment.NEUTRAL
+        summary = ' '.join(SENTENCE_PATTERN.split((transcript or '').strip())[:SUMMARY_SENTENCES])
+        insights.append({
+            'keywords': [word for word, _ in counts.most_common(MAX_KEYWORDS)],
+            'sentiment': sentiment if words else None,
+            'summary': summary[:SUMMARY_MAX_LENGTH] or None,
+        })
+    return insights
+
+
+def _claim_jobs(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(CallTranscriptionJob.objects.select_for_update(skip_locked=True).select_related('call_log').filter(
+            Q(status=CallTranscriptionJob.Status.PENDING) |
+            Q(status=CallTranscriptionJob.Status.RUNNING, started_at__lt=now - TRANSCRIPTION_LEASE)
+        ).order_by('created_at', 'id')[:batch_size])
+        for job in jobs:
+            job.status = CallTranscriptionJob.Status.RUNNING
+            job.started_at = now
+            job.attempts += 1
+        CallTranscriptionJob.objects.bulk_update(jobs, ['status', 'started_at', 'attempts'])
+    return jobs
+
+
+def process_transcription_jobs(batch_size=TRANSCRIPTION_BATCH_SIZE, concurrency=None):
+    """
+    Transcribe one batch of queued recordings and write the insights back
+
+    Jobs are claimed with SKIP LOCKED and marked Running, so several workers can
+    share the queue and no transaction is held while recordings download.
+    Downloads and transcription run on at most `concurrency` threads; keywords,
+    sentiment and summaries are then extracted for the whole batch and call logs,
+    their activities and the jobs are written with bulk updates. Jobs whose
+    recording was re-queued (or whose lease another worker took over) meanwhile
+    are left alone, so a stale transcript never overwrites a newer recording's.
+
+    Args:
+        batch_size: Maximum number of jobs to process
+        concurrency: Recordings transcribed at once (defaults to settings.TRANSCRIPTION_CONCURRENCY)
+
+    Returns:
+        Dictionary with counts per outcome
+    """
+    stats = {'completed': 0, 'retried': 0, 'failed': 0, 'superseded': 0}
+    jobs = _claim_jobs(batch_size)
+    if not jobs:
+        return stats
+
+    backend = get_transcription_backend()
+    concurrency = concurrency or getattr(settings, 'TRANSCRIPTION_CONCURRENCY', 4)
+    auth = {job.pk: _recording_auth(job.recording_url) for job in jobs}
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(jobs)))) as executor:
+        results = list(executor.map(lambda job: _transcribe(backend, job, auth[job.pk]), jobs))
+
+    with transaction.atomic():
+        # A recording changed (re-queued) or a lease taken over while transcribing makes the result stale
+        claimed = set(CallTranscriptionJob.objects.select_for_update().filter(
+            pk__in=[job.pk for job in jobs], status=CallTranscriptionJob.Status.RUNNING
+        ).values_list('pk', 'recording_url', 'started_at'))
+        current = []
+        for job, result in zip(jobs, results):
+            if (job.pk, job.recording_url, job.started_at) in claimed:
+                current.append((job, result))
+            else:
+                logger.info(f"Dropping stale transcription of call {job.call_log_id}")
+                stats['superseded'] += 1
+
+        done = [(job, transcript) for job, (transcript, error) in current if error is None]
+        now = timezone.now()
+        call_logs = []
+        activities = []
+        for (job, transcript), insight in zip(done, extract_call_insights([transcript for _, transcript in done])):
+            call_log = job.call_log
+            call_log.transcript = transcript
+            call_log.keywords = insight['keywords']
+            call_log.sentiment = insight['sentiment']
+            call_log.summary = insight['summary']
+            call_log.updated_at = now
+            call_logs.append(call_log)
+            if call_log.activity_id:
+                activities.append(Activity(
+                    pk=call_log.activity_id, transcript=transcript,
+                    keywords=insight['keywords'], sentiment=insight['sentiment'],
+                ))
+
+        for job, (transcript, error) in current:
+            if error is None:
+                job.status = CallTranscriptionJob.Status.COMPLETED
+                job.last_error = None
+                job.completed_at = now
+                stats['completed'] += 1
+            elif job.attempts >= TRANSCRIPTION_MAX_ATTEMPTS:
+                job.status = CallTranscriptionJob.Status.FAILED
+                job.last_error = error
+                job.completed_at = now
+                stats['failed'] += 1
+            else:
+                job.status = CallTranscriptionJob.Status.PENDING
+                job.last_error = error
+                stats['retried'] += 1
+
+        CallLog.objects.bulk_update(call_logs, ['transcript', 'keywords', 'sentiment', 'summary', 'updated_at'], batch_size=500)
+        Activity.objects.bulk_update(activities, ['transcript', 'keywords', 'sentiment'], batch_size=500)
+        CallTranscriptionJob.objects.bulk_update(
+            [job for job, _ in current], ['status', 'last_error', 'completed_at']
+        )
+    return stats
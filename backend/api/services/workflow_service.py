@@ -4,6 +4,8 @@ Handles workflow rule triggers and action execution
 """
 from django.utils import timezone
 from ..models import WorkflowRule, WorkflowAction, Deal, Invoice, Quote, Lead
+from .http_client import get_client
+from urllib.parse import urlparse
 
 
 def check_workflow_triggers(model_instance, trigger_type):
@@ -178,18 +180,18 @@ def execute_update_status_action(action, model_instance, config):
 
 def execute_webhook_action(action, model_instance, config):
     """Execute webhook action"""
-    import requests
-    
     url = config.get('url')
     method = config.get('method', 'POST')
     headers = config.get('headers', {})
     payload = config.get('payload', {})
     
     try:
+        # One pool and breaker per target host, so a dead endpoint does not trip the others
+        client = get_client(f"webhook:{urlparse(url).netloc}")
         if method.upper() == 'POST':
-            response = requests.post(url, json=payload, headers=headers)
+            response = client.post(url, json=payload, headers=headers)
         elif method.upper() == 'GET':
-            response = requests.get(url, params=payload, headers=headers)
+            response = client.get(url, params=payload, headers=headers)
         else:
             return False
         
@@ -0,0 +1,251 @@
+"""
+Model signal handlers
+"""
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import (
+    Agent, CallLog, ChatbotConversation, ChatbotQualificationRule, Commission, Deal, GSTConfiguration, IntegrationConfig,
+    Lead, Quote, TelephonyConfig,
+)
+
+
+@receiver([post_save, post_delete], sender=GSTConfiguration)
+def invalidate_gst_rate_index(sender, **kwargs):
+    """Rebuild the GST rate index after configuration changes"""
+    from .services.tax_service import invalidate_rate_index
+    invalidate_rate_index()
+
+
+@receiver([post_save, post_delete], sender=TelephonyConfig)
+@receiver([post_save, post_delete], sender=IntegrationConfig)
+def invalidate_provider_registry(sender, **kwargs):
+    """Reload provider configs and clients after configuration changes"""
+    from .services.provider_registry import invalidate_provider_registry
+    invalidate_provider_registry()
+
+
+@receiver([post_save, post_delete], sender=ChatbotQualificationRule)
+def invalidate_qualification_flow(sender, instance, **kwargs):
+    """Recompile the chatbot's qualification flow after its rules change"""
+    from .services.chatbot_service import invalidate_qualification_flow
+    invalidate_qualification_flow(instance.chatbot_id)
+
+
+@receiver(pre_save, sender=Commission)
+def remember_commission_rollup_state(sender, instance, **kwargs):
+    """Capture the stored agent/month/status/amount so post_save can move the rollup delta"""
+    from .services.commission_service import rollup_state
+    previous = None
+    if instance.pk:
+        stored = Commission.objects.filter(pk=instance.pk).only(
+            'agent_id', 'created_at', 'status', 'calculated_amount'
+        ).first()
+        previous = rollup_state(stored) if stored else None
+    instance._previous_rollup_state = previous
+
+
+@receiver(post_save, sender=Commission)
+def update_commission_rollup(sender, instance, **kwargs):
+    """Keep CommissionMonthlyRollup in step with commission changes"""
+    from .services.commission_service import record_commission_change, rollup_state
+    record_commission_change(getattr(instance, '_previous_rollup_state', None), rollup_state(instance))
+
+
+@receiver(post_delete, sender=Commission)
+def remove_commission_from_rollup(sender, instance, **kwargs):
+    """Take a deleted commission out of its rollup row"""
+    from .services.commission_service import record_commission_change, rollup_state
+    record_commission_change(rollup_state(instance), None)
+
+
+def _stage_field(instance):
+    return 'stage' if isinstance(instance, Deal) else 'status'
+
+
+@receiver(post_init, sender=Deal)
+@receiver(post_init, sender=Lead)
+def remember_loaded_stage(sender, instance, **kwargs):
+    """Keep the stage as loaded, so a change is detected without re-reading the row"""
+    field = _stage_field(instance)
+    if instance.pk and field in instance.__dict__:
+        instance._loaded_stage = instance.__dict__[field]
+
+
+@receiver(pre_save, sender=Deal)
+@receiver(pre_save, sender=Lead)
+def fetch_deferred_stage(sender, instance, **kwargs):
+    """Read the stored stage only when it was deferred when the instance was loaded"""
+    if instance.pk and not hasattr(instance, '_loaded_stage') and not instance._state.adding:
+        field = _stage_field(instance)
+        instance._loaded_stage = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+
+@receiver(post_save, sender=Deal)
+@receiver(post_save, sender=Lead)
+def record_stage_transition(sender, instance, created, **kwargs):
+    """Append a StageTransition when a deal stage or lead status changes"""
+    from .services.pipeline_service import record_transition
+    previous = None if created else getattr(instance, '_loaded_stage', None)
+    record_transition(instance, previous, getattr(instance, '_stage_changed_by', None))
+    instance._loaded_stage = getattr(instance, _stage_field(instance))
+
+
+@receiver(post_init, sender=Quote)
+def remember_loaded_parent_quote(sender, instance, **kwargs):
+    """Keep the parent as loaded, so moving a quote to another family is detected without re-reading the row"""
+    if instance.pk and 'parent_quote_id' in instance.__dict__:
+        instance._loaded_parent_quote_id = instance.__dict__['parent_quote_id']
+
+
+@receiver(pre_save, sender=Quote)
+def set_quote_root(sender, instance, **kwargs):
+    """Store the root of a quote's version chain so a whole family loads with one query"""
+    if instance.pk and not instance._state.adding:
+        if not hasattr(instance, '_loaded_parent_quote_id'):
+            instance._loaded_parent_quote_id = Quote.objects.filter(pk=instance.pk).values_list(
+                'parent_quote_id', flat=True
+            ).first()
+        if instance._loaded_parent_quote_id != instance.parent_quote_id:
+            # Its revisions follow it to the new family once it is saved
+            instance._previous_root_id = instance.root_quote_id or instance.pk
+
+    if not instance.parent_quote_id:
+        instance.root_quote_id = None
+        return
+    parent = Quote.objects.filter(pk=instance.parent_quote_id).values_list('root_quote_id', 'version').first()
+    if parent is None:
+        return
+    root_id, parent_version = parent
+    instance.root_quote_id = root_id or instance.parent_quote_id
+    if instance._state.adding and instance.version == 1:
+        instance.version = parent_version + 1
+
+
+@receiver(post_save, sender=Quote)
+def move_quote_revisions(sender, instance, **kwargs):
+    """Re-root the revisions below a quote whose parent changed"""
+    previous_root_id = instance.__dict__.pop('_previous_root_id', None)
+    instance._loaded_parent_quote_id = instance.parent_quote_id
+    if previous_root_id is None:
+        return
+    children = {}
+    for quote_id, parent_id in Quote.objects.filter(
+        Q(pk=previous_root_id) | Q(root_quote_id=previous_root_id)
+    ).values_list('id', 'parent_quote_id'):
+        children.setdefault(parent_id, []).append(quote_id)
+
+    descendants = []
+    pending = list(children.get(instance.pk, ()))
+    while pending:
+        quote_id = pending.pop()
+        if quote_id != instance.pk and quote_id not in descendants:
+            descendants.append(quote_id)
+            pending.extend(children.get(quote_id, ()))
+    if descendants:
+        Quote.objects.filter(pk__in=descendants).update(root_quote_id=instance.root_quote_id or instance.pk)
+
+
+@receiver(pre_delete, sender=Quote)
+def plan_quote_family_repair(sender, instance, **kwargs):
+    """Note the deleted quote's revisions (and family, for a root) before SET_NULL detaches them"""
+    instance._revision_ids = list(Quote.objects.filter(parent_quote_id=instance.pk).values_list('id', flat=True))
+    instance._family_ids = [] if instance.root_quote_id else list(Quote.objects.filter(
+        root_quote_id=instance.pk
+    ).order_by('version', 'created_at', 'id').values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Quote)
+def repair_quote_family(sender, instance, **kwargs):
+    """
+    Keep a family together after one of its quotes is deleted
+
+    The deleted quote's revisions move up to its parent; when the root itself
+    is deleted, the oldest remaining version becomes the new root.
+    """
+    revision_ids = getattr(instance, '_revision_ids', [])
+    family_ids = getattr(instance, '_family_ids', [])
+    if instance.root_quote_id:
+        if revision_ids:
+            Quote.objects.filter(pk__in=revision_ids).update(parent_quote_id=instance.parent_quote_id)
+        return
+    if not family_ids:
+        return
+    new_root_id = family_ids[0]
+    Quote.objects.filter(pk=new_root_id).update(parent_quote_id=None, root_quote_id=None)
+    Quote.objects.filter(pk__in=family_ids[1:]).update(root_quote_id=new_root_id)
+    Quote.objects.filter(pk__in=[pk for pk in revision_ids if pk != new_root_id]).update(parent_quote_id=new_root_id)
+
+
+@receiver([post_save, post_delete], sender=Agent)
+def invalidate_assignment_roster(sender, instance, **kwargs):
+    """Reload the assignment roster after agents change (logins excluded)"""
+    from .services.assignment_service import invalidate_roster
+    update_fields = kwargs.get('update_fields')
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_roster()
+
+
+@receiver(post_init, sender=CallLog)
+@receiver(post_init, sender=ChatbotConversation)
+def remember_load_holder(sender, instance, **kwargs):
+    """Note which agent an open call or chat counts against"""
+    from .services.assignment_service import remember_load_holder as remember
+    remember(instance)
+
+
+@receiver(post_init, sender=CallLog)
+def remember_call_stat_state(sender, instance, **kwargs):
+    """Note what a loaded call contributes to the daily call stats"""
+    from .services.call_stats_service import remember_call_stat_state as remember
+    remember(instance)
+
+
+@receiver(pre_save, sender=CallLog)
+@receiver(pre_delete, sender=CallLog)
+def fetch_deferred_call_stat_state(sender, instance, **kwargs):
+    """Read the stored contribution when the call was loaded with deferred fields"""
+    from .services.call_stats_service import STAT_FIELDS, call_stat_state
+    if instance.pk and not hasattr(instance, '_call_stat_state'):
+        stored = CallLog.objects.filter(pk=instance.pk).only(*STAT_FIELDS).first()
+        instance._call_stat_state = call_stat_state(stored) if stored else None
+
+
+@receiver(post_save, sender=CallLog)
+def update_call_stats(sender, instance, **kwargs):
+    """Keep CallDailyStat in step with calls finishing or changing"""
+    from .services.call_stats_service import track_call_stats
+    track_call_stats([instance])
+
+
+@receiver(post_delete, sender=CallLog)
+def remove_call_from_stats(sender, instance, **kwargs):
+    """Take a deleted call out of its daily stats row"""
+    from .services.call_stats_service import track_call_stats
+    track_call_stats([instance], deleted=True)
+
+
+@receiver(post_save, sender=CallLog)
+@receiver(post_save, sender=ChatbotConversation)
+def update_agent_load(sender, instance, **kwargs):
+    """Keep the agent load index in step with calls and chats opening, closing or moving"""
+    from .services.assignment_service import track_load_change
+    track_load_change(instance)
+
+
+@receiver(post_delete, sender=CallLog)
+@receiver(post_delete, sender=ChatbotConversation)
+def release_agent_load(sender, instance, **kwargs):
+    """Take a deleted open call or chat off its agent's load"""
+    from .services.assignment_service import track_load_change
+    track_load_change(instance, deleted=True)
+
+
+@receiver(post_save, sender=Lead)
+def count_new_lead(sender, instance, created, **kwargs):
+    """Count a new lead towards its agent's load for today"""
+    from .services.assignment_service import LOAD_LEADS_TODAY, record_load_change
+    if created:
+        record_load_change(LOAD_LEADS_TODAY, instance.agent_id, 1)
@@ -0,0 +1,122 @@
+"""
+Tests for the agent assignment scheduler
+"""
+from io import StringIO
+from types import SimpleNamespace
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.utils import timezone
+
+from api.models import CallLog
+from api.services import process_cache
+from api.services.assignment_service import (
+    CHANNEL_CALL, STRATEGY_LEAST_BUSY, STRATEGY_ROUND_ROBIN, get_agent_loads, get_roster, pick_agent,
+    rebuild_load_index,
+)
+from api.services.telephony_service import assign_call_to_agent
+
+
+@pytest.fixture
+def agents(db, admin_user):
+    User = get_user_model()
+    first = User.objects.create_user(username='first', password='x', role='Agent', team='North', deals_in='Residential')
+    second = User.objects.create_user(username='second', password='x', role='Telecaller', team='South', deals_in='Commercial, Plots')
+    return first, second
+
+
+def open_call(agent, status=CallLog.Status.RINGING):
+    return CallLog.objects.create(
+        direction=CallLog.Direction.INBOUND, from_number='+919800000001', to_number='+919800000002',
+        agent=agent, status=status, initiated_at=timezone.now(),
+    )
+
+
+@pytest.mark.django_db
+def test_round_robin_rotates_through_channel_roles(agents):
+    picks = [pick_agent(CHANNEL_CALL, strategy=STRATEGY_ROUND_ROBIN) for _ in range(4)]
+
+    assert sorted(picks[:2]) == sorted(agent.pk for agent in agents)
+    assert picks[:2] == picks[2:]
+
+
+@pytest.mark.django_db
+def test_least_busy_follows_call_events_without_queries(agents, settings, django_assert_num_queries):
+    settings.ASSIGNMENT_LOAD_INDEX = True
+    first, second = agents
+    call = open_call(first)
+    rebuild_load_index()
+
+    with django_assert_num_queries(0):
+        assert pick_agent(CHANNEL_CALL, strategy=STRATEGY_LEAST_BUSY) == second.pk
+
+    open_call(second)
+    open_call(second)
+    with django_assert_num_queries(0):
+        assert get_agent_loads([first.pk, second.pk]) == {first.pk: 1, second.pk: 2}
+    assert pick_agent(CHANNEL_CALL) == first.pk
+
+    call.status = CallLog.Status.COMPLETED
+    call.save()
+    assert get_agent_loads([first.pk])[first.pk] == 0
+
+
+@pytest.mark.django_db
+def test_reconciliation_corrects_writes_that_send_no_signals(agents, settings):
+    settings.ASSIGNMENT_LOAD_INDEX = True
+    first, second = agents
+    call = open_call(first)
+    rebuild_load_index()
+
+    CallLog.objects.filter(pk=call.pk).update(status=CallLog.Status.COMPLETED)
+    assert get_agent_loads([first.pk])[first.pk] == 1
+    call_command('reconcile_agent_loads', stdout=StringIO())
+    assert get_agent_loads([first.pk])[first.pk] == 0
+
+
+@pytest.mark.django_db
+def test_loads_are_counted_in_one_query_without_a_shared_cache(agents, settings, django_assert_num_queries):
+    settings.ASSIGNMENT_LOAD_INDEX = False
+    first, second = agents
+    call = open_call(first)
+    pick_agent(CHANNEL_CALL)  # Load the roster
+
+    with django_assert_num_queries(1):
+        assert pick_agent(CHANNEL_CALL, strategy=STRATEGY_LEAST_BUSY) == second.pk
+
+    CallLog.objects.filter(pk=call.pk).update(status=CallLog.Status.COMPLETED)
+    assert get_agent_loads([first.pk, second.pk]) == {first.pk: 0, second.pk: 0}
+
+
+@pytest.mark.django_db
+def test_roster_expires_for_agent_changes_made_elsewhere(agents, settings, monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(process_cache, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    settings.PROCESS_CACHE_MAX_AGE = 60
+    first, second = agents
+    assert second.pk in [agent[0] for agent in get_roster()]
+
+    # No signal reaches this process, as when another process deactivated the agent without a shared cache
+    get_user_model().objects.filter(pk=second.pk).update(is_active=False)
+    assert second.pk in [agent[0] for agent in get_roster()]
+    clock.now += 61
+    assert second.pk not in [agent[0] for agent in get_roster()]
+
+
+@pytest.mark.django_db
+def test_team_and_skill_narrow_candidates(agents):
+    first, second = agents
+    open_call(second)
+
+    assert pick_agent(CHANNEL_CALL, team='South') == second.pk
+    assert pick_agent(CHANNEL_CALL, skill='plots') == second.pk
+    # No agent has the skill: fall back to everyone
+    assert pick_agent(CHANNEL_CALL, skill='Villas') == first.pk
+
+
+@pytest.mark.django_db
+def test_calls_no_longer_pile_on_the_first_agent(agents):
+    assigned = {assign_call_to_agent(open_call(None)).agent_id for _ in range(4)}
+
+    assert assigned == {agent.pk for agent in agents}
@@ -0,0 +1,104 @@
+"""
+Tests for the daily call stats rollup and call analytics
+"""
+from datetime import timedelta
+
+import pytest
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import CallDailyStat, CallLog
+from api.services.call_stats_service import get_call_analytics, rebuild_call_stats
+from api.services.telephony_service import process_telephony_events
+
+
+def make_call(agent, lead=None, status=CallLog.Status.INITIATED, **fields):
+    return CallLog.objects.create(
+        direction=CallLog.Direction.OUTBOUND, from_number='+919800000002', to_number='+919800000001',
+        agent=agent, lead=lead, status=status, initiated_at=timezone.now(), **fields
+    )
+
+
+def rollup_rows():
+    return list(CallDailyStat.objects.order_by('lead_source').values(
+        'lead_source', 'total_calls', 'connected_calls', 'talk_seconds', 'ring_seconds', 'ring_samples'
+    ))
+
+
+@pytest.mark.django_db
+def test_calls_count_once_finished(agent_user, test_lead):
+    call = make_call(agent_user, test_lead)
+    assert not CallDailyStat.objects.exists()
+
+    call.status = CallLog.Status.COMPLETED
+    call.answered_at = call.initiated_at + timedelta(seconds=5)
+    call.duration, call.ring_duration = 60, 5
+    call.save()
+    call.notes = 'Follow up next week'
+    call.save()
+    make_call(agent_user, status=CallLog.Status.NO_ANSWER, ring_duration=30)
+
+    assert rollup_rows() == [
+        {'lead_source': '', 'total_calls': 1, 'connected_calls': 0, 'talk_seconds': 0, 'ring_seconds': 30, 'ring_samples': 1},
+        {'lead_source': test_lead.source, 'total_calls': 1, 'connected_calls': 1, 'talk_seconds': 60,
+         'ring_seconds': 5, 'ring_samples': 1},
+    ]
+
+    CallLog.objects.only('id', 'notes').get(pk=call.pk).delete()
+    reloaded = CallLog.objects.only('id', 'duration').get(status=CallLog.Status.NO_ANSWER)
+    reloaded.duration = 0
+    reloaded.save()
+    assert rollup_rows() == [
+        {'lead_source': '', 'total_calls': 1, 'connected_calls': 0, 'talk_seconds': 0, 'ring_seconds': 30, 'ring_samples': 1},
+        {'lead_source': test_lead.source, 'total_calls': 0, 'connected_calls': 0, 'talk_seconds': 0,
+         'ring_seconds': 0, 'ring_samples': 0},
+    ]
+
+
+@pytest.mark.django_db
+def test_webhook_worker_updates_stats_and_rebuild_matches(agent_user, test_lead):
+    make_call(agent_user, test_lead, call_sid='CA-1')
+    client = APIClient()
+    for call_status, extra in (('answered', {}), ('completed', {'CallDuration': '42'})):
+        client.post(reverse('twilio_status_webhook'), {'CallSid': 'CA-1', 'CallStatus': call_status, **extra})
+    process_telephony_events()
+
+    incremental = rollup_rows()
+    assert incremental[0]['total_calls'] == 1
+    assert incremental[0]['talk_seconds'] == 42
+    assert rebuild_call_stats() == 1
+    assert rollup_rows() == incremental
+
+
+@pytest.mark.django_db
+def test_rollup_rows_without_an_agent_are_unique(test_lead, django_assert_num_queries):
+    make_call(None, test_lead, status=CallLog.Status.NO_ANSWER)
+    make_call(None, status=CallLog.Status.BUSY)
+    day = timezone.localdate()
+
+    with pytest.raises(IntegrityError), transaction.atomic():
+        CallDailyStat.objects.create(date=day, agent=None, lead_source=test_lead.source)
+
+    # Lead sources are joined into the recount rather than loaded for every lead
+    with django_assert_num_queries(3):
+        assert rebuild_call_stats() == 2
+    assert [row['total_calls'] for row in rollup_rows()] == [1, 1]
+
+
+@pytest.mark.django_db
+def test_analytics_endpoint(authenticated_client, admin_user, agent_user, test_lead):
+    make_call(agent_user, test_lead, status=CallLog.Status.COMPLETED, duration=100, answered_at=timezone.now())
+    make_call(admin_user, status=CallLog.Status.BUSY)
+
+    analytics = get_call_analytics()
+    assert analytics['totals']['total_calls'] == 2
+    assert analytics['totals']['connect_rate'] == 50.0
+
+    today = timezone.localdate().isoformat()
+    response = authenticated_client.get('/api/call-logs/analytics/', {'start_date': today, 'agent': agent_user.pk})
+    assert response.status_code == 200
+    assert response.data['totals']['avg_talk_seconds'] == 100.0
+    assert [row['agent_id'] for row in response.data['by_agent']] == [agent_user.pk]
+    assert authenticated_client.get('/api/call-logs/analytics/', {'end_date': 'June'}).status_code == 400
@@ -0,0 +1,123 @@
+"""
+Tests for cold-storage archival of chatbot conversations
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.test import APIClient
+
+from api.models import Chatbot, ChatbotConversation, ChatbotMessage
+from api.services.chat_archive_service import archive_conversations, get_conversation_messages
+
+
+@pytest.fixture
+def media(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def conversations(db):
+    chatbot = Chatbot.objects.create(name='Site bot')
+    old = timezone.now() - timedelta(days=120)
+    result = {}
+    for name, status in (('ended', 'Completed'), ('empty', 'Abandoned'), ('active', 'Active'), ('recent', 'Qualified')):
+        conversation = ChatbotConversation.objects.create(conversation_id=name, chatbot=chatbot, status=status)
+        count = 0 if name == 'empty' else 3
+        for index in range(count):
+            ChatbotMessage.objects.create(
+                conversation=conversation, message_type=ChatbotMessage.MessageType.USER, content=f'{name} {index}',
+                confidence=Decimal('0.8750') if index == 1 else None, entities=[{'budget': index}],
+            )
+        result[name] = conversation
+    ChatbotConversation.objects.exclude(conversation_id='recent').update(last_message_at=old)
+    return result
+
+
+@pytest.mark.django_db
+def test_archives_ended_conversations_and_rehydrates_them(conversations, media):
+    before = [
+        (message.pk, message.content, message.confidence, message.entities)
+        for message in ChatbotMessage.objects.filter(conversation=conversations['ended']).order_by('timestamp', 'id')
+    ]
+
+    call_command('archive_chatbot_conversations', '--batch-size', '1')
+
+    archived = {conversation.conversation_id: conversation for conversation in ChatbotConversation.objects.all()}
+    assert archived['ended'].archived_at and archived['empty'].archived_at
+    assert archived['active'].archived_at is None and archived['recent'].archived_at is None
+    assert archived['ended'].archived_message_count == 3
+    assert archived['empty'].archive_segment is None
+    assert not ChatbotMessage.objects.filter(conversation=conversations['ended']).exists()
+    assert ChatbotMessage.objects.filter(conversation=conversations['active']).count() == 3
+    assert list(media.rglob('*.jsonl.gz'))
+
+    messages = get_conversation_messages(archived['ended'])
+    assert [(message.pk, message.content, message.confidence, message.entities) for message in messages] == before
+    assert archived['ended'].message_count == 3
+    assert archive_conversations() == {'conversations': 0, 'messages': 0}
+
+
+@pytest.mark.django_db
+def test_message_endpoints_read_through_the_archive(conversations, media, admin_user):
+    archive_conversations()
+    conversation = conversations['ended']
+    ChatbotMessage.objects.create(conversation=conversation, message_type=ChatbotMessage.MessageType.SYSTEM, content='reopened')
+    client = APIClient()
+    client.force_authenticate(admin_user)
+
+    contents = ['ended 0', 'ended 1', 'ended 2', 'reopened']
+    stream = client.get(f'/api/chatbot-conversations/{conversation.pk}/messages/').data
+    assert [message['content'] for message in stream['results']] == contents
+    detail = client.get(f'/api/chatbot-conversations/{conversation.pk}/').data
+    assert [message['content'] for message in detail['messages']] == contents
+    listed = client.get('/api/chatbot-messages/', {'conversation_id': conversation.pk}).data
+    assert listed['count'] == 4
+    assert listed['next'] is None
+    newest_first = client.get('/api/chatbot-messages/', {'conversation_id': conversation.pk, 'ordering': '-timestamp'})
+    assert [message['content'] for message in newest_first.data['results']] == contents[::-1]
+
+    rows = {row['conversation_id']: row for row in client.get('/api/chatbot-conversations/').data['results']}
+    assert rows['ended']['message_count'] == 4
+
+
+@pytest.mark.django_db
+def test_messages_added_after_archival_are_archived_again(conversations, media):
+    archive_conversations()
+    conversation = conversations['ended']
+    ChatbotMessage.objects.create(conversation=conversation, message_type=ChatbotMessage.MessageType.SYSTEM, content='reopened')
+
+    # Not until the new message is old enough
+    assert archive_conversations() == {'conversations': 0, 'messages': 0}
+    # 'recent' qualifies too once the cutoff is now
+    assert archive_conversations(days=0) == {'conversations': 2, 'messages': 4}
+    conversation.refresh_from_db()
+    assert not ChatbotMessage.objects.filter(conversation=conversation).exists()
+    assert conversation.archived_message_count == 4
+    assert [message.content for message in get_conversation_messages(conversation)] == [
+        'ended 0', 'ended 1', 'ended 2', 'reopened'
+    ]
+
+
+@pytest.mark.django_db
+def test_archived_transcript_is_paginated_and_role_filtered(conversations, media, admin_user, agent_user, monkeypatch):
+    monkeypatch.setattr(PageNumberPagination, 'page_size', 2)
+    archive_conversations()
+    conversation = conversations['ended']
+    client = APIClient()
+    client.force_authenticate(admin_user)
+
+    first = client.get('/api/chatbot-messages/', {'conversation_id': conversation.pk}).data
+    assert (first['count'], [message['content'] for message in first['results']]) == (3, ['ended 0', 'ended 1'])
+    second = client.get(first['next']).data
+    assert [message['content'] for message in second['results']] == ['ended 2']
+
+    # Agents only read conversations assigned to them, archived or not
+    client.force_authenticate(agent_user)
+    assert client.get('/api/chatbot-messages/', {'conversation_id': conversation.pk}).data['count'] == 0
+    ChatbotConversation.objects.filter(pk=conversation.pk).update(assigned_agent=agent_user)
+    assert client.get('/api/chatbot-messages/', {'conversation_id': conversation.pk}).data['count'] == 3
@@ -0,0 +1,71 @@
+"""
+Tests for the chatbot conversation list and message stream
+"""
+import pytest
+from rest_framework.test import APIClient
+
+from api.models import Chatbot, ChatbotConversation, ChatbotMessage
+
+
+@pytest.fixture
+def conversations(db):
+    chatbot = Chatbot.objects.create(name='Site bot', status=Chatbot.Status.ACTIVE)
+    result = []
+    for number in range(3):
+        conversation = ChatbotConversation.objects.create(conversation_id=f'conv_{number}', chatbot=chatbot)
+        for index in range(number * 2):
+            ChatbotMessage.objects.create(
+                conversation=conversation, message_type=ChatbotMessage.MessageType.USER,
+                content=f'Message {index} ' + 'x' * 200,
+            )
+        result.append(conversation)
+    return result
+
+
+@pytest.fixture
+def api_client(admin_user):
+    client = APIClient()
+    client.force_authenticate(admin_user)
+    return client
+
+
+@pytest.mark.django_db
+def test_list_annotates_counts_and_previews_without_transcripts(conversations, api_client, django_assert_max_num_queries):
+    with django_assert_max_num_queries(4):
+        response = api_client.get('/api/chatbot-conversations/')
+    assert response.status_code == 200
+    rows = {row['conversation_id']: row for row in response.data['results']}
+    assert 'messages' not in rows['conv_2']
+    assert rows['conv_2']['message_count'] == 4
+    assert rows['conv_2']['last_message_preview'].startswith('Message 3 ')
+    assert len(rows['conv_2']['last_message_preview']) == 120
+    assert rows['conv_0']['message_count'] == 0
+    assert rows['conv_0']['last_message_preview'] is None
+
+
+@pytest.mark.django_db
+def test_messages_are_streamed_with_cursor_pages(conversations, api_client):
+    url = f'/api/chatbot-conversations/{conversations[2].pk}/messages/'
+    response = api_client.get(url, {'page_size': 3})
+    assert [message['content'][:9] for message in response.data['results']] == ['Message 0', 'Message 1', 'Message 2']
+
+    response = api_client.get(response.data['next'])
+    assert [message['content'][:9] for message in response.data['results']] == ['Message 3']
+    assert response.data['next'] is None
+
+
+@pytest.mark.django_db
+def test_chatbot_list_annotates_conversation_counters(conversations, api_client, test_lead, django_assert_max_num_queries):
+    ChatbotConversation.objects.filter(conversation_id='conv_1').update(is_qualified=True, lead=test_lead)
+    Chatbot.objects.create(name='Idle bot')
+
+    with django_assert_max_num_queries(4):
+        response = api_client.get('/api/chatbots/')
+    rows = {row['name']: row for row in response.data['results']}
+    assert {key: rows['Site bot'][key] for key in (
+        'conversations_count', 'qualified_count', 'converted_count', 'active_today_count'
+    )} == {'conversations_count': 3, 'qualified_count': 1, 'converted_count': 1, 'active_today_count': 3}
+    assert rows['Idle bot']['conversations_count'] == 0
+
+    detail = api_client.get(f"/api/chatbots/{rows['Site bot']['id']}/").data
+    assert detail['qualified_count'] == 1
@@ -0,0 +1,84 @@
+"""
+Tests for compiled chatbot qualification flows
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from api.models import Chatbot, ChatbotConversation, ChatbotQualificationRule
+from api.services import process_cache
+from api.services.chatbot_service import (
+    calculate_qualification_score, get_qualification_flow, send_user_message, start_conversation,
+)
+
+
+@pytest.fixture
+def chatbot(db):
+    chatbot = Chatbot.objects.create(
+        name='Site bot', status=Chatbot.Status.ACTIVE, welcome_message='Hi!', auto_create_lead=False,
+        config={'qualification_threshold': 20},
+    )
+    ChatbotQualificationRule.objects.create(
+        chatbot=chatbot, name='Budget', question='What is your budget?', field_name='budget', order=1,
+        scoring_rules={'positive_keywords': ['Crore'], 'positive_score': 15},
+    )
+    ChatbotQualificationRule.objects.create(
+        chatbot=chatbot, name='Timeline', question='When do you plan to buy?', field_name='timeline', order=2,
+        field_type='choice', options=['This month', 'Later'], scoring_rules={'option_scores': {'This month': 10}},
+    )
+    return chatbot
+
+
+@pytest.mark.django_db
+def test_flow_is_compiled_once_per_rule_change(chatbot, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        flow = get_qualification_flow(chatbot)
+        assert get_qualification_flow(chatbot.pk) is flow
+    assert [question.field_name for question in flow] == ['budget', 'timeline']
+    assert flow[0].positive_keywords == ('crore',)
+
+    rule = ChatbotQualificationRule.objects.get(field_name='budget')
+    rule.is_active = False
+    rule.save()
+    assert [question.field_name for question in get_qualification_flow(chatbot)] == ['timeline']
+
+
+@pytest.mark.django_db
+def test_flow_expires_for_rule_changes_made_elsewhere(chatbot, settings, monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(process_cache, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    settings.PROCESS_CACHE_MAX_AGE = 60
+    assert len(get_qualification_flow(chatbot)) == 2
+
+    # No signal reaches this process, as when another process edited the rules without a shared cache
+    ChatbotQualificationRule.objects.filter(field_name='budget').update(is_active=False)
+    assert len(get_qualification_flow(chatbot)) == 2
+    clock.now += 61
+    assert [question.field_name for question in get_qualification_flow(chatbot)] == ['timeline']
+
+
+@pytest.mark.django_db
+def test_answers_are_scored_and_saved_once_per_message(chatbot, django_assert_num_queries):
+    conversation = start_conversation(chatbot, visitor_name='Asha')
+    assert conversation.messages.count() == 2
+
+    conversation = ChatbotConversation.objects.select_related('chatbot').get(pk=conversation.pk)
+    get_qualification_flow(chatbot)
+    # User message, bot question and one conversation save
+    with django_assert_num_queries(3):
+        send_user_message(conversation, 'About 2 crore')
+
+    _, bot_response = send_user_message(conversation, 'This month')
+    conversation.refresh_from_db()
+    assert conversation.qualification_data == {'budget': 'About 2 crore', 'timeline': 'This month'}
+    assert conversation.qualification_score == 25
+    assert conversation.status == ChatbotConversation.Status.QUALIFIED
+    assert conversation.metadata['qualification_index'] == 2
+    assert bot_response.content
+
+
+@pytest.mark.django_db
+def test_calculate_qualification_score_matches_compiled_scoring(chatbot):
+    rule = ChatbotQualificationRule.objects.get(field_name='budget')
+    assert calculate_qualification_score(rule, '3 CRORE, maybe more crore') == 15
+    assert calculate_qualification_score(rule, 'not sure') == 0
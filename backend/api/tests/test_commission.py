@@ -0,0 +1,149 @@
+"""
+Tests for commission summaries, rollups and analytics
+"""
+from decimal import Decimal
+
+import pytest
+from rest_framework.test import APIClient
+
+from api.models import Commission, CommissionMonthlyRollup, CommissionRule, CommissionSplit, Deal
+from api.services.commission_service import (
+    approve_commission, calculate_commission, compute_commissions, create_commission_split,
+    get_commission_analytics, mark_commission_paid, rebuild_commission_rollups, summarize_commissions,
+)
+
+
+@pytest.fixture
+def commissions(sales_deal, agent_user, sales_manager_user):
+    agent_user.reports_to = sales_manager_user
+    agent_user.save()
+    sales_deal.refresh_from_db()
+    first = calculate_commission(sales_deal, agent_user, commission_type='Fixed', fixed_amount='1000')
+    second = calculate_commission(sales_deal, agent_user, commission_type='Fixed', fixed_amount='2000')
+    third = calculate_commission(sales_deal, sales_manager_user, commission_type='Percentage', commission_percentage='1')
+    return first, second, third
+
+
+def rollup_rows():
+    return {
+        (row.agent_id, row.status): (row.commission_count, row.total_amount)
+        for row in CommissionMonthlyRollup.objects.exclude(commission_count=0)
+    }
+
+
+@pytest.mark.django_db
+def test_summary_is_one_query(commissions, django_assert_num_queries):
+    mark_commission_paid(commissions[0])
+    
+    with django_assert_num_queries(1):
+        summary = summarize_commissions(Commission.objects.all())
+    
+    assert summary == {
+        'total_earned': Decimal('1000'), 'pending': Decimal('52000'), 'approved': Decimal('0'),
+        'total_commissions': 3, 'paid_commissions': 1,
+    }
+
+
+@pytest.mark.django_db
+def test_rollups_follow_status_changes_and_deletes(commissions, agent_user):
+    first, second, _ = commissions
+    approve_commission(first)
+    mark_commission_paid(second)
+    second.delete()
+    
+    rows = rollup_rows()
+    assert rows[(agent_user.pk, 'Approved')] == (1, Decimal('1000'))
+    assert (agent_user.pk, 'Pending') not in rows
+    assert (agent_user.pk, 'Paid') not in rows
+    
+    live = rollup_rows()
+    rebuild_commission_rollups()
+    assert rollup_rows() == live
+
+
+@pytest.mark.django_db
+def test_analytics_groups_by_agent_team_and_month(commissions, agent_user, sales_manager_user,
+                                                  django_assert_num_queries):
+    mark_commission_paid(commissions[1])
+    
+    with django_assert_num_queries(1):
+        analytics = get_commission_analytics()
+    
+    assert analytics['totals']['count'] == 3
+    assert analytics['totals']['paid'] == Decimal('2000')
+    assert [row['agent_id'] for row in analytics['by_agent']] == [agent_user.pk, sales_manager_user.pk]
+    teams = {row['manager_id']: row for row in analytics['by_team']}
+    assert teams[sales_manager_user.pk]['pending'] == Decimal('1000')
+    assert len(analytics['by_month']) == 1
+
+
+@pytest.mark.django_db
+def test_analytics_endpoint_scopes_agents_to_themselves(commissions, authenticated_client, agent_user):
+    response = authenticated_client.get('/api/commissions/analytics/')
+    
+    assert response.status_code == 200
+    assert [row['agent_id'] for row in response.data['by_agent']] == [agent_user.pk]
+    assert authenticated_client.get('/api/commissions/analytics/', {'start_month': 'May'}).status_code == 400
+
+
+@pytest.fixture
+def closed_deal(sales_deal, agent_user, sales_manager_user):
+    agent_user.reports_to = sales_manager_user
+    agent_user.save()
+    sales_deal.stage = Deal.Stage.CLOSED
+    sales_deal.save()
+    sales_deal.refresh_from_db()
+    return sales_deal
+
+
+@pytest.mark.django_db
+def test_engine_picks_rule_by_slab_and_priority(closed_deal, sales_manager_user):
+    CommissionRule.objects.create(name='Small deals', max_deal_value=1000000, commission_percentage='3')
+    CommissionRule.objects.create(name='Agents', agent_role='Agent', commission_percentage='1.5', manager_split_percentage='20')
+    CommissionRule.objects.create(name='Flat', commission_type='Fixed', fixed_amount='5000', priority=-1)
+    
+    stats = compute_commissions()
+    
+    assert (stats['deals'], stats['created'], stats['skipped']) == (1, 1, 0)
+    commission = Commission.objects.get(deal=closed_deal)
+    assert commission.commission_percentage == Decimal('1.5')
+    assert commission.calculated_amount == Decimal('75000')
+    splits = {split.role: (split.agent_id, split.allocated_amount) for split in CommissionSplit.objects.all()}
+    assert splits == {'Closer': (closed_deal.agent_id, Decimal('60000')), 'Manager': (sales_manager_user.pk, Decimal('15000'))}
+    assert rollup_rows() == {(closed_deal.agent_id, 'Pending'): (1, Decimal('75000'))}
+
+
+@pytest.mark.django_db
+def test_engine_falls_back_to_default_rate_and_skips_existing(closed_deal, django_assert_max_num_queries):
+    with django_assert_max_num_queries(12):
+        compute_commissions()
+    
+    assert Commission.objects.get(deal=closed_deal).calculated_amount == Decimal('100000')
+    assert compute_commissions()['skipped'] == 1
+    assert Commission.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_recalculate_replaces_only_pending_commissions(closed_deal):
+    compute_commissions()
+    CommissionRule.objects.create(name='Flat', commission_type='Fixed', fixed_amount='5000')
+    
+    stats = compute_commissions(recalculate=True)
+    
+    assert (stats['created'], stats['replaced']) == (1, 1)
+    assert Commission.objects.get(deal=closed_deal).calculated_amount == Decimal('5000')
+    assert rollup_rows() == {(closed_deal.agent_id, 'Pending'): (1, Decimal('5000'))}
+    
+    approve_commission(Commission.objects.get(deal=closed_deal))
+    assert compute_commissions(recalculate=True)['skipped'] == 1
+
+
+@pytest.mark.django_db
+def test_commission_split_rejects_unknown_agents(commissions, agent_user):
+    with pytest.raises(ValueError):
+        create_commission_split(commissions[0], [{'agent_id': agent_user.pk, 'split_percentage': 50}])
+    with pytest.raises(Exception):
+        create_commission_split(commissions[0], [{'agent_id': 999999, 'split_percentage': 100}])
+    
+    splits = create_commission_split(commissions[0], [{'agent_id': agent_user.pk, 'split_percentage': 100}])
+    assert splits[0].allocated_amount == Decimal('1000')
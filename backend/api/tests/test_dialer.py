@@ -0,0 +1,115 @@
+"""
+Tests for power-dialer campaigns
+"""
+from datetime import timedelta
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import CallLog, DialerCampaign, DialerCampaignEntry, Lead, TelephonyConfig
+from api.services import dialer_service
+from api.services.dialer_service import get_dial_ratio, run_campaign_tick, start_campaign
+
+
+@pytest.fixture
+def dialed(monkeypatch):
+    """Record provider calls instead of placing them"""
+    calls = []
+
+    def fake_initiate(to_number, lead=None, agent=None, telephony_config=None, **kwargs):
+        call_log = CallLog.objects.create(
+            direction=CallLog.Direction.OUTBOUND, from_number=telephony_config.phone_number, to_number=to_number,
+            lead=lead, agent=agent, provider=telephony_config.provider, initiated_at=timezone.now(),
+        )
+        calls.append(call_log)
+        return call_log
+
+    monkeypatch.setattr(dialer_service, 'initiate_outbound_call', fake_initiate)
+    return calls
+
+
+@pytest.fixture
+def campaign(db, agent_user, admin_user):
+    TelephonyConfig.objects.create(
+        name='Main', provider=TelephonyConfig.Provider.TWILIO, is_default=True, phone_number='+919800000000',
+        config={'max_concurrent_calls': 3},
+    )
+    for index in range(6):
+        Lead.objects.create(name=f'Lead {index}', phone=f'98000000{index:02d}', email=f'l{index}@test.com',
+                            source='Website', status='New', agent=agent_user)
+    Lead.objects.create(name='Contacted', phone='9811111111', email='c@test.com', source='Website',
+                        status='Contacted', agent=agent_user)
+    campaign = DialerCampaign.objects.create(name='New leads', lead_filter={'status': 'New'}, created_by=admin_user)
+    campaign.agents.add(agent_user)
+    return campaign
+
+
+def finish(call_logs, answered):
+    for call_log in call_logs:
+        call_log.status = CallLog.Status.COMPLETED if answered else CallLog.Status.NO_ANSWER
+        call_log.answered_at = timezone.now() if answered else None
+        call_log.save()
+
+
+@pytest.mark.django_db
+def test_dials_within_agent_capacity_and_skips_busy_leads(campaign, dialed, agent_user):
+    assert start_campaign(campaign) == 6
+    leads = list(Lead.objects.filter(status='New').order_by('id'))
+    CallLog.objects.create(direction=CallLog.Direction.INBOUND, from_number=leads[0].phone, to_number='+919800000000',
+                           lead=leads[0], status=CallLog.Status.ANSWERED, initiated_at=timezone.now())
+    CallLog.objects.create(direction=CallLog.Direction.OUTBOUND, from_number='+919800000000', to_number=leads[1].phone,
+                           lead=leads[1], status=CallLog.Status.NO_ANSWER, initiated_at=timezone.now() - timedelta(hours=2))
+
+    assert run_campaign_tick(campaign) == {'finished': 0, 'dialed': 1, 'failed': 0, 'skipped': 2}
+    assert [call.lead_id for call in dialed] == [leads[2].pk]
+    assert run_campaign_tick(campaign)['dialed'] == 0  # Agent still on the call
+
+    finish(dialed, answered=True)
+    assert run_campaign_tick(campaign) == {'finished': 1, 'dialed': 1, 'failed': 0, 'skipped': 0}
+    entry = DialerCampaignEntry.objects.get(campaign=campaign, lead=leads[2])
+    assert (entry.status, entry.outcome, entry.answered, entry.agent_id) == ('Completed', 'Completed', True, agent_user.pk)
+
+
+@pytest.mark.django_db
+def test_low_answer_rate_raises_dial_ratio_up_to_provider_limit(campaign, dialed, agent_user):
+    campaign.calls_per_agent = 2
+    campaign.max_dial_ratio = 3
+    campaign.save()
+    start_campaign(campaign)
+    now = timezone.now()
+    DialerCampaignEntry.objects.bulk_create([
+        DialerCampaignEntry(campaign=campaign, lead=Lead.objects.create(
+            name='Old', phone=f'97000000{index:02d}', email=f'o{index}@test.com', source='Web', agent=agent_user
+        ), status='Completed', answered=index == 0, finished_at=now)
+        for index in range(10)
+    ])
+
+    assert get_dial_ratio(campaign) == 3.0
+    assert run_campaign_tick(campaign)['dialed'] == 3  # 6 agent slots, but the provider allows 3
+
+    finish(dialed, answered=False)
+    assert run_campaign_tick(campaign)['dialed'] == 3
+    finish(dialed[3:], answered=False)
+    assert run_campaign_tick(campaign)['finished'] == 3
+    campaign.refresh_from_db()
+    assert campaign.status == DialerCampaign.Status.COMPLETED
+    assert DialerCampaignEntry.objects.filter(campaign=campaign, status='Pending').count() == 0
+
+
+@pytest.mark.django_db
+def test_campaign_api(campaign, admin_user, dialed):
+    client = APIClient()
+    client.force_authenticate(admin_user)
+
+    response = client.post('/api/dialer-campaigns/', {'name': 'Bad', 'lead_filter': {'phone': '1'}}, format='json')
+    assert response.status_code == 400
+
+    assert client.post(f'/api/dialer-campaigns/{campaign.pk}/start/').data == {'status': 'Running', 'added': 6}
+    assert client.post(f'/api/dialer-campaigns/{campaign.pk}/pause/').data == {'status': 'Paused'}
+    assert run_campaign_tick(campaign)['dialed'] == 0
+
+    stats = client.get(f'/api/dialer-campaigns/{campaign.pk}/stats/').data
+    assert stats['entries']['Pending'] == 6
+    assert client.get(f'/api/dialer-campaigns/{campaign.pk}/entries/', {'status': 'Pending'}).status_code == 200
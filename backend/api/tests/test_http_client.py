@@ -0,0 +1,117 @@
+"""
+Tests for the provider HTTP client against a local stub server
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from api.services.http_client import CircuitOpenError, ProviderClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.client_address[1]))
+        status = server.statuses.pop(0) if server.statuses else 200
+        if self.path == '/slow':
+            time.sleep(0.5)
+        body = b'ok'
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.requests = []
+    server.statuses = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(**options):
+    return ProviderClient('stub', **{'backoff_factor': 0, **options})
+
+
+def test_reuses_connections_and_records_latency(stub_server):
+    server, base_url = stub_server
+    client = make_client()
+
+    for _ in range(3):
+        assert client.get(f"{base_url}/ping").status_code == 200
+
+    assert len({port for _, port in server.requests}) == 1
+    metrics = client.metrics()
+    assert (metrics['requests'], metrics['errors'], metrics['circuit']) == (3, 0, 'closed')
+    assert metrics['latency_ms']['p50'] is not None
+
+
+def test_read_timeout_is_enforced(stub_server):
+    _, base_url = stub_server
+    client = make_client(read_timeout=0.1)
+
+    with pytest.raises(requests.Timeout):
+        client.get(f"{base_url}/slow")
+    assert client.metrics()['errors'] == 1
+
+
+def test_retries_idempotent_requests_on_unavailable(stub_server):
+    server, base_url = stub_server
+    server.statuses = [503, 503]
+    client = make_client(retries=2)
+
+    assert client.get(f"{base_url}/flaky").status_code == 200
+    assert len(server.requests) == 3
+
+    server.statuses = [503]
+    assert client.post(f"{base_url}/create").status_code == 503
+    assert len(server.requests) == 4
+
+
+def test_circuit_opens_and_recovers(stub_server):
+    server, base_url = stub_server
+    server.statuses = [500, 500]
+    client = make_client(failure_threshold=2, reset_timeout=0.2, retries=0)
+
+    client.post(f"{base_url}/a")
+    client.post(f"{base_url}/a")
+    with pytest.raises(CircuitOpenError):
+        client.post(f"{base_url}/a")
+    assert len(server.requests) == 2
+    assert client.metrics()['short_circuited'] == 1
+
+    time.sleep(0.25)
+    assert client.post(f"{base_url}/a").status_code == 200
+    assert client.metrics()['circuit'] == 'closed'
+
+
+def test_failed_trial_of_any_kind_reopens_the_circuit(stub_server, monkeypatch):
+    server, base_url = stub_server
+    server.statuses = [500]
+    client = make_client(failure_threshold=1, reset_timeout=0.2, retries=0)
+    client.post(f"{base_url}/a")
+
+    time.sleep(0.25)
+    with monkeypatch.context() as patch:
+        patch.setattr(client.session, 'request', lambda *args, **kwargs: 1 / 0)
+        with pytest.raises(ZeroDivisionError):
+            client.post(f"{base_url}/a")
+    assert not client.breaker.trial_running
+
+    time.sleep(0.25)
+    assert client.post(f"{base_url}/a").status_code == 200
@@ -0,0 +1,28 @@
+"""
+Tests for the multi-keyword matcher
+"""
+import random
+
+from api.services.keyword_matcher import KeywordMatcher
+
+
+def test_finds_overlapping_keywords_ignoring_case():
+    matcher = KeywordMatcher(['he', 'She', 'his', 'hers', 'ushers'])
+    assert matcher.find('USHERS') == {0, 1, 3, 4}
+    assert matcher.find('this') == {2}
+    assert matcher.find('') == set()
+    assert matcher.first('a fresh shell') == 0
+
+
+def test_matches_naive_substring_search():
+    rng = random.Random(7)
+    keywords = [''.join(rng.choice('abc') for _ in range(rng.randint(1, 4))) for _ in range(30)]
+    matcher = KeywordMatcher(keywords)
+    for _ in range(200):
+        text = ''.join(rng.choice('abcd') for _ in range(rng.randint(0, 20)))
+        assert matcher.find(text) == {index for index, keyword in enumerate(keywords) if keyword in text}
+
+
+def test_empty_keyword_matches_everything():
+    assert KeywordMatcher(['', 'x']).find('abc') == {0}
+    assert KeywordMatcher([]).first('anything') is None
@@ -0,0 +1,179 @@
+"""
+Tests for automatic ledger posting
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from django.utils import timezone
+
+from api.models import BookingPayment, CreditNote, Ledger, LedgerAccount, LedgerCheckpoint, Payment, Refund
+from api.services.ledger_service import (
+    create_checkpoints, get_balance_before, get_statement,
+    post_booking_payment, post_credit_note, post_payment, post_refund,
+)
+from api.services.payment_service import record_payment
+
+
+@pytest.fixture
+def unit_invoice(test_invoice, test_unit):
+    test_invoice.unit = test_unit
+    test_invoice.save()
+    return test_invoice
+
+
+def account_balance(key):
+    return LedgerAccount.objects.get(account_key=key).balance
+
+
+@pytest.mark.django_db
+def test_payment_posts_customer_unit_and_project_entries(unit_invoice, test_client, test_unit):
+    payment = record_payment(unit_invoice, Decimal('40000'), Payment.Method.UPI)
+    
+    entries = Ledger.objects.filter(source_type='Payment', source_id=payment.pk)
+    assert set(entries.values_list('ledger_type', flat=True)) == {'Customer', 'Unit', 'Project'}
+    assert all(entry.credit == Decimal('40000') and entry.balance == Decimal('-40000') for entry in entries)
+    assert account_balance(f'Customer:{test_client.pk}') == Decimal('-40000')
+    assert account_balance(f'Project:{test_unit.floor.tower.project_id}') == Decimal('-40000')
+
+
+@pytest.mark.django_db
+def test_posting_is_idempotent(unit_invoice, test_client):
+    payment = record_payment(unit_invoice, Decimal('40000'), Payment.Method.UPI)
+    
+    assert post_payment(payment) == []
+    assert Ledger.objects.filter(source_id=payment.pk).count() == 3
+    assert account_balance(f'Customer:{test_client.pk}') == Decimal('-40000')
+
+
+@pytest.mark.django_db
+def test_running_balance_across_documents(unit_invoice, sales_deal, test_client, test_unit):
+    booking = BookingPayment.objects.create(
+        booking_id='BK-1', deal=sales_deal, unit=test_unit, client=test_client,
+        amount=Decimal('100000'), payment_method='Cheque', payment_date=timezone.now(),
+    )
+    post_booking_payment(booking)
+    refund = Refund.objects.create(
+        refund_id='RF-1', deal=sales_deal, booking_payment=booking, amount=Decimal('100000'),
+        reason=Refund.Reason.CHEQUE_BOUNCED, net_refund_amount=Decimal('90000'),
+        status=Refund.Status.PROCESSED, processed_at=timezone.now(),
+    )
+    post_refund(refund)
+    credit_note = CreditNote.objects.create(
+        credit_note_number='CN-1', deal=sales_deal, amount=Decimal('5000'),
+        reason='Discount', applied_to_invoice=unit_invoice,
+    )
+    post_credit_note(credit_note)
+    
+    customer_entries = Ledger.objects.filter(account__account_key=f'Customer:{test_client.pk}').order_by('id')
+    assert list(customer_entries.values_list('balance', flat=True)) == [
+        Decimal('-100000'), Decimal('-10000'), Decimal('-15000')
+    ]
+    assert account_balance(f'Unit:{test_unit.pk}') == Decimal('-15000')
+
+
+@pytest.mark.django_db
+def test_processing_refund_via_api_posts_debit(authenticated_client, sales_deal, test_client):
+    refund = Refund.objects.create(
+        refund_id='RF-2', deal=sales_deal, amount=Decimal('2000'),
+        reason=Refund.Reason.EXCESS_AMOUNT, net_refund_amount=Decimal('2000'),
+        status=Refund.Status.APPROVED,
+    )
+    
+    response = authenticated_client.post(f'/api/refunds/{refund.pk}/process/')
+    
+    assert response.status_code == 200
+    entry = Ledger.objects.get(source_type='Refund', source_id=refund.pk)
+    assert entry.debit == Decimal('2000')
+    assert account_balance(f'Customer:{test_client.pk}') == Decimal('2000')
+
+
+def make_payment(invoice, amount, day):
+    payment = Payment.objects.create(
+        payment_id=f'PAY-{day}-{amount}', invoice=invoice, amount=Decimal(amount),
+        method=Payment.Method.UPI, payment_date=timezone.make_aware(datetime(2024, 1, day)),
+    )
+    post_payment(payment)
+    return payment
+
+
+@pytest.mark.django_db
+def test_statement_running_balance_handles_back_dated_entries(test_invoice, test_client):
+    make_payment(test_invoice, 100, 10)
+    make_payment(test_invoice, 200, 20)
+    make_payment(test_invoice, 50, 5)  # posted last, dated first
+    account = LedgerAccount.objects.get(account_key=f'Customer:{test_client.pk}')
+    
+    opening, entries = get_statement(account)
+    
+    assert opening == Decimal('0')
+    assert [entry.running_balance for entry in entries] == [Decimal('-50'), Decimal('-150'), Decimal('-350')]
+    
+    opening, entries = get_statement(account, start=timezone.make_aware(datetime(2024, 1, 8)))
+    assert opening == Decimal('-50')
+    assert [entry.running_balance for entry in entries] == [Decimal('-150'), Decimal('-350')]
+
+
+@pytest.mark.django_db
+def test_checkpoints_seed_balances_and_are_invalidated_by_back_dated_entries(test_invoice, test_client):
+    make_payment(test_invoice, 100, 10)
+    make_payment(test_invoice, 200, 20)
+    account = LedgerAccount.objects.get(account_key=f'Customer:{test_client.pk}')
+    as_of = timezone.make_aware(datetime(2024, 1, 15))
+    
+    assert create_checkpoints(as_of) == 1
+    assert create_checkpoints(as_of) == 0
+    assert LedgerCheckpoint.objects.get(account=account).balance == Decimal('-100')
+    assert get_balance_before(account, as_of + timedelta(days=10)) == Decimal('-300')
+    
+    make_payment(test_invoice, 50, 12)
+    
+    assert not LedgerCheckpoint.objects.filter(account=account).exists()
+    assert get_balance_before(account, as_of) == Decimal('-150')
+
+
+@pytest.mark.django_db
+def test_statement_endpoint_is_paginated(authenticated_client, test_invoice, test_client):
+    for day in range(1, 4):
+        make_payment(test_invoice, 100, day)
+    
+    response = authenticated_client.get('/api/ledgers/statement/', {
+        'type': 'Customer', 'customer': test_client.pk, 'start_date': '2024-01-02',
+    })
+    
+    assert response.status_code == 200
+    assert response.data['count'] == 2
+    assert Decimal(response.data['opening_balance']) == Decimal('-100')
+    assert [row['balance'] for row in response.data['results']] == ['-200.00', '-300.00']
+
+
+@pytest.mark.django_db
+def test_export_streams_csv(authenticated_client, test_invoice, test_client):
+    for day in range(1, 4):
+        make_payment(test_invoice, 100, day)
+    
+    response = authenticated_client.get('/api/ledgers/export/', {'type': 'Customer', 'customer': test_client.pk})
+    
+    assert response.status_code == 200
+    assert response.streaming
+    lines = b''.join(response.streaming_content).decode().splitlines()
+    assert lines[0] == 'Date,Type,Reference,Description,Debit,Credit,Balance'
+    assert lines[1].endswith('Opening Balance,,,,,0')
+    assert [Decimal(line.rsplit(',', 1)[1]) for line in lines[2:]] == [Decimal('-100'), Decimal('-200'), Decimal('-300')]
+
+
+@pytest.mark.django_db
+def test_export_xlsx(authenticated_client, test_invoice, test_client):
+    openpyxl = pytest.importorskip('openpyxl')
+    import io
+    make_payment(test_invoice, 100, 1)
+    
+    response = authenticated_client.get('/api/ledgers/export/', {
+        'type': 'Customer', 'customer': test_client.pk, 'export_format': 'xlsx',
+    })
+    
+    assert response.status_code == 200
+    sheet = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+    rows = list(sheet.values)
+    assert rows[0][0] == 'Date'
+    assert rows[2][6] == -100
@@ -0,0 +1,159 @@
+"""
+Tests for payment gateway webhook ingestion
+"""
+import hashlib
+import hmac
+import json
+import time
+from datetime import timedelta
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from api.models import IntegrationConfig, Invoice, Payment, PaymentGatewayEvent
+from api.services import payment_service
+from api.services.payment_service import process_gateway_events, verify_gateway_signature
+
+RAZORPAY_SECRET = 'rzp_webhook_secret'
+
+
+def razorpay_body(payment_id, invoice_number, amount_paise=5000000, created_at=1700000000):
+    return json.dumps({
+        'entity': 'event',
+        'event': 'payment.captured',
+        'payload': {'payment': {'entity': {
+            'id': payment_id,
+            'amount': amount_paise,
+            'order_id': 'order_1',
+            'notes': {'invoice_number': invoice_number},
+            'created_at': created_at,
+        }}},
+    })
+
+
+def post_razorpay(api_client, body, event_id, secret=RAZORPAY_SECRET):
+    signature = hmac.new(secret.encode(), body.encode(), hashlib.sha256).hexdigest()
+    return api_client.post(
+        reverse('payment_gateway_webhook', kwargs={'provider': 'razorpay'}),
+        data=body,
+        content_type='application/json',
+        HTTP_X_RAZORPAY_SIGNATURE=signature,
+        HTTP_X_RAZORPAY_EVENT_ID=event_id,
+    )
+
+
+@pytest.fixture
+def razorpay_config(db):
+    return IntegrationConfig.objects.create(
+        name='Razorpay',
+        type=IntegrationConfig.IntegrationType.PAYMENT_GATEWAY,
+        provider='Razorpay',
+        is_enabled=True,
+        config={'webhook_secret': RAZORPAY_SECRET}
+    )
+
+
+@pytest.mark.django_db
+class TestPaymentGatewayWebhook:
+    """Tests for the gateway event inbox and worker"""
+    
+    def test_webhook_only_stores_event(self, client, test_invoice):
+        """Request path persists the event and does not create payments"""
+        response = post_razorpay(client, razorpay_body('pay_1', test_invoice.invoice_number), 'evt_1')
+        assert response.status_code == status.HTTP_200_OK
+        assert PaymentGatewayEvent.objects.filter(status=PaymentGatewayEvent.Status.PENDING).count() == 1
+        assert Payment.objects.count() == 0
+    
+    def test_retried_event_is_stored_once(self, client, test_invoice):
+        """Provider retries of the same event collapse to one inbox row"""
+        body = razorpay_body('pay_1', test_invoice.invoice_number)
+        for _ in range(3):
+            assert post_razorpay(client, body, 'evt_1').status_code == status.HTTP_200_OK
+        assert PaymentGatewayEvent.objects.count() == 1
+    
+    def test_unknown_provider_returns_404(self, client):
+        url = reverse('payment_gateway_webhook', kwargs={'provider': 'unknown'})
+        response = client.post(url, data='{}', content_type='application/json')
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+    
+    def test_worker_posts_payment_and_dedupes_transactions(self, client, test_invoice, razorpay_config):
+        """Two events for the same gateway payment create a single Payment"""
+        post_razorpay(client, razorpay_body('pay_1', test_invoice.invoice_number), 'evt_1')
+        post_razorpay(client, razorpay_body('pay_1', test_invoice.invoice_number, created_at=1700000005), 'evt_2')
+        
+        stats = process_gateway_events()
+        
+        assert stats[PaymentGatewayEvent.Status.PROCESSED] == 1
+        assert stats[PaymentGatewayEvent.Status.DUPLICATE] == 1
+        payment = Payment.objects.get()
+        assert payment.transaction_id == 'pay_1'
+        assert payment.amount == 50000
+        assert payment.method == Payment.Method.RAZORPAY
+        test_invoice.refresh_from_db()
+        assert test_invoice.status == Invoice.Status.PARTIALLY_PAID
+        assert PaymentGatewayEvent.objects.get(event_id='evt_1').payment == payment
+    
+    def test_capture_posted_by_another_worker_meanwhile_is_a_duplicate(
+        self, client, test_invoice, razorpay_config, monkeypatch
+    ):
+        """A concurrent worker's insert of the same capture wins; this event does not post it again"""
+        post_razorpay(client, razorpay_body('pay_1', test_invoice.invoice_number), 'evt_1')
+        generate_payment_id = payment_service.generate_payment_id
+        
+        def generate_after_competitor():
+            # Runs after the worker checked for existing payments, like a commit from a parallel worker
+            if not Payment.objects.exists():
+                Payment.objects.create(
+                    payment_id='PAY-OTHER', invoice=test_invoice, amount=50000,
+                    method=Payment.Method.RAZORPAY, transaction_id='pay_1', payment_date=timezone.now(),
+                )
+            return generate_payment_id()
+        
+        monkeypatch.setattr(payment_service, 'generate_payment_id', generate_after_competitor)
+        stats = process_gateway_events()
+        
+        assert stats[PaymentGatewayEvent.Status.DUPLICATE] == 1
+        assert stats[PaymentGatewayEvent.Status.PROCESSED] == 0
+        assert Payment.objects.get().payment_id == 'PAY-OTHER'
+        assert PaymentGatewayEvent.objects.get().payment.payment_id == 'PAY-OTHER'
+    
+    def test_worker_rejects_bad_signature(self, client, test_invoice, razorpay_config):
+        post_razorpay(client, razorpay_body('pay_1', test_invoice.invoice_number), 'evt_1', secret='wrong')
+        
+        stats = process_gateway_events()
+        
+        assert stats[PaymentGatewayEvent.Status.FAILED] == 1
+        assert Payment.objects.count() == 0
+        assert PaymentGatewayEvent.objects.get().last_error == 'Invalid webhook signature'
+    
+    def test_stripe_signature_verification(self):
+        body = json.dumps({'id': 'evt_1', 'type': 'payment_intent.succeeded'})
+        timestamp = str(int(time.time()))
+        digest = hmac.new(b'whsec', f"{timestamp}.{body}".encode(), hashlib.sha256).hexdigest()
+        assert verify_gateway_signature(PaymentGatewayEvent.Provider.STRIPE, body, f"t={timestamp},v1={digest}", 'whsec')
+        assert not verify_gateway_signature(PaymentGatewayEvent.Provider.STRIPE, body, f"t={timestamp},v1=bad", 'whsec')
+    
+    def test_stripe_event_is_verified_against_its_arrival_time(self, client, test_invoice):
+        """An event signed on arrival still verifies after the worker fell behind"""
+        IntegrationConfig.objects.create(
+            name='Stripe', type=IntegrationConfig.IntegrationType.PAYMENT_GATEWAY, provider='Stripe',
+            is_enabled=True, config={'webhook_secret': 'whsec'}
+        )
+        received_at = timezone.now() - timedelta(minutes=30)
+        body = json.dumps({'id': 'evt_s1', 'type': 'payment_intent.succeeded', 'data': {'object': {
+            'id': 'pi_1', 'amount_received': 250000, 'metadata': {'invoice_number': test_invoice.invoice_number},
+        }}})
+        timestamp = str(int(received_at.timestamp()))
+        digest = hmac.new(b'whsec', f"{timestamp}.{body}".encode(), hashlib.sha256).hexdigest()
+        event = PaymentGatewayEvent.objects.create(
+            provider=PaymentGatewayEvent.Provider.STRIPE, event_id='evt_s1', raw_body=body,
+            signature=f"t={timestamp},v1={digest}",
+        )
+        PaymentGatewayEvent.objects.filter(pk=event.pk).update(received_at=received_at)
+        
+        stats = process_gateway_events()
+        
+        assert stats[PaymentGatewayEvent.Status.PROCESSED] == 1
+        assert Payment.objects.get().transaction_id == 'pi_1'
@@ -0,0 +1,94 @@
+"""
+Tests for stage transition history and funnel analytics
+"""
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from api.models import Deal, Lead, StageTransition
+from api.services.pipeline_service import bulk_update_stage, get_pipeline_analytics
+
+
+def history(instance):
+    entity_type = StageTransition.EntityType.DEAL if isinstance(instance, Deal) else StageTransition.EntityType.LEAD
+    return list(StageTransition.objects.filter(entity_type=entity_type, entity_id=instance.pk).values_list(
+        'from_stage', 'to_stage'
+    ))
+
+
+def backdate(instance, *days_ago):
+    """Spread an entity's transitions over the given days in the past, oldest first"""
+    now = timezone.now()
+    transitions = StageTransition.objects.filter(entity_id=instance.pk, entity_type='Deal').order_by('id')
+    for transition, days in zip(transitions, days_ago):
+        transition.transitioned_at = now - timedelta(days=days)
+        transition.save()
+
+
+@pytest.mark.django_db
+def test_saves_record_only_stage_changes(sales_deal, test_lead):
+    sales_deal.notes = 'Called client'
+    sales_deal.save()
+    sales_deal.stage = Deal.Stage.AGREEMENT_SIGNED
+    sales_deal.save()
+
+    reloaded = Deal.objects.only('id', 'notes').get(pk=sales_deal.pk)
+    reloaded.stage = Deal.Stage.CLOSED
+    reloaded.save()
+
+    assert history(sales_deal) == [
+        (None, 'Booking Done'), ('Booking Done', 'Agreement Signed'), ('Agreement Signed', 'Closed'),
+    ]
+    assert history(test_lead) == [(None, 'New')]
+
+
+@pytest.mark.django_db
+def test_bulk_update_writes_transitions(test_lead, agent_user, django_assert_num_queries):
+    other = Lead.objects.create(name='Other', phone='1', email='o@test.com', source='Web', status='Contacted', agent=agent_user)
+
+    # Savepoint, select, update, insert, release
+    with django_assert_num_queries(5):
+        moved = bulk_update_stage(Lead.objects.all(), Lead.Status.CONTACTED, changed_by=agent_user)
+
+    assert moved == 1
+    assert Lead.objects.filter(status='Contacted').count() == 2
+    assert history(test_lead) == [(None, 'New'), ('New', 'Contacted')]
+    assert history(other) == [(None, 'Contacted')]
+
+
+@pytest.mark.django_db
+def test_funnel_conversion_and_median_days(sales_deal, test_lead, test_property, agent_user):
+    sales_deal.stage = Deal.Stage.CLOSED
+    sales_deal.save()
+    backdate(sales_deal, 10, 4)
+    other = Deal.objects.create(lead=test_lead, property=test_property, agent=agent_user, deal_value=100)
+    other.stage = Deal.Stage.BOOKING_DONE
+    other.save()
+    backdate(other, 6, 4)
+
+    analytics = get_pipeline_analytics(StageTransition.EntityType.DEAL)
+    funnel = {row['stage']: row for row in analytics['funnel']}
+
+    assert analytics['total'] == 2
+    assert funnel['Lead Created']['reached'] == 2
+    assert funnel['Booking Done']['reached'] == 2
+    assert funnel['Booking Done']['conversion_rate'] == 50.0
+    assert funnel['Booking Done']['median_days'] == 6.0
+    assert funnel['Closed']['reached'] == 1
+    assert funnel['Lead Created']['median_days'] == 2.0
+
+
+@pytest.mark.django_db
+def test_funnel_endpoint_and_history_are_scoped(sales_deal, authenticated_client, admin_user, test_property, test_lead):
+    Deal.objects.create(lead=test_lead, property=test_property, agent=admin_user, deal_value=100)
+
+    response = authenticated_client.get('/api/deals/funnel/')
+    assert response.status_code == 200
+    assert response.data['total'] == 1
+
+    response = authenticated_client.post('/api/deals/bulk_stage/', {'ids': [sales_deal.pk], 'stage': 'Closed'}, format='json')
+    assert response.data == {'updated': 1}
+    response = authenticated_client.get(f'/api/deals/{sales_deal.pk}/history/')
+    assert [row['to_stage'] for row in response.data] == ['Booking Done', 'Closed']
+    assert authenticated_client.post('/api/deals/bulk_stage/', {'ids': [sales_deal.pk], 'stage': 'Won'}, format='json').status_code == 400
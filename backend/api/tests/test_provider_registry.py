@@ -0,0 +1,64 @@
+"""
+Tests for the provider configuration registry
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from api.models import IntegrationConfig, TelephonyConfig
+from api.services import process_cache
+from api.services.provider_registry import (
+    get_default_telephony_config, get_integration_config, get_provider_client,
+)
+
+SMS = IntegrationConfig.IntegrationType.SMS
+
+
+@pytest.fixture
+def providers(db):
+    TelephonyConfig.objects.create(name='Main', provider=TelephonyConfig.Provider.TWILIO, is_default=True)
+    IntegrationConfig.objects.create(name='Textlocal', type=SMS, provider='Textlocal', is_enabled=True)
+    IntegrationConfig.objects.create(name='Twilio SMS', type=SMS, provider='Twilio', is_enabled=True)
+
+
+@pytest.mark.django_db
+def test_configs_are_loaded_once(providers, django_assert_num_queries):
+    with django_assert_num_queries(2):
+        for _ in range(3):
+            assert get_default_telephony_config().name == 'Main'
+            assert get_integration_config(SMS).name == 'Textlocal'
+            assert get_integration_config(IntegrationConfig.IntegrationType.EMAIL) is None
+
+
+@pytest.mark.django_db
+def test_config_changes_reload_registry_and_clients(providers):
+    built = []
+    client = get_provider_client('twilio', ('AC1', 'token'), lambda: built.append(1) or object())
+    assert get_provider_client('twilio', ('AC1', 'token'), object) is client
+
+    IntegrationConfig.objects.filter(name='Textlocal').get().delete()
+    TelephonyConfig.objects.update(is_default=False)
+    TelephonyConfig.objects.create(name='Backup', provider=TelephonyConfig.Provider.EXOTEL, is_default=True)
+
+    assert get_integration_config(SMS).name == 'Twilio SMS'
+    assert get_default_telephony_config().name == 'Backup'
+    assert get_provider_client('twilio', ('AC1', 'token'), object) is not client
+    assert built == [1]
+
+
+@pytest.mark.django_db
+def test_changes_from_other_processes_are_picked_up_after_max_age(providers, settings, monkeypatch):
+    """Without a shared cache another process's version bump never arrives; the local copy expires instead"""
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(process_cache, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    settings.PROCESS_CACHE_MAX_AGE = 60
+    client = get_provider_client('twilio', ('AC1', 'token'), object)
+    assert get_integration_config(SMS).name == 'Textlocal'
+
+    # Queryset updates send no signals, like a change made in another process
+    IntegrationConfig.objects.filter(name='Textlocal').update(is_enabled=False)
+    clock.now += 30
+    assert get_integration_config(SMS).name == 'Textlocal'
+    clock.now += 31
+    assert get_integration_config(SMS).name == 'Twilio SMS'
+    assert get_provider_client('twilio', ('AC1', 'token'), object) is client
@@ -0,0 +1,92 @@
+"""
+Tests for quote version families
+"""
+from datetime import date
+
+import pytest
+
+from api.models import Document, Quote
+
+
+def make_quote(number, lead, prop, parent=None):
+    return Quote.objects.create(
+        quote_number=number, lead=lead, property=prop, validity_date=date(2030, 1, 1),
+        base_price=100, total_amount=100, parent_quote=parent,
+    )
+
+
+@pytest.fixture
+def quote_family(test_lead, test_property):
+    root = make_quote('Q-1', test_lead, test_property)
+    second = make_quote('Q-1-v2', test_lead, test_property, parent=root)
+    third = make_quote('Q-1-v3', test_lead, test_property, parent=second)
+    make_quote('Q-2', test_lead, test_property)
+    Document.objects.create(quote=third, type='Other', name='Revised offer', file_url='https://example.com/q3.pdf')
+    return root, second, third
+
+
+@pytest.mark.django_db
+def test_revisions_store_root_and_version(quote_family):
+    root, second, third = quote_family
+
+    assert (root.root_quote_id, root.version) == (None, 1)
+    assert (second.root_quote_id, second.version) == (root.pk, 2)
+    assert (third.root_quote_id, third.version) == (root.pk, 3)
+
+
+@pytest.mark.django_db
+def test_deleting_the_root_keeps_the_family_together(quote_family, test_lead, test_property):
+    root, second, third = quote_family
+    fourth = make_quote('Q-1-v4', test_lead, test_property, parent=second)
+
+    root.delete()
+
+    second.refresh_from_db()
+    third.refresh_from_db()
+    fourth.refresh_from_db()
+    assert (second.root_quote_id, second.parent_quote_id) == (None, None)
+    assert (third.root_quote_id, third.parent_quote_id) == (second.pk, second.pk)
+    assert (fourth.root_quote_id, fourth.parent_quote_id) == (second.pk, second.pk)
+
+    # Deleting a middle version hands its revisions to its parent
+    third_child = make_quote('Q-1-v5', test_lead, test_property, parent=third)
+    third.delete()
+    third_child.refresh_from_db()
+    assert (third_child.root_quote_id, third_child.parent_quote_id) == (second.pk, second.pk)
+    third_child.save()
+    assert Quote.objects.get(pk=third_child.pk).root_quote_id == second.pk
+
+
+@pytest.mark.django_db
+def test_changing_the_parent_moves_the_revisions(quote_family, test_lead, test_property):
+    root, second, third = quote_family
+    other = Quote.objects.get(quote_number='Q-2')
+
+    second.parent_quote = other
+    second.save()
+
+    third.refresh_from_db()
+    assert Quote.objects.get(pk=second.pk).root_quote_id == other.pk
+    assert third.root_quote_id == other.pk
+
+    # Detached from any parent, it becomes the root of its revisions
+    second = Quote.objects.get(pk=second.pk)
+    second.parent_quote = None
+    second.save()
+    assert Quote.objects.get(pk=third.pk).root_quote_id == second.pk
+
+
+@pytest.mark.django_db
+def test_versions_endpoint_loads_family_in_fixed_queries(quote_family, authenticated_client, django_assert_num_queries):
+    root, second, third = quote_family
+    authenticated_client.get('/api/quotes/')  # Authenticate once outside the count
+
+    # User, the requested quote and its documents, then the family and its documents
+    with django_assert_num_queries(5):
+        response = authenticated_client.get(f'/api/quotes/{second.pk}/versions/')
+
+    assert response.status_code == 200
+    assert [row['quote_number'] for row in response.data] == ['Q-1', 'Q-1-v2', 'Q-1-v3']
+    assert response.data[2]['documents'][0]['name'] == 'Revised offer'
+    assert authenticated_client.get('/api/quotes/999999/versions/').status_code == 404
+    assert authenticated_client.get('/api/quotes/abc/versions/').status_code == 404
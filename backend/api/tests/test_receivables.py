@@ -0,0 +1,93 @@
+"""
+Tests for the accounts-receivable aging report
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import CreditNote, Invoice, Payment
+from api.services.receivables_service import compute_aging_report
+
+AS_OF = date(2024, 6, 30)
+
+
+def make_invoice(deal, client, number, total, days_overdue, unit=None, status=Invoice.Status.UNPAID):
+    return Invoice.objects.create(
+        invoice_number=number, deal=deal, client=client, unit=unit, amount=Decimal(total),
+        total_amount=Decimal(total), due_date=AS_OF - timedelta(days=days_overdue), status=status,
+    )
+
+
+@pytest.fixture
+def receivables(sales_deal, test_client, test_unit):
+    make_invoice(sales_deal, test_client, 'INV-1', '1000', -5, unit=test_unit)
+    partly_paid = make_invoice(sales_deal, test_client, 'INV-2', '2000', 10, unit=test_unit)
+    Payment.objects.create(
+        payment_id='P-1', invoice=partly_paid, amount=Decimal('500'), method=Payment.Method.UPI,
+        payment_date=timezone.now(),
+    )
+    credited = make_invoice(sales_deal, test_client, 'INV-3', '3000', 45, unit=test_unit)
+    CreditNote.objects.create(
+        credit_note_number='CN-1', deal=sales_deal, amount=Decimal('1000'), reason='Discount',
+        applied_to_invoice=credited,
+    )
+    make_invoice(sales_deal, test_client, 'INV-4', '4000', 75)
+    make_invoice(sales_deal, test_client, 'INV-5', '5000', 400)
+    make_invoice(sales_deal, test_client, 'INV-6', '6000', 400, status=Invoice.Status.DRAFT)
+
+
+@pytest.mark.django_db
+def test_aging_by_client_in_one_query(receivables, test_client, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        report = compute_aging_report(group_by='client', as_of=AS_OF)
+    
+    assert len(report['rows']) == 1
+    row = report['rows'][0]
+    assert row['name'] == test_client.name
+    assert (row['current'], row['0_30'], row['31_60'], row['61_90'], row['90_plus']) == (
+        Decimal('1000'), Decimal('1500'), Decimal('2000'), Decimal('4000'), Decimal('5000')
+    )
+    assert report['totals']['total'] == Decimal('13500')
+
+
+@pytest.mark.django_db
+def test_aging_by_project_uses_unit_project(receivables, test_unit):
+    report = compute_aging_report(group_by='project', as_of=AS_OF)
+    
+    by_id = {row['id']: row for row in report['rows']}
+    assert by_id[test_unit.floor.tower.project_id]['total'] == Decimal('4500')
+    assert by_id[None]['total'] == Decimal('9000')
+
+
+@pytest.mark.django_db
+def test_aging_by_project_merges_direct_and_unit_invoices(receivables, test_unit):
+    project = test_unit.floor.tower.project
+    Invoice.objects.filter(invoice_number='INV-4').update(project=project)
+    
+    report = compute_aging_report(group_by='project', as_of=AS_OF)
+    
+    rows = [row for row in report['rows'] if row['id'] == project.pk]
+    assert len(rows) == 1
+    assert rows[0]['name'] == project.name
+    assert rows[0]['total'] == Decimal('8500')
+    assert rows[0]['61_90'] == Decimal('4000')
+
+
+@pytest.mark.django_db
+def test_aging_endpoint_is_cached_per_day(receivables, admin_user, sales_deal, test_client):
+    client = APIClient()
+    client.force_authenticate(admin_user)
+    params = {'group_by': 'agent', 'as_of': AS_OF.isoformat()}
+    
+    first = client.get('/api/invoices/aging/', params)
+    make_invoice(sales_deal, test_client, 'INV-7', '700', 5)
+    cached = client.get('/api/invoices/aging/', params)
+    refreshed = client.get('/api/invoices/aging/', {**params, 'refresh': 'true'})
+    
+    assert first.status_code == 200
+    assert cached.data['totals']['total'] == first.data['totals']['total']
+    assert Decimal(refreshed.data['totals']['total']) == Decimal(first.data['totals']['total']) + 700
+    assert client.get('/api/invoices/aging/', {'group_by': 'planet'}).status_code == 400
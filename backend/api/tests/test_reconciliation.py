@@ -0,0 +1,157 @@
+"""
+Tests for bank reconciliation auto-matching
+"""
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import BankReconciliation, BookingPayment, Payment
+from api.services.reconciliation_service import auto_match
+
+
+def make_payment(invoice, payment_id, amount, day, transaction_id=None, reference_number=None):
+    return Payment.objects.create(
+        payment_id=payment_id, invoice=invoice, amount=Decimal(amount), method=Payment.Method.BANK_TRANSFER,
+        transaction_id=transaction_id, reference_number=reference_number,
+        payment_date=timezone.make_aware(datetime(2024, 3, day, 12)),
+    )
+
+
+def make_line(amount, day, utr=None, reference=None, transaction_type='Credit'):
+    return BankReconciliation.objects.create(
+        bank_name='HDFC', account_number='001', transaction_date=date(2024, 3, day),
+        transaction_type=transaction_type, amount=Decimal(amount), utr_number=utr, reference_number=reference,
+    )
+
+
+@pytest.mark.django_db
+def test_auto_match_passes(test_invoice, sales_deal, test_client, test_unit):
+    by_utr = make_payment(test_invoice, 'P1', '1000', 5, transaction_id='UTR-0001')
+    with_charges = make_payment(test_invoice, 'P2', '2000', 6, reference_number='ref 77')
+    only_amount = make_payment(test_invoice, 'P3', '3333', 7)
+    cheque = BookingPayment.objects.create(
+        booking_id='BK-1', deal=sales_deal, unit=test_unit, client=test_client, amount=Decimal('50000'),
+        payment_method='Cheque', cheque_number='445566', payment_date=timezone.make_aware(datetime(2024, 3, 1, 10)),
+    )
+    lines = [
+        make_line('1000', 6, utr='utr0001'),
+        make_line('1995', 7, reference='REF77'),
+        make_line('3333', 8),
+        make_line('50000', 3, reference='445566'),
+        make_line('999', 8),
+        make_line('1000', 6, utr='UTR0001', transaction_type='Debit'),
+    ]
+    
+    stats = auto_match(reconciled_by=None)
+    
+    assert stats == {'exact': 2, 'tolerance': 1, 'amount': 1, 'unmatched': 1}
+    for line in lines:
+        line.refresh_from_db()
+    assert lines[0].matched_payment == by_utr
+    assert lines[1].matched_payment == with_charges
+    assert lines[2].matched_payment == only_amount
+    assert lines[3].matched_booking == cheque
+    assert lines[4].status == BankReconciliation.Status.UNMATCHED
+    assert lines[5].status == BankReconciliation.Status.PENDING
+
+
+@pytest.mark.django_db
+def test_auto_match_skips_ambiguous_amounts_and_used_payments(test_invoice):
+    make_payment(test_invoice, 'P1', '500', 5)
+    make_payment(test_invoice, 'P2', '500', 5)
+    make_line('500', 5)
+    
+    assert auto_match()['unmatched'] == 1
+    
+    BankReconciliation.objects.update(status=BankReconciliation.Status.MATCHED,
+                                      matched_payment=Payment.objects.get(payment_id='P1'))
+    make_line('500', 5)
+    
+    assert auto_match()['amount'] == 1
+    assert BankReconciliation.objects.filter(matched_payment__payment_id='P2').exists()
+
+
+@pytest.mark.django_db
+def test_auto_match_endpoint(admin_user, test_invoice):
+    make_payment(test_invoice, 'P1', '1000', 5, transaction_id='UTR1')
+    line = make_line('1000', 5, utr='UTR1')
+    client = APIClient()
+    client.force_authenticate(admin_user)
+    
+    response = client.post('/api/bank-reconciliations/auto_match/', {'bank_name': 'HDFC'}, format='json')
+    
+    assert response.status_code == 200
+    assert response.data['exact'] == 1
+    line.refresh_from_db()
+    assert line.reconciled_by == admin_user
+
+
+CSV_STATEMENT = """Txn Date,Narration,Chq/Ref No,Withdrawal Amt,Deposit Amt
+01/03/2024,NEFT-HDFCN52024030100001-ACME LTD,REF 1,,"1,000.00"
+01/03/2024,Bank charges,,50.00,
+01/03/2024,Bank charges,,50.00,
+not a date,broken,,,10
+"""
+
+MT940_STATEMENT = """:20:STMT1
+:25:001
+:28C:1/1
+:60F:C240301INR0,00
+:61:2403020302C2500,00NTRFNONREF//BANK1
+:86:RTGS/SBINR52024030299999/CUSTOMER
+ ONE
+:61:2403030303D100,00NCHG445566
+:86:CHARGES
+:62F:C240303INR2400,00
+-
+"""
+
+
+def upload(client, name, content, **data):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    return client.post('/api/bank-reconciliations/import/', {
+        'file': SimpleUploadedFile(name, content.encode()),
+        'bank_name': 'HDFC', 'account_number': '001', **data,
+    }, format='multipart')
+
+
+@pytest.mark.django_db
+def test_import_csv_statement_dedupes_on_reimport(admin_user):
+    client = APIClient()
+    client.force_authenticate(admin_user)
+    
+    response = upload(client, 'march.csv', CSV_STATEMENT)
+    
+    assert response.status_code == 201
+    assert response.data['created'] == 3
+    assert response.data['errors'][0]['line'] == 5
+    credit = BankReconciliation.objects.get(transaction_type='Credit')
+    assert credit.amount == Decimal('1000.00')
+    assert credit.utr_number == 'HDFCN52024030100001'
+    assert credit.reference_number == 'REF1'
+    
+    response = upload(client, 'march.csv', CSV_STATEMENT)
+    
+    assert response.status_code == 200
+    assert response.data['duplicates'] == 3
+    assert BankReconciliation.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_import_mt940_statement(admin_user):
+    client = APIClient()
+    client.force_authenticate(admin_user)
+    
+    response = upload(client, 'march.sta', MT940_STATEMENT)
+    
+    assert response.status_code == 201
+    assert response.data['created'] == 2
+    credit = BankReconciliation.objects.get(transaction_type='Credit')
+    assert credit.transaction_date == date(2024, 3, 2)
+    assert credit.amount == Decimal('2500.00')
+    assert credit.utr_number == 'SBINR52024030299999'
+    assert credit.description == 'RTGS/SBINR52024030299999/CUSTOMER ONE'
+    assert BankReconciliation.objects.get(transaction_type='Debit').reference_number == '445566'
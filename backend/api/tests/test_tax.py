@@ -0,0 +1,114 @@
+"""
+Tests for the GST rate resolver and tax breakdowns
+"""
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+from api.models import GSTConfiguration, Invoice, TaxBreakdown
+from api.services import process_cache
+from api.services.invoice_service import apply_gst_to_invoices, create_invoice_from_deal
+from api.services.tax_service import GSTRateNotFound, build_tax_breakdowns, resolve_rate
+
+RESIDENTIAL = GSTConfiguration.PropertyType.RESIDENTIAL_UNDER_CONSTRUCTION
+BASE_PRICE = GSTConfiguration.ChargeType.BASE_PRICE
+PARKING = GSTConfiguration.ChargeType.PARKING
+
+
+@pytest.fixture
+def gst_rates(db):
+    GSTConfiguration.objects.create(
+        property_type=RESIDENTIAL, charge_type=BASE_PRICE, gst_rate=Decimal('12.00'),
+        effective_from=date(2017, 7, 1), effective_to=date(2019, 3, 31),
+    )
+    GSTConfiguration.objects.create(
+        property_type=RESIDENTIAL, charge_type=BASE_PRICE, gst_rate=Decimal('5.00'), hsn_code='9954',
+        effective_from=date(2019, 4, 1),
+    )
+    GSTConfiguration.objects.create(
+        property_type=RESIDENTIAL, charge_type=PARKING, gst_rate=Decimal('18.00'), effective_from=date(2017, 7, 1),
+    )
+
+
+@pytest.mark.django_db
+def test_resolve_rate_by_effective_date(gst_rates):
+    assert resolve_rate(RESIDENTIAL, BASE_PRICE, date(2018, 1, 1)) == (Decimal('12.00'), None)
+    assert resolve_rate(RESIDENTIAL, BASE_PRICE, date(2024, 1, 1)) == (Decimal('5.00'), '9954')
+    with pytest.raises(GSTRateNotFound):
+        resolve_rate(RESIDENTIAL, BASE_PRICE, date(2017, 6, 30))
+    with pytest.raises(GSTRateNotFound):
+        resolve_rate(GSTConfiguration.PropertyType.PLOT, BASE_PRICE, date(2024, 1, 1))
+
+
+@pytest.mark.django_db
+def test_rate_index_is_rebuilt_after_configuration_change(gst_rates):
+    assert resolve_rate(RESIDENTIAL, PARKING, date(2024, 1, 1))[0] == Decimal('18.00')
+    
+    GSTConfiguration.objects.create(
+        property_type=RESIDENTIAL, charge_type=PARKING, gst_rate=Decimal('12.00'), effective_from=date(2023, 1, 1),
+    )
+    
+    assert resolve_rate(RESIDENTIAL, PARKING, date(2024, 1, 1))[0] == Decimal('12.00')
+
+
+@pytest.mark.django_db
+def test_rate_index_expires_for_changes_made_elsewhere(gst_rates, settings, monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(process_cache, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    settings.PROCESS_CACHE_MAX_AGE = 60
+    assert resolve_rate(RESIDENTIAL, PARKING, date(2024, 1, 1))[0] == Decimal('18.00')
+    
+    # No signal reaches this process, as when another process changed the rates without a shared cache
+    GSTConfiguration.objects.filter(charge_type=PARKING).update(gst_rate=Decimal('12.00'))
+    assert resolve_rate(RESIDENTIAL, PARKING, date(2024, 1, 1))[0] == Decimal('18.00')
+    clock.now += 61
+    assert resolve_rate(RESIDENTIAL, PARKING, date(2024, 1, 1))[0] == Decimal('12.00')
+
+
+@pytest.mark.django_db
+def test_batch_breakdowns_do_not_query_per_line(gst_rates, test_invoice, django_assert_max_num_queries):
+    resolve_rate(RESIDENTIAL, BASE_PRICE, date(2024, 1, 1))  # warm the index
+    lines = [
+        {'invoice': test_invoice, 'property_type': RESIDENTIAL, 'charge_type': PARKING,
+         'base_amount': Decimal('333.33'), 'on_date': date(2024, 1, 1)}
+        for _ in range(50)
+    ]
+    
+    with django_assert_max_num_queries(0):
+        breakdowns = build_tax_breakdowns(lines)
+    
+    assert breakdowns[0].total_tax == Decimal('60.00')
+    assert breakdowns[0].cgst_amount + breakdowns[0].sgst_amount == Decimal('60.00')
+
+
+@pytest.mark.django_db
+def test_create_invoice_from_deal_uses_gst_configuration(gst_rates, sales_deal):
+    sales_deal.refresh_from_db()
+    invoice = create_invoice_from_deal(sales_deal, tax_config={
+        'property_type': RESIDENTIAL,
+        'charges': [{'charge_type': BASE_PRICE, 'amount': '1000000'}, {'charge_type': PARKING, 'amount': '100000'}],
+        'inter_state': True,
+    })
+    
+    assert invoice.tax_amount == Decimal('68000.00')
+    breakdowns = TaxBreakdown.objects.filter(invoice=invoice)
+    assert breakdowns.count() == 2
+    assert all(b.cgst_amount == 0 and b.igst_amount == b.total_tax for b in breakdowns)
+
+
+@pytest.mark.django_db
+def test_apply_gst_to_invoices(gst_rates, test_invoice):
+    test_invoice.tax_config = {'property_type': RESIDENTIAL, 'on_date': '2018-06-01'}
+    test_invoice.save()
+    test_invoice.refresh_from_db()
+    
+    apply_gst_to_invoices([test_invoice])
+    apply_gst_to_invoices([test_invoice])
+    
+    test_invoice.refresh_from_db()
+    assert test_invoice.tax_amount == Decimal('12000.00')
+    assert test_invoice.total_amount == Decimal('112000.00')
+    breakdown = TaxBreakdown.objects.get(invoice=test_invoice)
+    assert breakdown.cgst_amount == breakdown.sgst_amount == Decimal('6000.00')
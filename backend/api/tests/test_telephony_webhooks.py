@@ -0,0 +1,135 @@
+"""
+Tests for telephony webhook ingestion
+"""
+from datetime import timedelta
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import Activity, CallLog, TelephonyWebhookEvent
+from api.services import telephony_service
+from api.services.telephony_service import TELEPHONY_EVENT_MAX_ATTEMPTS, process_telephony_events
+
+
+def post_status(api_client, call_sid, call_status, **extra):
+    return api_client.post(reverse('twilio_status_webhook'), {
+        'CallSid': call_sid, 'CallStatus': call_status, 'From': '+919800000001', 'To': '+919800000002', **extra
+    })
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def outbound_call(test_lead, agent_user):
+    return CallLog.objects.create(
+        call_sid='CA-OUT', direction=CallLog.Direction.OUTBOUND, from_number='+919800000002',
+        to_number=test_lead.phone, lead=test_lead, agent=agent_user, provider='Twilio',
+        initiated_at=timezone.now(),
+    )
+
+
+@pytest.mark.django_db
+def test_webhooks_only_store_events(api_client, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        response = post_status(api_client, 'CA-1', 'ringing')
+    post_status(api_client, 'CA-1', 'ringing')  # Provider retry
+    api_client.post(reverse('twilio_recording_webhook'), {'CallSid': 'CA-1', 'RecordingUrl': 'https://example.com/r.mp3'})
+
+    assert response.status_code == 200
+    assert TelephonyWebhookEvent.objects.count() == 2
+    assert not CallLog.objects.exists()
+
+
+@pytest.mark.django_db
+def test_worker_applies_events_per_call_in_bulk(api_client, outbound_call):
+    post_status(api_client, 'CA-OUT', 'answered')
+    post_status(api_client, 'CA-OUT', 'completed', CallDuration='42')
+    api_client.post(reverse('twilio_recording_webhook'), {
+        'CallSid': 'CA-OUT', 'RecordingUrl': 'https://example.com/r.mp3', 'RecordingSid': 'RE1'
+    })
+    post_status(api_client, 'CA-IN', 'ringing')
+    api_client.post(reverse('twilio_recording_webhook'), {'CallSid': 'CA-UNKNOWN', 'RecordingUrl': 'https://example.com/x.mp3'})
+
+    stats = process_telephony_events()
+
+    assert stats['Processed'] == 4
+    outbound_call.refresh_from_db()
+    assert outbound_call.status == CallLog.Status.COMPLETED
+    assert (outbound_call.duration, outbound_call.recording_sid) == (42, 'RE1')
+    assert outbound_call.activity.type == Activity.Type.CALL
+    assert outbound_call.activity.recording_url == 'https://example.com/r.mp3'
+    inbound = CallLog.objects.get(call_sid='CA-IN')
+    assert (inbound.direction, inbound.status) == (CallLog.Direction.INBOUND, CallLog.Status.RINGING)
+
+    # The recording for an unknown call stays pending for a retry
+    pending = TelephonyWebhookEvent.objects.get(call_sid='CA-UNKNOWN')
+    assert (pending.status, pending.last_error) == (TelephonyWebhookEvent.Status.PENDING, 'Call log not found')
+    assert process_telephony_events()['Processed'] == 0
+    assert Activity.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_out_of_order_and_retried_callbacks_do_not_flap(api_client, outbound_call):
+    post_status(api_client, 'CA-OUT', 'completed', SequenceNumber='3', CallDuration='30',
+                Timestamp='Mon, 19 Oct 2026 10:01:00 +0000')
+    post_status(api_client, 'CA-OUT', 'ringing', SequenceNumber='1', Timestamp='Mon, 19 Oct 2026 10:00:00 +0000')
+    post_status(api_client, 'CA-OUT', 'answered', SequenceNumber='2', Timestamp='Mon, 19 Oct 2026 10:00:10 +0000')
+
+    assert process_telephony_events() == {'Pending': 0, 'Processed': 3, 'Ignored': 0, 'Failed': 0}
+    outbound_call.refresh_from_db()
+    assert (outbound_call.status, outbound_call.last_event_sequence, outbound_call.duration) == ('Completed', 3, 30)
+    assert outbound_call.answered_at.isoformat() == '2026-10-19T10:00:10+00:00'
+
+    # A late ringing callback and a resent answered one are ignored without touching the row
+    updated_at = outbound_call.updated_at
+    post_status(api_client, 'CA-OUT', 'ringing', SequenceNumber='1', AccountSid='AC-retry')
+    post_status(api_client, 'CA-OUT', 'answered', SequenceNumber='4')
+
+    assert process_telephony_events()['Ignored'] == 2
+    outbound_call.refresh_from_db()
+    assert (outbound_call.status, outbound_call.updated_at) == ('Completed', updated_at)
+
+
+@pytest.mark.django_db
+def test_non_numeric_duration_does_not_fail_the_callback(api_client, outbound_call):
+    post_status(api_client, 'CA-OUT', 'completed', CallDuration='n/a')
+
+    assert process_telephony_events()['Processed'] == 1
+    outbound_call.refresh_from_db()
+    assert (outbound_call.status, outbound_call.duration) == (CallLog.Status.COMPLETED, None)
+
+
+@pytest.mark.django_db
+def test_failing_event_backs_off_without_stalling_the_batch(api_client, outbound_call, monkeypatch):
+    apply_call_status = telephony_service.apply_call_status
+
+    def apply_or_fail(call_log, data, received_at):
+        if data.get('AccountSid') == 'AC-bad':
+            call_log.status = CallLog.Status.FAILED
+            raise KeyError('Broken payload')
+        return apply_call_status(call_log, data, received_at)
+
+    monkeypatch.setattr(telephony_service, 'apply_call_status', apply_or_fail)
+    post_status(api_client, 'CA-OUT', 'ringing', SequenceNumber='1', AccountSid='AC-bad')
+    post_status(api_client, 'CA-OUT', 'answered', SequenceNumber='2')
+
+    stats = process_telephony_events()
+
+    assert (stats['Processed'], stats['Pending']) == (1, 1)
+    outbound_call.refresh_from_db()
+    assert outbound_call.status == CallLog.Status.ANSWERED
+    bad = TelephonyWebhookEvent.objects.get(status=TelephonyWebhookEvent.Status.PENDING)
+    assert (bad.attempts, bad.last_error) == (1, "'Broken payload'")
+    assert bad.next_attempt_at > timezone.now()
+    # Not due yet, so the next run does not claim it
+    assert sum(process_telephony_events().values()) == 0
+
+    TelephonyWebhookEvent.objects.filter(pk=bad.pk).update(
+        attempts=TELEPHONY_EVENT_MAX_ATTEMPTS - 1, next_attempt_at=timezone.now() - timedelta(seconds=1)
+    )
+    assert process_telephony_events()['Failed'] == 1
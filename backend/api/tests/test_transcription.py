@@ -0,0 +1,133 @@
+"""
+Tests for the call transcription queue and insight extraction
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from django.utils import timezone
+
+from api.models import Activity, CallLog, CallTranscriptionJob
+from api.services import transcription_service
+from api.services.http_client import reset_clients
+from api.services.transcription_service import (
+    TRANSCRIPTION_MAX_ATTEMPTS, extract_call_insights, process_transcription_jobs, queue_transcriptions,
+)
+
+RECORDINGS = {
+    '/good.txt': ('text/plain', b'Hello, I am very interested in the 3BHK. The price looks great. Please book a visit.'),
+    '/bad.txt': ('text/plain', b'The possession is delayed again. This is a problem, I want a refund.'),
+    '/call.wav': ('audio/x-wav', b'RIFF....WAVE'),
+}
+
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        content_type, body = RECORDINGS.get(self.path, ('text/plain', b''))
+        self.send_response(200 if self.path in RECORDINGS else 404)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def recording_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RecordingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    reset_clients()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    reset_clients()
+    server.shutdown()
+    server.server_close()
+
+
+def make_call(lead, agent, recording_url):
+    activity = Activity.objects.create(lead=lead, agent_name=agent.name, type=Activity.Type.CALL, timestamp=timezone.now())
+    return CallLog.objects.create(
+        direction=CallLog.Direction.OUTBOUND, from_number='+919800000002', to_number=lead.phone, lead=lead,
+        agent=agent, status=CallLog.Status.COMPLETED, initiated_at=timezone.now(), recording_url=recording_url,
+        activity=activity,
+    )
+
+
+def test_insights_keywords_sentiment_and_summary():
+    good, bad, empty = extract_call_insights([
+        RECORDINGS['/good.txt'][1].decode(), RECORDINGS['/bad.txt'][1].decode(), '',
+    ])
+
+    assert good['sentiment'] == 'Positive'
+    assert {'interested', '3bhk', 'price'} <= set(good['keywords'])
+    assert good['summary'] == 'Hello, I am very interested in the 3BHK. The price looks great.'
+    assert bad['sentiment'] == 'Negative'
+    assert empty == {'keywords': [], 'sentiment': None, 'summary': None}
+
+
+@pytest.mark.django_db
+def test_worker_transcribes_queued_recordings(recording_server, test_lead, agent_user):
+    good = make_call(test_lead, agent_user, f"{recording_server}/good.txt")
+    bad = make_call(test_lead, agent_user, f"{recording_server}/bad.txt")
+    audio = make_call(test_lead, agent_user, f"{recording_server}/call.wav")
+
+    assert queue_transcriptions([good, bad, audio]) == 3
+    assert queue_transcriptions([good]) == 0
+
+    stats = process_transcription_jobs(concurrency=2)
+
+    assert stats == {'completed': 2, 'retried': 1, 'failed': 0, 'superseded': 0}
+    good.refresh_from_db()
+    assert good.transcript.startswith('Hello')
+    assert good.sentiment == 'Positive'
+    assert 'interested' in good.keywords
+    assert Activity.objects.get(pk=bad.activity_id).sentiment == 'Negative'
+
+    job = CallTranscriptionJob.objects.get(call_log=audio)
+    assert (job.status, job.attempts) == ('Pending', 1)
+    assert 'audio/x-wav' in job.last_error
+    for _ in range(TRANSCRIPTION_MAX_ATTEMPTS - 1):
+        process_transcription_jobs()
+    job.refresh_from_db()
+    assert job.status == 'Failed'
+
+
+@pytest.mark.django_db
+def test_changed_recording_is_requeued(recording_server, test_lead, agent_user):
+    call = make_call(test_lead, agent_user, f"{recording_server}/good.txt")
+    queue_transcriptions([call])
+    process_transcription_jobs()
+
+    call.recording_url = f"{recording_server}/bad.txt"
+    assert queue_transcriptions([call]) == 1
+    process_transcription_jobs()
+
+    call.refresh_from_db()
+    assert call.sentiment == 'Negative'
+
+
+@pytest.mark.django_db
+def test_recording_changed_while_transcribing_is_not_overwritten(recording_server, test_lead, agent_user, monkeypatch):
+    call = make_call(test_lead, agent_user, f"{recording_server}/good.txt")
+    queue_transcriptions([call])
+
+    def recording_replaced_mid_flight(url):
+        # A recording webhook arrives after the worker claimed the job
+        CallLog.objects.filter(pk=call.pk).update(recording_url=f"{recording_server}/bad.txt")
+        queue_transcriptions(CallLog.objects.filter(pk=call.pk))
+        return None
+
+    monkeypatch.setattr(transcription_service, '_recording_auth', recording_replaced_mid_flight)
+    assert process_transcription_jobs()['superseded'] == 1
+    call.refresh_from_db()
+    assert call.transcript is None
+    job = CallTranscriptionJob.objects.get(call_log=call)
+    assert (job.status, job.recording_url) == ('Pending', f"{recording_server}/bad.txt")
+
+    monkeypatch.undo()
+    assert process_transcription_jobs()['completed'] == 1
+    call.refresh_from_db()
+    assert call.sentiment == 'Negative'
@@ -29,6 +29,7 @@ def api_root(request):
                 'deals': '/api/deals/',
                 'call_logs': '/api/call-logs/',
                 'telephony_configs': '/api/telephony-configs/',
+                'dialer_campaigns': '/api/dialer-campaigns/',
             },
             'documentation': 'Visit /admin/ for Django admin interface',
         }
@@ -64,6 +65,7 @@ router.register(r'quotes', views.QuoteViewSet, basename='quote')
 # Commission Management
 router.register(r'commissions', views.CommissionViewSet, basename='commission')
 router.register(r'commission-splits', views.CommissionSplitViewSet, basename='commission-split')
+router.register(r'commission-rules', views.CommissionRuleViewSet, basename='commission-rule')
 
 # Customer Portal
 router.register(r'portal-users', views.CustomerPortalUserViewSet, basename='portal-user')
@@ -86,6 +88,7 @@ router.register(r'workflow-actions', views.WorkflowActionViewSet, basename='work
 # Call Logging
 router.register(r'call-logs', views.CallLogViewSet, basename='call-log')
 router.register(r'telephony-configs', views.TelephonyConfigViewSet, basename='telephony-config')
+router.register(r'dialer-campaigns', views.DialerCampaignViewSet, basename='dialer-campaign')
 
 # Chatbot
 router.register(r'chatbots', views.ChatbotViewSet, basename='chatbot')
@@ -135,6 +138,7 @@ urlpatterns = [
     path('webhooks/twilio/status/', views.twilio_status_webhook, name='twilio_status_webhook'),
     path('webhooks/twilio/recording/', views.twilio_recording_webhook, name='twilio_recording_webhook'),
     path('webhooks/chatbot/<int:chatbot_id>/', views.chatbot_webhook, name='chatbot_webhook'),
+    path('webhooks/payments/<str:provider>/', views.payment_gateway_webhook, name='payment_gateway_webhook'),
     
     # Include router URLs
     path('', include(router.urls)),
@@ -1,52 +1,126 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.pagination import CursorPagination
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.views import TokenObtainPairView
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce, Substr
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.http import HttpResponse
-from datetime import timedelta
+from datetime import datetime, timedelta
+from operator import attrgetter
 import json
 
 from .models import (
     Agent, Property, Lead, Activity, Task, Client,
     AttendanceRecord, WhatsAppTemplate, AutomationRule, Notification,
-    Deal, Invoice, Payment, PaymentPlan, Installment, Quote,
-    Commission, CommissionSplit, CustomerPortalUser, Document, FileAccessLog,
+    Deal, StageTransition, Invoice, Payment, PaymentPlan, Installment, Quote,
+    Commission, CommissionSplit, CommissionMonthlyRollup, CommissionRule, CustomerPortalUser, Document, FileAccessLog,
     IntegrationConfig, InvoiceTemplate, QuoteTemplate, EmailTemplate,
     AgreementTemplate, WorkflowRule, WorkflowAction,
-    CallLog, TelephonyConfig, Chatbot, ChatbotConversation, ChatbotMessage, ChatbotQualificationRule,
+    CallLog, CallDailyStat, TelephonyConfig, DialerCampaign, DialerCampaignEntry, Chatbot, ChatbotConversation, ChatbotMessage, ChatbotQualificationRule,
     Project, Tower, Floor, Unit, BookingPayment, Receipt, GSTConfiguration, TaxBreakdown,
-    PaymentSchedule, PaymentMilestone, Ledger, Refund, CreditNote, BankReconciliation
+    PaymentSchedule, PaymentMilestone, Ledger, LedgerAccount, Refund, CreditNote, BankReconciliation
 )
 from .serializers import (
     AgentSerializer, PropertySerializer, LeadSerializer, ActivitySerializer,
     TaskSerializer, ClientSerializer, AttendanceRecordSerializer,
     WhatsAppTemplateSerializer, AutomationRuleSerializer, NotificationSerializer,
-    RegisterSerializer, DealSerializer, InvoiceSerializer, PaymentSerializer,
+    RegisterSerializer, DealSerializer, StageTransitionSerializer, InvoiceSerializer, PaymentSerializer,
     PaymentPlanSerializer, InstallmentSerializer, QuoteSerializer,
-    CommissionSerializer, CommissionSplitSerializer, CustomerPortalUserSerializer,
+    CommissionSerializer, CommissionSplitSerializer, CommissionRuleSerializer, CustomerPortalUserSerializer,
     DocumentSerializer, FileAccessLogSerializer, IntegrationConfigSerializer,
     InvoiceTemplateSerializer, QuoteTemplateSerializer, EmailTemplateSerializer,
     AgreementTemplateSerializer, WorkflowRuleSerializer, WorkflowActionSerializer,
-    CallLogSerializer, TelephonyConfigSerializer, ChatbotSerializer,
-    ChatbotConversationSerializer, ChatbotMessageSerializer, ChatbotQualificationRuleSerializer,
+    CallLogSerializer, TelephonyConfigSerializer, DialerCampaignSerializer, DialerCampaignEntrySerializer, ChatbotSerializer,
+    ChatbotConversationSerializer, ChatbotConversationListSerializer, ChatbotMessageSerializer, ChatbotQualificationRuleSerializer,
     ProjectSerializer, TowerSerializer, FloorSerializer, UnitSerializer,
     BookingPaymentSerializer, ReceiptSerializer, GSTConfigurationSerializer, TaxBreakdownSerializer,
-    PaymentScheduleSerializer, PaymentMilestoneSerializer, LedgerSerializer,
+    PaymentScheduleSerializer, PaymentMilestoneSerializer, LedgerSerializer, StatementEntrySerializer,
     RefundSerializer, CreditNoteSerializer, BankReconciliationSerializer
 )
 from .permissions import IsOwnerOrAdminOrReadOnly, IsAdminOrManager, IsAdminOnly
 
 
-class LeadViewSet(viewsets.ModelViewSet):
+class StageHistoryMixin:
+    """
+    Stage history, bulk stage changes and funnel analytics for the Deal and Lead viewsets
+    
+    Subclasses set entity_type and stage_field.
+    """
+    entity_type = None
+    stage_field = None
+    
+    def perform_update(self, serializer):
+        """Record who made the stage change"""
+        serializer.instance._stage_changed_by = self.request.user
+        serializer.save()
+    
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        """Stage transitions of this record, oldest first"""
+        instance = self.get_object()
+        transitions = StageTransition.objects.filter(
+            entity_type=self.entity_type, entity_id=instance.pk
+        ).select_related('changed_by')
+        return Response(StageTransitionSerializer(transitions, many=True).data)
+    
+    @action(detail=False, methods=['post'])
+    def bulk_stage(self, request):
+        """
+        Move several records to a stage
+        
+        Body: ids (list), stage
+        """
+        from .services.pipeline_service import bulk_update_stage
+        
+        ids = request.data.get('ids')
+        stage = request.data.get('stage')
+        choices = self.get_queryset().model._meta.get_field(self.stage_field).choices
+        if not isinstance(ids, list) or not ids:
+            return Response({'error': 'ids must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if stage not in dict(choices):
+            return Response({'error': f'Invalid stage: {stage}'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        updated = bulk_update_stage(self.get_queryset().filter(pk__in=ids), stage, changed_by=request.user)
+        return Response({'updated': updated})
+    
+    @action(detail=False, methods=['get'])
+    def funnel(self, request):
+        """
+        Funnel conversion rates and median days per stage
+        
+        Query params: start_date, end_date (YYYY-MM-DD) select records that
+        entered the pipeline within the dates.
+        """
+        from .services.pipeline_service import get_pipeline_analytics
+        
+        try:
+            start_date = datetime.strptime(request.query_params['start_date'], '%Y-%m-%d').date() if request.query_params.get('start_date') else None
+            end_date = datetime.strptime(request.query_params['end_date'], '%Y-%m-%d').date() if request.query_params.get('end_date') else None
+        except ValueError:
+            return Response({'error': 'Dates must be in YYYY-MM-DD format'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(get_pipeline_analytics(
+            self.entity_type,
+            entity_ids=self.get_queryset().order_by().values('id'),
+            start_date=start_date,
+            end_date=end_date,
+        ))
+
+
+class LeadViewSet(StageHistoryMixin, viewsets.ModelViewSet):
     """
     ViewSet for Lead model with role-based filtering
     """
     serializer_class = LeadSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrAdminOrReadOnly]
+    entity_type = StageTransition.EntityType.LEAD
+    stage_field = 'status'
     
     def get_queryset(self):
         """
@@ -424,10 +498,12 @@ class RegisterView(APIView):
 
 # ==================== DEAL VIEWSETS ====================
 
-class DealViewSet(viewsets.ModelViewSet):
+class DealViewSet(StageHistoryMixin, viewsets.ModelViewSet):
     """ViewSet for Deal model"""
     serializer_class = DealSerializer
     permission_classes = [permissions.IsAuthenticated]
+    entity_type = StageTransition.EntityType.DEAL
+    stage_field = 'stage'
     
     def get_queryset(self):
         """Filter deals based on user role"""
@@ -475,6 +551,44 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         
         return queryset.filter(deal__agent=user)
     
+    @action(detail=False, methods=['get'])
+    def aging(self, request):
+        """
+        Accounts-receivable aging report (current, 0-30, 31-60, 61-90, 90+ days past due)
+        
+        Query params: group_by (project, tower, client, agent), as_of (YYYY-MM-DD),
+        refresh (true to bypass the daily cache)
+        """
+        from .services.receivables_service import get_aging_report, AGING_DIMENSIONS
+        
+        group_by = request.query_params.get('group_by', 'project')
+        if group_by not in AGING_DIMENSIONS:
+            return Response(
+                {'error': f"group_by must be one of: {', '.join(AGING_DIMENSIONS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        as_of = None
+        if request.query_params.get('as_of'):
+            try:
+                as_of = datetime.strptime(request.query_params['as_of'], '%Y-%m-%d').date()
+            except ValueError:
+                return Response({'error': 'as_of must be in YYYY-MM-DD format'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        user = request.user
+        if user.is_staff or user.role in [Agent.Role.ADMIN, Agent.Role.SALES_MANAGER]:
+            queryset, scope = None, 'all'
+        else:
+            queryset, scope = Invoice.objects.filter(deal__agent=user), f'agent:{user.pk}'
+        
+        report = get_aging_report(
+            group_by=group_by,
+            as_of=as_of,
+            queryset=queryset,
+            scope=scope,
+            refresh=request.query_params.get('refresh') == 'true'
+        )
+        return Response(report)
+    
     @action(detail=True, methods=['post'])
     def generate_pdf(self, request, pk=None):
         """Generate PDF for invoice"""
@@ -506,8 +620,12 @@ class PaymentViewSet(viewsets.ModelViewSet):
         return queryset.filter(invoice__deal__agent=user)
     
     def perform_create(self, serializer):
-        """Set created_by to current user"""
-        serializer.save(created_by=self.request.user)
+        """Set created_by to current user and post the payment to the ledgers"""
+        from .services.ledger_service import post_payment
+        
+        with transaction.atomic():
+            payment = serializer.save(created_by=self.request.user)
+            post_payment(payment)
 
 
 class InstallmentViewSet(viewsets.ModelViewSet):
@@ -543,6 +661,23 @@ class QuoteViewSet(viewsets.ModelViewSet):
         
         return queryset.filter(lead__agent=user)
     
+    @action(detail=True, methods=['get'])
+    def versions(self, request, pk=None):
+        """
+        All versions of this quote's family, oldest first
+        
+        The family is selected through the stored root id, so any number of
+        revisions loads with one query plus one for their documents.
+        """
+        quote = self.get_object()
+        root_id = quote.root_quote_id or quote.pk
+        quotes = self.get_queryset().filter(
+            Q(pk=root_id) | Q(root_quote_id=root_id)
+        ).prefetch_related(None).prefetch_related(
+            Prefetch('documents', queryset=Document.objects.only('id', 'quote_id', 'name', 'type', 'file_url'))
+        ).order_by('version', 'created_at')
+        return Response(self.get_serializer(quotes, many=True).data)
+    
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
         """Approve quote (client or manager)"""
@@ -627,25 +762,35 @@ class CommissionViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def summary(self, request):
         """Get commission summary"""
-        from django.db.models import Sum
-        user = request.user
+        from .services.commission_service import summarize_commissions
+        
+        return Response(summarize_commissions(self.get_queryset()))
+    
+    @action(detail=False, methods=['get'])
+    def analytics(self, request):
+        """
+        Commission totals by status, agent (leaderboard), team and month
+        
+        Query params: start_month and end_month (YYYY-MM), agent
+        """
+        from .services.commission_service import get_commission_analytics
         
-        queryset = self.get_queryset()
+        user = request.user
+        rollups = CommissionMonthlyRollup.objects.all()
         if not (user.is_staff or user.role in [Agent.Role.ADMIN, Agent.Role.SALES_MANAGER]):
-            queryset = queryset.filter(agent=user)
-        
-        summary = {
-            'total_earned': queryset.filter(status=Commission.Status.PAID).aggregate(
-                total=Sum('calculated_amount')
-            )['total'] or 0,
-            'pending': queryset.filter(status=Commission.Status.PENDING).aggregate(
-                total=Sum('calculated_amount')
-            )['total'] or 0,
-            'approved': queryset.filter(status=Commission.Status.APPROVED).aggregate(
-                total=Sum('calculated_amount')
-            )['total'] or 0,
-        }
-        return Response(summary)
+            rollups = rollups.filter(agent=user)
+        elif request.query_params.get('agent'):
+            rollups = rollups.filter(agent_id=request.query_params['agent'])
+        
+        try:
+            if request.query_params.get('start_month'):
+                rollups = rollups.filter(month__gte=datetime.strptime(request.query_params['start_month'], '%Y-%m').date())
+            if request.query_params.get('end_month'):
+                rollups = rollups.filter(month__lte=datetime.strptime(request.query_params['end_month'], '%Y-%m').date())
+        except ValueError:
+            return Response({'error': 'Months must be in YYYY-MM format'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(get_commission_analytics(rollups))
 
 
 class CommissionSplitViewSet(viewsets.ModelViewSet):
@@ -664,6 +809,39 @@ class CommissionSplitViewSet(viewsets.ModelViewSet):
         return queryset.filter(agent=user)
 
 
+class CommissionRuleViewSet(viewsets.ModelViewSet):
+    """ViewSet for CommissionRule model"""
+    serializer_class = CommissionRuleSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAdminOrManager]
+    filterset_fields = ['agent_role', 'project', 'commission_type', 'is_active']
+    
+    def get_queryset(self):
+        return CommissionRule.objects.select_related('project').all()
+    
+    @action(detail=False, methods=['post'])
+    def run(self, request):
+        """
+        Compute commissions for closed deals with the active rules
+        
+        Optional body params: start_date, end_date (YYYY-MM-DD), recalculate
+        """
+        from .services.commission_service import compute_commissions
+        
+        try:
+            start_date = datetime.strptime(request.data['start_date'], '%Y-%m-%d').date() if request.data.get('start_date') else None
+            end_date = datetime.strptime(request.data['end_date'], '%Y-%m-%d').date() if request.data.get('end_date') else None
+        except ValueError:
+            return Response({'error': 'Dates must be in YYYY-MM-DD format'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        stats = compute_commissions(
+            start_date=start_date,
+            end_date=end_date,
+            recalculate=str(request.data.get('recalculate', '')).lower() in ('1', 'true')
+        )
+        stats.pop('commissions')
+        return Response(stats)
+
+
 # ==================== CUSTOMER PORTAL VIEWSETS ====================
 
 class CustomerPortalUserViewSet(viewsets.ModelViewSet):
@@ -715,6 +893,13 @@ class IntegrationConfigViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Only admins can manage integrations"""
         return IntegrationConfig.objects.all()
+    
+    @action(detail=False, methods=['get'])
+    def http_metrics(self, request):
+        """Request counts, circuit state and latency of provider HTTP clients in this worker"""
+        from .services.http_client import get_http_metrics
+        
+        return Response(get_http_metrics())
 
 
 # ==================== TEMPLATE VIEWSETS ====================
@@ -819,6 +1004,34 @@ class CallLogViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=False, methods=['get'])
+    def analytics(self, request):
+        """
+        Calls made, connected, talk and ring time per agent, lead source and day
+        
+        Query params: start_date and end_date (YYYY-MM-DD), agent, lead_source
+        """
+        from .services.call_stats_service import get_call_analytics
+        
+        user = request.user
+        stats = CallDailyStat.objects.all()
+        if not (user.is_staff or user.role in [Agent.Role.ADMIN, Agent.Role.SALES_MANAGER]):
+            stats = stats.filter(agent=user)
+        elif request.query_params.get('agent'):
+            stats = stats.filter(agent_id=request.query_params['agent'])
+        if 'lead_source' in request.query_params:
+            stats = stats.filter(lead_source=request.query_params['lead_source'])
+        
+        try:
+            if request.query_params.get('start_date'):
+                stats = stats.filter(date__gte=datetime.strptime(request.query_params['start_date'], '%Y-%m-%d').date())
+            if request.query_params.get('end_date'):
+                stats = stats.filter(date__lte=datetime.strptime(request.query_params['end_date'], '%Y-%m-%d').date())
+        except ValueError:
+            return Response({'error': 'Dates must be in YYYY-MM-DD format'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(get_call_analytics(stats))
 
 
 class TelephonyConfigViewSet(viewsets.ModelViewSet):
@@ -831,6 +1044,62 @@ class TelephonyConfigViewSet(viewsets.ModelViewSet):
         return TelephonyConfig.objects.all()
 
 
+class DialerCampaignViewSet(viewsets.ModelViewSet):
+    """ViewSet for DialerCampaign model"""
+    serializer_class = DialerCampaignSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAdminOrManager]
+    filterset_fields = ['status']
+    
+    def get_queryset(self):
+        return DialerCampaign.objects.select_related('created_by').prefetch_related('agents').all()
+    
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user)
+    
+    @action(detail=True, methods=['post'])
+    def start(self, request, pk=None):
+        """Add the matching leads and start (or resume) dialing"""
+        from .services.dialer_service import start_campaign
+        
+        campaign = self.get_object()
+        if campaign.status == DialerCampaign.Status.RUNNING:
+            return Response({'error': 'Campaign is already running'}, status=status.HTTP_400_BAD_REQUEST)
+        added = start_campaign(campaign)
+        return Response({'status': campaign.status, 'added': added})
+    
+    @action(detail=True, methods=['post'])
+    def pause(self, request, pk=None):
+        """Stop placing new calls; calls in progress finish normally"""
+        campaign = self.get_object()
+        if campaign.status != DialerCampaign.Status.RUNNING:
+            return Response({'error': 'Only running campaigns can be paused'}, status=status.HTTP_400_BAD_REQUEST)
+        campaign.status = DialerCampaign.Status.PAUSED
+        campaign.save(update_fields=['status', 'updated_at'])
+        return Response({'status': campaign.status})
+    
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """Entry counts per status, answer rate and current dial ratio"""
+        from .services.dialer_service import get_campaign_stats
+        
+        return Response(get_campaign_stats(self.get_object()))
+    
+    @action(detail=True, methods=['get'])
+    def entries(self, request, pk=None):
+        """
+        Leads in the campaign and their call outcomes
+        
+        Query params: status
+        """
+        entries = DialerCampaignEntry.objects.filter(campaign=self.get_object()).select_related('lead', 'agent').order_by('id')
+        if request.query_params.get('status'):
+            entries = entries.filter(status=request.query_params['status'])
+        page = self.paginate_queryset(entries)
+        if page is not None:
+            return self.get_paginated_response(DialerCampaignEntrySerializer(page, many=True).data)
+        return Response(DialerCampaignEntrySerializer(entries, many=True).data)
+
+
 # ==================== CHATBOT VIEWSETS ====================
 
 class ChatbotViewSet(viewsets.ModelViewSet):
@@ -840,7 +1109,9 @@ class ChatbotViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """All authenticated users can view chatbots"""
-        return Chatbot.objects.prefetch_related('qualification_rules', 'conversations').all()
+        from .services.chatbot_service import annotate_conversation_counters
+        
+        return annotate_conversation_counters(Chatbot.objects.prefetch_related('qualification_rules'))
     
     @action(detail=True, methods=['get'])
     def widget_code(self, request, pk=None):
@@ -863,17 +1134,51 @@ class ChatbotViewSet(viewsets.ModelViewSet):
         return Response({'widget_code': widget_code})
 
 
+# Characters of the last message shown in conversation lists
+MESSAGE_PREVIEW_LENGTH = 120
+
+
+class ChatbotMessageCursorPagination(CursorPagination):
+    """Keyset pagination over a conversation's messages in (timestamp, id) order"""
+    ordering = ('timestamp', 'id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    
+    def get_ordering(self, request, queryset, view):
+        # The stream order is fixed; ordering query params do not apply
+        return self.ordering
+
+
 class ChatbotConversationViewSet(viewsets.ModelViewSet):
     """ViewSet for ChatbotConversation model"""
     serializer_class = ChatbotConversationSerializer
     permission_classes = [permissions.IsAuthenticated]
     
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ChatbotConversationListSerializer
+        return ChatbotConversationSerializer
+    
     def get_queryset(self):
         """Filter conversations based on user role"""
         user = self.request.user
-        queryset = ChatbotConversation.objects.select_related(
-            'chatbot', 'lead', 'assigned_agent'
-        ).prefetch_related('messages').all()
+        queryset = ChatbotConversation.objects.select_related('chatbot', 'lead', 'assigned_agent')
+        if self.action == 'list':
+            # Counts and previews come from correlated subqueries on the (conversation, timestamp) index
+            messages = ChatbotMessage.objects.filter(conversation=OuterRef('pk'))
+            last_message = messages.order_by('-timestamp', '-id')
+            queryset = queryset.annotate(
+                messages_total=Coalesce(Subquery(
+                    messages.order_by().values('conversation').annotate(total=Count('id')).values('total')
+                ), 0) + F('archived_message_count'),
+                last_message_preview=Subquery(
+                    last_message.annotate(preview=Substr('content', 1, MESSAGE_PREVIEW_LENGTH)).values('preview')[:1]
+                ),
+                last_message_type=Subquery(last_message.values('message_type')[:1]),
+            )
+        elif self.action != 'messages':
+            queryset = queryset.prefetch_related('messages')
         
         if user.is_staff or user.role in [Agent.Role.ADMIN, Agent.Role.SALES_MANAGER]:
             return queryset
@@ -904,26 +1209,71 @@ class ChatbotConversationViewSet(viewsets.ModelViewSet):
             'bot_response': ChatbotMessageSerializer(bot_response).data,
             'conversation': self.get_serializer(conversation).data
         })
+    
+    @action(detail=True, methods=['get'], pagination_class=ChatbotMessageCursorPagination)
+    def messages(self, request, pk=None):
+        """
+        Stream a conversation's messages oldest first, keyset-paginated
+        
+        Follow the `next` cursor to read forward and `previous` to read back;
+        page_size (max 200) sets the page length. Archived conversations are
+        rehydrated from cold storage and returned as a single page.
+        """
+        from .services.chat_archive_service import get_conversation_messages
+        
+        conversation = self.get_object()
+        if conversation.archived_at:
+            messages = get_conversation_messages(conversation)
+            return Response({'next': None, 'previous': None, 'results': ChatbotMessageSerializer(messages, many=True).data})
+        page = self.paginate_queryset(ChatbotMessage.objects.filter(conversation=conversation))
+        return self.get_paginated_response(ChatbotMessageSerializer(page, many=True).data)
 
 
 class ChatbotMessageViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for ChatbotMessage model (read-only)"""
     serializer_class = ChatbotMessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    ordering_fields = ['timestamp', 'id']
+    ordering = ['timestamp', 'id']
+    
+    def visible_conversations(self, prefix=''):
+        """Filter for the conversations whose messages the user may read"""
+        user = self.request.user
+        if user.is_staff or user.role in [Agent.Role.ADMIN, Agent.Role.SALES_MANAGER]:
+            return Q()
+        return Q(**{f'{prefix}assigned_agent': user})
     
     def get_queryset(self):
         """Filter messages based on user role"""
-        user = self.request.user
-        queryset = ChatbotMessage.objects.select_related('conversation').all()
+        queryset = ChatbotMessage.objects.select_related('conversation').filter(
+            self.visible_conversations('conversation__')
+        )
         
         conversation_id = self.request.query_params.get('conversation_id')
         if conversation_id:
             queryset = queryset.filter(conversation_id=conversation_id)
+        return queryset
+    
+    def list(self, request, *args, **kwargs):
+        """List messages; an archived conversation's transcript is rehydrated from cold storage"""
+        from .services.chat_archive_service import load_archived_messages
         
-        if user.is_staff or user.role in [Agent.Role.ADMIN, Agent.Role.SALES_MANAGER]:
-            return queryset
+        conversation_id = request.query_params.get('conversation_id')
+        conversation = None
+        if conversation_id and conversation_id.isdigit():
+            conversation = ChatbotConversation.objects.filter(
+                self.visible_conversations(), pk=conversation_id, archived_at__isnull=False
+            ).first()
+        if conversation is None:
+            return super().list(request, *args, **kwargs)
         
-        return queryset.filter(conversation__assigned_agent=user)
+        queryset = self.filter_queryset(self.get_queryset())
+        messages = load_archived_messages(conversation) + list(queryset)
+        # Order the merged transcript the way the ordering filter ordered the hot messages
+        for field in reversed(queryset.query.order_by):
+            messages.sort(key=attrgetter(field.lstrip('-')), reverse=field.startswith('-'))
+        page = self.paginate_queryset(messages)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
 
 
 class ChatbotQualificationRuleViewSet(viewsets.ModelViewSet):
@@ -946,14 +1296,18 @@ class ChatbotQualificationRuleViewSet(viewsets.ModelViewSet):
 @api_view(['POST'])
 @permission_classes([])  # No authentication required for webhooks
 def twilio_status_webhook(request):
-    """Handle Twilio status callback webhook"""
-    from .services.telephony_service import process_twilio_status_webhook
+    """
+    Handle Twilio status callback webhook
+    
+    Only stores the callback in the inbox; the process_telephony_events worker
+    applies it to the call log.
+    """
+    from .services.telephony_service import record_telephony_event
+    from .models import TelephonyWebhookEvent
     
     try:
-        call_log = process_twilio_status_webhook(request.POST.dict())
-        if call_log:
-            return HttpResponse('OK', status=200)
-        return HttpResponse('Not Found', status=404)
+        record_telephony_event(TelephonyWebhookEvent.EventType.STATUS, request.POST.dict())
+        return HttpResponse('OK', status=200)
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
@@ -965,14 +1319,13 @@ def twilio_status_webhook(request):
 @api_view(['POST'])
 @permission_classes([])
 def twilio_recording_webhook(request):
-    """Handle Twilio recording callback webhook"""
-    from .services.telephony_service import process_twilio_recording_webhook
+    """Handle Twilio recording callback webhook (stored in the inbox, see twilio_status_webhook)"""
+    from .services.telephony_service import record_telephony_event
+    from .models import TelephonyWebhookEvent
     
     try:
-        call_log = process_twilio_recording_webhook(request.POST.dict())
-        if call_log:
-            return HttpResponse('OK', status=200)
-        return HttpResponse('Not Found', status=404)
+        record_telephony_event(TelephonyWebhookEvent.EventType.RECORDING, request.POST.dict())
+        return HttpResponse('OK', status=200)
     except Exception as e:
         import logging
         logger = logging.getLogger(__name__)
@@ -980,6 +1333,42 @@ def twilio_recording_webhook(request):
         return HttpResponse('Error', status=500)
 
 
+@csrf_exempt
+@api_view(['POST'])
+@permission_classes([])
+def payment_gateway_webhook(request, provider):
+    """
+    Handle payment gateway webhook (Razorpay, Stripe)
+    
+    Only stores the raw event in the inbox and acknowledges it; signature
+    verification, deduplication and payment posting happen in the
+    process_gateway_events worker.
+    """
+    from .services.payment_service import normalize_gateway_provider, record_gateway_event
+    from .models import PaymentGatewayEvent
+    
+    try:
+        gateway = normalize_gateway_provider(provider)
+    except ValueError:
+        return HttpResponse('Not Found', status=404)
+    
+    if gateway == PaymentGatewayEvent.Provider.RAZORPAY:
+        signature = request.META.get('HTTP_X_RAZORPAY_SIGNATURE')
+        event_id = request.META.get('HTTP_X_RAZORPAY_EVENT_ID')
+    else:
+        signature = request.META.get('HTTP_STRIPE_SIGNATURE')
+        event_id = None
+    
+    try:
+        record_gateway_event(gateway, request.body, signature=signature, event_id=event_id)
+        return HttpResponse('OK', status=200)
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Payment gateway webhook error: {e}", exc_info=True)
+        return HttpResponse('Error', status=500)
+
+
 @csrf_exempt
 @api_view(['POST'])
 @permission_classes([])
@@ -1111,20 +1500,29 @@ class BookingPaymentViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
         """Approve booking payment"""
+        from .services.ledger_service import post_booking_payment
+        
         booking = self.get_object()
-        booking.status = BookingPayment.Status.RECEIVED
-        booking.approved_by = request.user
-        booking.save()
+        with transaction.atomic():
+            booking.status = BookingPayment.Status.RECEIVED
+            booking.approved_by = request.user
+            booking.save()
+            post_booking_payment(booking)
         return Response({'status': 'approved'})
     
     @action(detail=True, methods=['post'])
     def clear_cheque(self, request, pk=None):
         """Mark cheque as cleared"""
+        from .services.ledger_service import post_booking_payment
+        
         booking = self.get_object()
         booking.cheque_cleared = True
         booking.cheque_cleared_date = timezone.now().date()
         booking.status = BookingPayment.Status.CLEARED
-        booking.save()
+        with transaction.atomic():
+            booking.save()
+            # No-op when the booking was already posted on approval
+            post_booking_payment(booking)
         return Response({'status': 'cheque_cleared'})
     
     @action(detail=True, methods=['post'])
@@ -1226,28 +1624,117 @@ class LedgerViewSet(viewsets.ReadOnlyModelViewSet):
     
     @action(detail=False, methods=['get'])
     def statement(self, request):
-        """Get statement of account"""
-        ledger_type = request.query_params.get('type', 'Customer')
-        customer_id = request.query_params.get('customer')
-        unit_id = request.query_params.get('unit')
-        project_id = request.query_params.get('project')
-        
-        queryset = self.get_queryset().filter(ledger_type=ledger_type)
-        if customer_id:
-            queryset = queryset.filter(customer_id=customer_id)
-        if unit_id:
-            queryset = queryset.filter(unit_id=unit_id)
-        if project_id:
-            queryset = queryset.filter(project_id=project_id)
-        
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        """
+        Get paginated statement of account with running balances
+        
+        Query params: type (Customer, Unit, Project), customer/unit/project id,
+        optional start_date and end_date (YYYY-MM-DD, inclusive)
+        """
+        from .services.ledger_service import get_statement
+        
+        account, start, end, error = self._get_statement_params(request)
+        if error:
+            return error
+        
+        opening_balance, queryset = get_statement(account, start=start, end=end)
+        queryset = queryset.select_related('customer', 'unit', 'project')
+        
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            response = self.get_paginated_response(StatementEntrySerializer(page, many=True).data)
+        else:
+            response = Response({'results': StatementEntrySerializer(queryset, many=True).data})
+        response.data['account'] = account.account_key
+        response.data['opening_balance'] = opening_balance
+        return response
     
     @action(detail=False, methods=['get'])
     def export(self, request):
-        """Export ledger to Excel/PDF"""
-        # TODO: Implement export functionality
-        return Response({'message': 'Export functionality will be implemented'})
+        """
+        Stream statement of account as CSV or XLSX
+        
+        Takes the same query params as statement, plus export_format (csv or xlsx).
+        """
+        from .services.ledger_service import get_statement
+        from .services.export_service import EXPORT_CHUNK_SIZE, csv_response, xlsx_response
+        
+        export_format = request.query_params.get('export_format', 'csv').lower()
+        if export_format not in ('csv', 'xlsx'):
+            return Response({'error': 'export_format must be csv or xlsx'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        account, start, end, error = self._get_statement_params(request)
+        if error:
+            return error
+        
+        opening_balance, queryset = get_statement(account, start=start, end=end)
+        header = ['Date', 'Type', 'Reference', 'Description', 'Debit', 'Credit', 'Balance']
+        rows = queryset.values_list(
+            'transaction_date', 'transaction_type', 'reference_number', 'description',
+            'debit', 'credit', 'running_balance'
+        ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        
+        def statement_rows():
+            yield [start, 'Opening Balance', '', '', '', '', opening_balance]
+            yield from rows
+        
+        filename = f"ledger-{account.account_key.replace(':', '-')}.{export_format}"
+        if export_format == 'csv':
+            return csv_response(filename, header, statement_rows())
+        
+        try:
+            return xlsx_response(filename, header, statement_rows(), sheet_title='Statement')
+        except ImportError:
+            return Response(
+                {'error': 'XLSX export requires openpyxl. Please install it with: pip install openpyxl'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    
+    def _get_statement_params(self, request):
+        """
+        Resolve the ledger account and date range of a statement request
+        
+        Returns:
+            Tuple of (account, start, end, error response or None)
+        """
+        from .services.ledger_service import get_account_key
+        
+        ledger_type = request.query_params.get('type', Ledger.LedgerType.CUSTOMER)
+        id_params = {
+            Ledger.LedgerType.CUSTOMER: 'customer',
+            Ledger.LedgerType.UNIT: 'unit',
+            Ledger.LedgerType.PROJECT: 'project',
+        }
+        if ledger_type not in id_params:
+            error = Response({'error': f'Invalid ledger type: {ledger_type}'}, status=status.HTTP_400_BAD_REQUEST)
+            return None, None, None, error
+        object_id = request.query_params.get(id_params[ledger_type])
+        if not object_id:
+            error = Response({'error': f'{id_params[ledger_type]} is required'}, status=status.HTTP_400_BAD_REQUEST)
+            return None, None, None, error
+        
+        try:
+            start = self._parse_statement_date(request.query_params.get('start_date'))
+            end = self._parse_statement_date(request.query_params.get('end_date'), next_day=True)
+        except ValueError:
+            error = Response({'error': 'Dates must be in YYYY-MM-DD format'}, status=status.HTTP_400_BAD_REQUEST)
+            return None, None, None, error
+        
+        account = LedgerAccount.objects.filter(account_key=get_account_key(ledger_type, object_id)).first()
+        if not account:
+            error = Response({'error': 'Ledger account not found'}, status=status.HTTP_404_NOT_FOUND)
+            return None, None, None, error
+        
+        return account, start, end, None
+    
+    @staticmethod
+    def _parse_statement_date(value, next_day=False):
+        """Parse a YYYY-MM-DD query param into the aware start of that day (or the next day)"""
+        if not value:
+            return None
+        day = datetime.strptime(value, '%Y-%m-%d')
+        if next_day:
+            day += timedelta(days=1)
+        return timezone.make_aware(day)
 
 
 # ==================== REFUND VIEWSETS ====================
@@ -1280,14 +1767,18 @@ class RefundViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def process(self, request, pk=None):
         """Process approved refund"""
+        from .services.ledger_service import post_refund
+        
         refund = self.get_object()
         if refund.status != Refund.Status.APPROVED:
             return Response({'error': 'Refund must be approved first'}, status=status.HTTP_400_BAD_REQUEST)
         
-        refund.status = Refund.Status.PROCESSED
-        refund.processed_at = timezone.now()
-        refund.save()
-        # TODO: Create ledger entry and receipt
+        with transaction.atomic():
+            refund.status = Refund.Status.PROCESSED
+            refund.processed_at = timezone.now()
+            refund.save()
+            post_refund(refund)
+        # TODO: Create receipt
         return Response({'status': 'processed'})
 
 
@@ -1299,6 +1790,14 @@ class CreditNoteViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         return CreditNote.objects.select_related('deal', 'applied_to_invoice').all()
+    
+    def perform_create(self, serializer):
+        """Post the credit note to the ledgers"""
+        from .services.ledger_service import post_credit_note
+        
+        with transaction.atomic():
+            credit_note = serializer.save()
+            post_credit_note(credit_note)
 
 
 # ==================== BANK RECONCILIATION VIEWSETS ====================
@@ -1316,9 +1815,69 @@ class BankReconciliationViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['post'])
     def auto_match(self, request):
-        """Auto-match bank transactions with payments"""
-        # TODO: Implement auto-matching logic based on reference numbers/UTRs
-        return Response({'message': 'Auto-matching will be implemented'})
+        """
+        Auto-match unreconciled bank credit lines with payments and booking payments
+        
+        Optional body params: bank_name, account_number, start_date, end_date,
+        date_window_days, amount_tolerance
+        """
+        from decimal import Decimal, InvalidOperation
+        from .services.reconciliation_service import (
+            auto_match, DEFAULT_DATE_WINDOW_DAYS, DEFAULT_AMOUNT_TOLERANCE
+        )
+        
+        lines = BankReconciliation.objects.all()
+        for param in ('bank_name', 'account_number'):
+            if request.data.get(param):
+                lines = lines.filter(**{param: request.data[param]})
+        
+        try:
+            if request.data.get('start_date'):
+                lines = lines.filter(transaction_date__gte=datetime.strptime(request.data['start_date'], '%Y-%m-%d').date())
+            if request.data.get('end_date'):
+                lines = lines.filter(transaction_date__lte=datetime.strptime(request.data['end_date'], '%Y-%m-%d').date())
+            date_window_days = int(request.data.get('date_window_days', DEFAULT_DATE_WINDOW_DAYS))
+            amount_tolerance = Decimal(str(request.data.get('amount_tolerance', DEFAULT_AMOUNT_TOLERANCE)))
+        except (ValueError, InvalidOperation):
+            return Response({'error': 'Invalid date, window or tolerance'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        stats = auto_match(
+            lines,
+            date_window_days=date_window_days,
+            amount_tolerance=amount_tolerance,
+            reconciled_by=request.user
+        )
+        return Response(stats)
+    
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_statement(self, request):
+        """
+        Import a CSV or MT940 bank statement
+        
+        Multipart params: file, bank_name, account_number, optional statement_format
+        (csv or mt940, detected from the file extension when omitted)
+        """
+        from .services.bank_statement_service import import_statement, StatementParseError
+        
+        uploaded_file = request.FILES.get('file')
+        bank_name = request.data.get('bank_name')
+        account_number = request.data.get('account_number')
+        if not uploaded_file or not bank_name or not account_number:
+            return Response(
+                {'error': 'file, bank_name and account_number are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        statement_format = request.data.get('statement_format')
+        if not statement_format:
+            is_mt940 = uploaded_file.name.lower().endswith(('.sta', '.mt940', '.940'))
+            statement_format = 'mt940' if is_mt940 else 'csv'
+        
+        try:
+            stats = import_statement(uploaded_file, statement_format.lower(), bank_name, account_number)
+        except StatementParseError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(stats, status=status.HTTP_201_CREATED if stats['created'] else status.HTTP_200_OK)
     
     @action(detail=True, methods=['post'])
     def match_payment(self, request, pk=None):
@@ -8,6 +8,14 @@ from api.models import Lead, Property, Client, Deal, BookingPayment
 User = get_user_model()
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Keep cached state (e.g. the GST rate index version) from leaking between tests"""
+    from django.core.cache import cache
+    cache.clear()
+    yield
+
+
 @pytest.fixture
 def admin_user(db):
     """Create an admin user for testing"""
@@ -106,3 +114,50 @@ def authenticated_client(agent_user):
     client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
     return client
 
+
+
+@pytest.fixture
+def sales_deal(db, test_lead, test_client, test_property, agent_user):
+    """Create a deal linked to a lead, client and property"""
+    return Deal.objects.create(
+        lead=test_lead,
+        property=test_property,
+        client=test_client,
+        agent=agent_user,
+        deal_value=5000000.00,
+        stage=Deal.Stage.BOOKING_DONE
+    )
+
+
+@pytest.fixture
+def test_invoice(db, sales_deal, test_client):
+    """Create an invoice for the sales deal"""
+    from datetime import date, timedelta
+    from api.models import Invoice
+    return Invoice.objects.create(
+        invoice_number='INV-TEST-0001',
+        deal=sales_deal,
+        client=test_client,
+        amount=100000.00,
+        total_amount=100000.00,
+        due_date=date.today() + timedelta(days=30),
+        status=Invoice.Status.UNPAID
+    )
+
+
+@pytest.fixture
+def test_unit(db):
+    """Create a unit inside a project tower"""
+    from api.models import Project, Tower, Floor, Unit
+    project = Project.objects.create(
+        name='Test Residency',
+        code='TR-01',
+        location='Sector 1',
+        city='Mumbai',
+        state='Maharashtra',
+        builder_name='Test Builders',
+        builder_address='1 Test Road, Mumbai'
+    )
+    tower = Tower.objects.create(project=project, name='Tower A', code='A', total_floors=10)
+    floor = Floor.objects.create(tower=tower, floor_number=1)
+    return Unit.objects.create(floor=floor, unit_number='A-101', unit_type='2BHK', base_price=5000000.00)
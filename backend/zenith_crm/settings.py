@@ -113,6 +113,51 @@ else:
     }
 
 
+# Cache
+# Redis when REDIS_URL is set (shared across workers), otherwise per-process memory
+REDIS_URL = config('REDIS_URL', default=None)
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
+# Seconds a process keeps its in-memory copy of versioned indexes (provider configs, GST rates,
+# agent roster, chatbot flows); bounds staleness in other processes when the cache is not shared
+PROCESS_CACHE_MAX_AGE = config('PROCESS_CACHE_MAX_AGE', default=60, cast=int)
+
+
+# Agent assignment for calls, chats and leads: 'least_busy' or 'round_robin'
+ASSIGNMENT_STRATEGY = config('ASSIGNMENT_STRATEGY', default='least_busy')
+# Keep per-agent load counters in the cache; needs a cache shared by all workers (REDIS_URL),
+# otherwise each assignment counts loads from the database
+ASSIGNMENT_LOAD_INDEX = config('ASSIGNMENT_LOAD_INDEX', default=bool(REDIS_URL), cast=bool)
+
+
+# Call transcription engine (dotted path to a TranscriptionBackend) and recordings transcribed at once per worker
+TRANSCRIPTION_BACKEND = config('TRANSCRIPTION_BACKEND', default='api.services.transcription_service.LocalTranscriptionBackend')
+TRANSCRIPTION_CONCURRENCY = config('TRANSCRIPTION_CONCURRENCY', default=4, cast=int)
+
+
+# Ended chatbot conversations older than this many days have their messages moved to media storage
+CHATBOT_ARCHIVE_AFTER_DAYS = config('CHATBOT_ARCHIVE_AFTER_DAYS', default=90, cast=int)
+
+
+# Per-provider overrides of the outbound HTTP client defaults (see api/services/http_client.py),
+# e.g. {'exotel': {'read_timeout': 20, 'retries': 1}}
+PROVIDER_HTTP = {}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 